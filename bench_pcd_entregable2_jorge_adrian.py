@@ -0,0 +1,688 @@
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import socket
+import subprocess
+import multiprocessing
+import threading
+import tracemalloc
+import tempfile
+
+from pcd_entregable2_jorge_adrian import *
+
+# ----------------------------
+# EXPLICACIONES DEL PROGRAMA
+# ----------------------------
+'''
+Benchmarks del SistemaIoT. Se ejecutan con:
+
+    python bench_pcd_entregable2_jorge_adrian.py [nombres de benchmarks] [--json RUTA] [--comparar RUTA]
+
+Sin nombres se ejecutan todos. Cada benchmark crea sus propios SistemaIoT
+directamente (sin obtener_instancia) para no depender de la instancia unica.
+
+Con --json se guardan los resultados (junto con el commit y la version de Python)
+en un fichero JSON, y con --comparar se comparan con los de otro fichero guardado
+antes (por ejemplo en otro commit), marcando las filas que han empeorado.
+'''
+# -----------------------
+# AUXILIARES
+# -----------------------
+# Manejador que no hace nada, para medir solo el coste del sistema
+class ManejadorNulo(Manejador):
+    def manejar_date_temp(self, date, temp):
+        pass
+
+# Manejador que solo pasa la lectura a su sucesor, para medir el coste de la instrumentacion
+class ManejadorPaso(Manejador):
+    def manejar_date_temp(self, date, temp):
+        if self.sucesor:
+            self.sucesor.manejar_date_temp(date, temp)
+
+# Genera n lecturas (timestamp, t, sensor) repartidas entre los sensores, una cada 5 segundos por sensor
+def generar_lecturas(n, sensores):
+    random.seed(0)
+    nombres = [f"sensor{i}" for i in range(sensores)]
+    inicio = fecha_a_segundos("2024-05-01 00:00:00")
+    return [(segundos_a_fecha(inicio + 5 * (i // sensores)), random.randint(8, 34), nombres[i % sensores]) for i in range(n)]
+
+# Memoria residente del proceso en bytes (solo Linux, en otros sistemas devuelve 0)
+def memoria_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for linea in f:
+                if linea.startswith('VmRSS:'):
+                    return int(linea.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+# Percentil p (0-100) de una lista de valores
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+# Observador que mide el jitter de cada sensor como la diferencia entre el tiempo entre dos lecturas y el periodo
+class ObservadorJitter(Observer):
+    def __init__(self, periodo):
+        self.periodo = periodo
+        self.ultima = {}
+        self.jitters = []
+
+    def update(self, date_temp):
+        ahora = time.monotonic()
+        anterior = self.ultima.get(date_temp[2])
+        if anterior is not None:
+            self.jitters.append(abs(ahora - anterior - self.periodo))
+        self.ultima[date_temp[2]] = ahora
+
+# Resultados de los benchmarks que se pueden guardar en JSON: cada fila tiene el benchmark, el componente medido,
+# los parametros (ventana, sensores) y las medidas (latencias en ns, lecturas/s)
+RESULTADOS = []
+
+def registrar_resultado(benchmark, componente, **campos):
+    RESULTADOS.append({'benchmark': benchmark, 'componente': componente, **campos})
+
+# Latencia en ns de cada llamada a funcion(i) para i en range(n), tras 'calentamiento' llamadas que no se miden
+def medir_latencias(funcion, n, calentamiento=100):
+    for i in range(calentamiento):
+        funcion(i)
+    reloj = time.perf_counter_ns
+    latencias = []
+    for i in range(calentamiento, calentamiento + n):
+        inicio = reloj()
+        funcion(i)
+        latencias.append(reloj() - inicio)
+    return latencias
+
+# Resumen de una lista de latencias en ns
+def resumen_latencias(latencias):
+    return {
+        'lecturas': len(latencias),
+        'media_ns': sum(latencias) / len(latencias),
+        'p50_ns': percentil(latencias, 50),
+        'p99_ns': percentil(latencias, 99),
+        'lecturas_s': len(latencias) * 1e9 / sum(latencias),
+    }
+
+# Commit actual del repositorio (o None si no se puede obtener)
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Compara los resultados actuales con los de un fichero JSON anterior (por benchmark, componente y parametros)
+# Se comparan la latencia (p50, o la media si no hay p50), las lecturas/s y la memoria (en bytes) que tengan las dos filas,
+# y se considera que una medida ha empeorado si es un 'tolerancia' peor
+def comparar_resultados(ruta, tolerancia=0.10):
+    with open(ruta) as f:
+        anterior = json.load(f)
+    clave = lambda fila: tuple(sorted((k, v) for k, v in fila.items() if k in ('benchmark', 'componente', 'ventana', 'sensores', 'lecturas')))
+    filas_anteriores = {clave(fila): fila for fila in anterior['resultados']}
+    print(f"comparacion con {anterior.get('commit')} ({ruta})")
+    for fila in RESULTADOS:
+        base = filas_anteriores.get(clave(fila))
+        if base is None:
+            continue
+        cambios = []
+        if 'p50_ns' in fila and 'p50_ns' in base:
+            cambios.append(('p50', fila['p50_ns'] / base['p50_ns'] - 1))
+        elif 'media_ns' in fila and 'media_ns' in base:
+            cambios.append(('media', fila['media_ns'] / base['media_ns'] - 1))
+        if 'lecturas_s' in fila and 'lecturas_s' in base:
+            cambios.append(('lecturas/s', base['lecturas_s'] / fila['lecturas_s'] - 1))
+        if 'memoria' in fila and 'memoria' in base:
+            cambios.append(('memoria', fila['memoria'] / base['memoria'] - 1))
+        parametros = ", ".join(f"{k}={v}" for k, v in clave(fila) if k not in ('benchmark', 'componente'))
+        for medida, cambio in cambios:
+            marca = "  << EMPEORA" if cambio > tolerancia else ""
+            print(f"{fila['benchmark']}\t{fila['componente']}\t{parametros}\t{medida}\t{cambio * 100:+.1f}%{marca}")
+
+# -----------------------
+# BENCHMARKS
+# -----------------------
+# Lecturas por segundo del SistemaIoT segun el numero de sensores (deberia mantenerse constante)
+def bench_sensores(lecturas=100_000):
+    print("sensores\tlecturas/s")
+    for sensores in (1, 10, 100, 1_000, 10_000):
+        datos = generar_lecturas(lecturas, sensores)
+        sistema = SistemaIoT(ManejadorNulo())
+        inicio = time.perf_counter()
+        for date_temp in datos:
+            sistema.update(date_temp)
+        segundos = time.perf_counter() - inicio
+        print(f"{sensores}\t\t{lecturas / segundos:,.0f}")
+        registrar_resultado('sensores', 'SistemaIoT.update', sensores=sensores, lecturas=lecturas, lecturas_s=lecturas / segundos)
+
+# Memoria y jitter de los ticks con un hilo por sensor (Sensor.run) frente al PlanificadorSensores con asyncio
+def bench_planificador(periodo=1.0, duracion=5.0):
+    print("sensores\tmodelo\t\tmemoria (MB)\tjitter p50 (ms)\tjitter p99 (ms)\tjitter max (ms)")
+    for n in (1_000, 10_000):
+        for modelo in ('hilos', 'asyncio'):
+            observador = ObservadorJitter(periodo)
+            sensores = [Sensor(f"sensor{i}", periodo) for i in range(n)]
+            for sensor in sensores:
+                sensor.register_observer(observador)
+                sensor.resume()
+            memoria_inicial = memoria_rss()
+            try:
+                if modelo == 'hilos':
+                    hilos = [threading.Thread(target=sensor.run) for sensor in sensores]
+                    for hilo in hilos:
+                        hilo.start()
+                else:
+                    planificador = PlanificadorSensores()
+                    for i, sensor in enumerate(sensores):
+                        planificador.registrar(sensor, desfase=periodo * i / n)     # Repartimos los sensores dentro del periodo
+                    hilos = [planificador.iniciar_en_hilo()]
+                time.sleep(duracion)
+                memoria = (memoria_rss() - memoria_inicial) / 2**20
+            except RuntimeError as e:                                               # Por ejemplo, no se pueden crear tantos hilos
+                print(f"{n}\t\t{modelo}\t\terror: {e}")
+                continue
+            finally:
+                for sensor in sensores:
+                    sensor.exit()
+            for hilo in hilos:
+                hilo.join()
+            jitters = observador.jitters
+            print(f"{n}\t\t{modelo}\t\t{memoria:.1f}\t\t{percentil(jitters, 50) * 1000:.2f}\t\t{percentil(jitters, 99) * 1000:.2f}\t\t{max(jitters, default=0) * 1000:.2f}")
+            registrar_resultado('planificador', modelo, sensores=n, memoria=memoria * 2**20, p50_ns=percentil(jitters, 50) * 1e9,
+                                p99_ns=percentil(jitters, 99) * 1e9)
+
+# Memoria del historial de un mes (una lectura cada 5 segundos) como lista de tuplas frente al HistorialColumnar
+def bench_historial(dias=30):
+    n = dias * 24 * 3600 // 5
+    inicio = fecha_a_segundos("2024-05-01 00:00:00")
+    random.seed(0)
+    temps = [random.randint(8, 34) for _ in range(n)]
+
+    tracemalloc.start()
+    lista = [(segundos_a_fecha(inicio + 5 * i), temps[i]) for i in range(n)]
+    memoria_lista = tracemalloc.get_traced_memory()[0]
+    del lista
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    historial = HistorialColumnar()
+    for i in range(n):
+        historial.append(inicio + 5 * i, temps[i])
+    memoria_columnar = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"lecturas: {n:,}")
+    print(f"lista de tuplas:\t{memoria_lista / 2**20:.1f} MB\t({memoria_lista / n:.0f} bytes/lectura)")
+    print(f"historial columnar:\t{memoria_columnar / 2**20:.1f} MB\t({memoria_columnar / n:.0f} bytes/lectura)")
+    print(f"reduccion:\t\t{memoria_lista / memoria_columnar:.1f}x")
+    registrar_resultado('historial', 'lista de tuplas', lecturas=n, memoria=memoria_lista)
+    registrar_resultado('historial', 'HistorialColumnar', lecturas=n, memoria=memoria_columnar)
+
+# Backfill de un dia de lecturas (una cada 5 segundos) de varios sensores lectura a lectura frente a update_batch
+def bench_lotes(sensores=20, dias=1):
+    if np is None:
+        print("update_batch necesita NumPy")
+        return
+    n = dias * 24 * 3600 // 5
+    inicio = fecha_a_segundos("2024-05-01 00:00:00")
+    random.seed(0)
+    fechas = [inicio + 5 * i for i in range(n)]
+    temps = {f"sensor{i}": [random.randint(8, 34) for _ in range(n)] for i in range(sensores)}
+
+    contexto = ContextoEstadisticos(Umbral(Aumento()))
+    contexto.set_strategy(StrategyMeanSd())
+    sistema = SistemaIoT(contexto)
+    fechas_texto = [segundos_a_fecha(f) for f in fechas]
+    set_salida(SalidaNula())
+    t0 = time.perf_counter()
+    for i in range(n):
+        for sensor, valores in temps.items():
+            sistema.update((fechas_texto[i], valores[i], sensor))
+    lectura_a_lectura = time.perf_counter() - t0
+    set_salida(SalidaConsola())
+
+    sistema = SistemaIoT(contexto)
+    fechas_np = np.array(fechas)
+    t0 = time.perf_counter()
+    for sensor, valores in temps.items():
+        sistema.update_batch(fechas_np, valores, sensor)
+    por_lotes = time.perf_counter() - t0
+
+    total = n * sensores
+    print(f"lecturas: {total:,}")
+    print(f"lectura a lectura:\t{lectura_a_lectura:.2f} s\t({total / lectura_a_lectura:,.0f} lecturas/s, solo media y sd)")
+    print(f"update_batch:\t\t{por_lotes:.2f} s\t({total / por_lotes:,.0f} lecturas/s, todos los estadisticos)")
+    print(f"aceleracion:\t\t{lectura_a_lectura / por_lotes:.1f}x")
+    registrar_resultado('lotes', 'lectura a lectura', sensores=sensores, lecturas=total, lecturas_s=total / lectura_a_lectura)
+    registrar_resultado('lotes', 'update_batch', sensores=sensores, lecturas=total, lecturas_s=total / por_lotes)
+
+# Coste por manejador de la instrumentacion de la cadena (con tres manejadores que no hacen nada mas que pasar la lectura)
+def bench_instrumentacion(llamadas=1_000_000):
+    cadena = ManejadorPaso(ManejadorPaso(ManejadorPaso()))
+    tiempos = {}
+    for modo in ('sin instrumentar', 'instrumentada', 'desinstrumentada'):
+        if modo == 'instrumentada':
+            cadena.instrumentar(Metricas())
+        elif modo == 'desinstrumentada':
+            cadena.desinstrumentar()
+        inicio = time.perf_counter_ns()
+        for _ in range(llamadas):
+            cadena.manejar_date_temp('', None)
+        tiempos[modo] = (time.perf_counter_ns() - inicio) / llamadas / 3
+        print(f"{modo}:\t{tiempos[modo]:.0f} ns por manejador")
+        registrar_resultado('instrumentacion', modo, media_ns=tiempos[modo])
+    print(f"coste de la instrumentacion:\t{tiempos['instrumentada'] - tiempos['sin instrumentar']:.0f} ns por manejador")
+
+# Reproduccion de una semana de lecturas (una cada 5 segundos) con la cadena completa y un reloj simulado
+def bench_reproduccion(sensores=10, dias=7):
+    contexto = ContextoEstadisticos(Umbral(Aumento()))
+    contexto.set_strategies(StrategyMeanSd(), StrategyCuantil(), StrategyMaxMin())
+    sistema = SistemaIoT(contexto)
+    reloj = RelojSimulado(fecha_a_segundos("2024-05-01 00:00:00"))
+    lista = [Sensor(f"sensor{i}", 5, reloj, FuenteAleatoria(semilla=i)) for i in range(sensores)]
+    for sensor in lista:
+        sensor.register_observer(sistema)
+        sensor.resume()
+    set_salida(SalidaNula())
+    inicio = time.perf_counter()
+    lecturas = reproducir(lista, reloj, duracion=dias * 24 * 3600)
+    segundos = time.perf_counter() - inicio
+    set_salida(SalidaConsola())
+    print(f"{dias} dias simulados, {sensores} sensores: {lecturas:,} lecturas en {segundos:.1f} s ({lecturas / segundos:,.0f} lecturas/s)")
+    registrar_resultado('reproduccion', 'reproducir', sensores=sensores, lecturas=lecturas, lecturas_s=lecturas / segundos)
+
+# Componentes de la cadena que se miden por separado en bench_latencias: nombre -> funcion que crea el manejador
+COMPONENTES = {
+    'StrategyMeanSd': StrategyMeanSd,
+    'StrategyCuantil': StrategyCuantil,
+    'StrategyMaxMin': StrategyMaxMin,
+    'Umbral': Umbral,
+    'Aumento': Aumento,
+}
+
+# Latencia por lectura de cada Strategy, de Umbral, de Aumento y del SistemaIoT.update con la cadena completa, segun el
+# tamaño de la ventana (lecturas una por segundo y la ventana de 'tam' segundos, asi siempre esta llena)
+# La latencia de cada componente incluye añadir la lectura a su ventana, que es donde se actualizan los motores incrementales
+def bench_latencias(ventanas=(12, 100, 1_000, 10_000, 100_000), lecturas=20_000):
+    inicio = fecha_a_segundos("2024-05-01 00:00:00")
+    random.seed(0)
+    temps = [random.randint(8, 34) for _ in range(max(ventanas) + lecturas + 100)]
+    set_salida(SalidaNula())
+    print("ventana\tcomponente\t\tmedia (ns)\tp50 (ns)\tp99 (ns)")
+    try:
+        for tam in ventanas:
+            for nombre, clase in COMPONENTES.items():
+                manejador = clase()
+                ventana = VentanaTemporal(duracion=tam, capacidad=tam)
+                for i in range(tam):                                                 # Llenamos la ventana antes de medir
+                    ventana.append(inicio + i, temps[i])
+                if nombre.startswith('Strategy'):
+                    procesar = lambda date, vista: manejador.execute(date, vista)
+                else:
+                    procesar = manejador.manejar_date_temp
+                def lectura(i, ventana=ventana, procesar=procesar):
+                    ventana.append(inicio + tam + i, temps[tam + i])
+                    procesar("2024-05-01 00:00:00", ventana.vista())
+                fila = resumen_latencias(medir_latencias(lectura, lecturas))
+                registrar_resultado('latencias', nombre, ventana=tam, **fila)
+                print(f"{tam}\t{nombre:<16}\t{fila['media_ns']:.0f}\t\t{fila['p50_ns']}\t\t{fila['p99_ns']}")
+
+            # La cadena completa desde el SistemaIoT, con la fecha como texto igual que la envia el Sensor
+            contexto = ContextoEstadisticos(Umbral(Aumento()))
+            contexto.set_strategies(StrategyMeanSd(), StrategyCuantil(), StrategyMaxMin())
+            sistema = SistemaIoT(contexto, duracion=tam, capacidad=tam)
+            fechas = [segundos_a_fecha(inicio + i) for i in range(tam + lecturas + 100)]
+            for i in range(tam):
+                sistema.update((fechas[i], temps[i]))
+            def lectura(i, sistema=sistema, fechas=fechas, tam=tam):
+                sistema.update((fechas[tam + i], temps[tam + i]))
+            fila = resumen_latencias(medir_latencias(lectura, lecturas))
+            registrar_resultado('latencias', 'SistemaIoT.update', ventana=tam, **fila)
+            print(f"{tam}\t{'SistemaIoT.update':<16}\t{fila['media_ns']:.0f}\t\t{fila['p50_ns']}\t\t{fila['p99_ns']}")
+    finally:
+        set_salida(SalidaConsola())
+
+# Latencia por lectura del SistemaIoT.update con la cadena completa segun el numero de sensores (lecturas intercaladas)
+def bench_sensores_cadena(lecturas=100_000):
+    contexto = ContextoEstadisticos(Umbral(Aumento()))
+    contexto.set_strategies(StrategyMeanSd(), StrategyCuantil(), StrategyMaxMin())
+    set_salida(SalidaNula())
+    print("sensores\tmedia (ns)\tp50 (ns)\tp99 (ns)\tlecturas/s")
+    try:
+        for sensores in (1, 10, 100, 1_000, 10_000):
+            datos = generar_lecturas(lecturas + 100, sensores)
+            sistema = SistemaIoT(contexto)
+            fila = resumen_latencias(medir_latencias(lambda i: sistema.update(datos[i]), lecturas))
+            registrar_resultado('sensores_cadena', 'SistemaIoT.update', sensores=sensores, **fila)
+            print(f"{sensores}\t\t{fila['media_ns']:.0f}\t\t{fila['p50_ns']}\t\t{fila['p99_ns']}\t\t{fila['lecturas_s']:,.0f}")
+    finally:
+        set_salida(SalidaConsola())
+
+# Lecturas por segundo con la cadena completa en un solo SistemaIoT frente al SistemaDistribuido con 1, 2, 4... procesos
+# (hasta el numero de nucleos); el tiempo del SistemaDistribuido incluye esperar a que los procesos terminen
+def bench_distribuido(lecturas=400_000, sensores=1_000):
+    datos = generar_lecturas(lecturas, sensores)
+    set_salida(SalidaNula())
+    try:
+        sistema = SistemaIoT(cadena_estadisticos())
+        inicio = time.perf_counter()
+        for date_temp in datos:
+            sistema.update(date_temp)
+        base = lecturas / (time.perf_counter() - inicio)
+    finally:
+        set_salida(SalidaConsola())
+    print(f"nucleos: {os.cpu_count()}")
+    print("procesos\tlecturas/s\taceleracion")
+    print(f"SistemaIoT\t{base:,.0f}\t\t1.0x")
+    registrar_resultado('distribuido', 'SistemaIoT', sensores=sensores, lecturas_s=base)
+    procesos = 1
+    while procesos <= (os.cpu_count() or 1):
+        distribuido = SistemaDistribuido(procesos=procesos)
+        try:
+            inicio = time.perf_counter()
+            for date_temp in datos:
+                distribuido.update(date_temp)
+            distribuido.vaciar()
+            ritmo = lecturas / (time.perf_counter() - inicio)
+        finally:
+            distribuido.cerrar()
+        print(f"{procesos}\t\t{ritmo:,.0f}\t\t{ritmo / base:.1f}x")
+        registrar_resultado('distribuido', f"SistemaDistribuido({procesos})", sensores=sensores, lecturas_s=ritmo)
+        procesos *= 2
+
+# Maximo diario y resumen de un mes de lecturas (una cada 5 segundos) con los agregados frente a recorrer el historial
+def bench_agregados(dias=30, repeticiones=20):
+    inicio = fecha_a_segundos("2024-05-01 00:00:00")
+    n = dias * 24 * 3600 // 5
+    random.seed(0)
+    sistema = SistemaIoT(ManejadorNulo())
+    for i in range(n):
+        sistema._registrar('norte', inicio + 5 * i, '', random.randint(8, 34))
+    estado = sistema._estado('norte')
+    fin = inicio + dias * 86400
+
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        maximos = {}
+        for segundos, t in estado.historial.recorrer():
+            dia = segundos - segundos % 86400
+            if t > maximos.get(dia, float('-inf')):
+                maximos[dia] = t
+    recorriendo = (time.perf_counter() - t0) / repeticiones
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        serie = sistema.serie('norte', inicio, fin, 86400)
+    con_agregados = (time.perf_counter() - t0) / repeticiones
+    assert [a.maximo for a in serie] == list(maximos.values())
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        sistema.consultar_rango('norte', inicio + 1234, fin - 4321)
+    rango = (time.perf_counter() - t0) / repeticiones
+
+    print(f"lecturas: {n:,}")
+    print(f"maximo diario recorriendo el historial:\t{recorriendo * 1000:.1f} ms")
+    print(f"maximo diario con los agregados:\t{con_agregados * 1000:.3f} ms\t({recorriendo / con_agregados:,.0f}x)")
+    print(f"resumen de un rango sin alinear:\t{rango * 1000:.3f} ms")
+    registrar_resultado('agregados', 'serie diaria', lecturas=n, media_ns=con_agregados * 1e9)
+    registrar_resultado('agregados', 'consultar_rango', lecturas=n, media_ns=rango * 1e9)
+
+# Consultas de un rango de una hora y de las ultimas 1000 lecturas en historiales de millones de lecturas: filtrando la
+# lista de tuplas (timestamp, t) comparando textos frente a get_range/get_latest con busqueda binaria sobre los timestamps
+def bench_rangos(longitudes=(1_000_000, 4_000_000), repeticiones=20):
+    inicio = fecha_a_segundos("2024-05-01 00:00:00")
+    print("lecturas\tconsulta\t\tlista (ms)\tindice (us)\taceleracion")
+    for n in longitudes:
+        random.seed(0)
+        temps = [random.randint(8, 34) for _ in range(n)]
+        sistema = SistemaIoT(ManejadorNulo(), resoluciones=())
+        sistema._estado('norte').historial.extend(range(inicio, inicio + 5 * n, 5), temps)
+        lista = [(segundos_a_fecha(inicio + 5 * i), temps[i]) for i in range(n)]
+        desde, hasta = inicio + 5 * n // 2, inicio + 5 * n // 2 + 3600
+        desde_texto, hasta_texto = segundos_a_fecha(desde), segundos_a_fecha(hasta)
+
+        consultas = {
+            'rango de 1 hora': (lambda: [x for x in lista if desde_texto <= x[0] < hasta_texto],
+                                lambda: sistema.get_range(desde, hasta, 'norte')),
+            'ultimas 1000': (lambda: lista[-1000:],
+                             lambda: sistema.get_latest(1000, 'norte')),
+        }
+        for nombre, (con_lista, con_indice) in consultas.items():
+            assert con_indice() == con_lista()
+            t0 = time.perf_counter()
+            for _ in range(max(repeticiones // 10, 1)):
+                con_lista()
+            tiempo_lista = (time.perf_counter() - t0) / max(repeticiones // 10, 1)
+            latencias = medir_latencias(lambda i: con_indice(), repeticiones * 100)
+            fila = resumen_latencias(latencias)
+            print(f"{n:,}\t{nombre:<16}\t{tiempo_lista * 1000:.1f}\t\t{fila['media_ns'] / 1000:.1f}\t\t{tiempo_lista * 1e9 / fila['media_ns']:,.0f}x")
+            registrar_resultado('rangos', nombre, lecturas=n, media_ns=fila['media_ns'], p50_ns=fila['p50_ns'], p99_ns=fila['p99_ns'])
+        del lista
+
+# Memoria y latencia por lectura de los cuantiles exactos frente al modo aproximado (sketches KLL) en ventanas de 1 y 7 dias
+# con una lectura cada 5 segundos. Los exactos necesitan una ventana con todas las lecturas; los aproximados no
+def bench_cuantiles(dias=(1, 7), lecturas=20_000, error=0.01):
+    inicio = fecha_a_segundos("2024-05-01 00:00:00")
+    print("ventana\tmodo\t\tmemoria (MB)\tmedia (ns)\tp99 (ns)\terror max")
+    for d in dias:
+        n = d * 86400 // 5
+        random.seed(0)
+        temps = [random.gauss(20, 4) for _ in range(n + lecturas + 100)]
+        for modo in ('exacto', 'aproximado'):
+            tracemalloc.start()
+            if modo == 'exacto':
+                ventana = VentanaTemporal(duracion=d * 86400, capacidad=n + 1)
+                estrategia = StrategyCuantil()
+            else:
+                ventana = VentanaTemporal()
+                estrategia = StrategyCuantil(aproximado=True, duracion=d * 86400, error=error)
+            ventana.append(inicio, temps[0])
+            estrategia.calcular(ventana.vista())                                # El motor sigue la ventana desde la primera lectura
+            for i in range(1, n):
+                ventana.append(inicio + 5 * i, temps[i])
+            memoria = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            resultado = []
+            def lectura(i):
+                ventana.append(inicio + 5 * (n + i), temps[n + i])
+                resultado[:] = estrategia.calcular(ventana.vista())
+            fila = resumen_latencias(medir_latencias(lectura, lecturas))
+
+            # Error en el rango del ultimo resultado respecto a las lecturas de los ultimos d dias
+            ultima = n + lecturas + 100 - 1
+            ordenada = sorted(temps[ultima - n:ultima + 1])
+            error_max = max(abs(bisect_left(ordenada, valor) / len(ordenada) - q) for q, valor in zip((0.25, 0.5, 0.75), resultado))
+            print(f"{d} dias\t{modo:<10}\t{memoria / 2**20:.2f}\t\t{fila['media_ns']:.0f}\t\t{fila['p99_ns']}\t\t{error_max:.4f}")
+            registrar_resultado('cuantiles', modo, ventana=n, media_ns=fila['media_ns'], p50_ns=fila['p50_ns'], p99_ns=fila['p99_ns'], memoria=memoria)
+
+# Cliente generador de carga: envia 'tramas' tramas de 'por_trama' lecturas repartidas entre 'sensores' sensores, por UDP
+# o por TCP, lo mas rapido posible o a 'ritmo' tramas por segundo. Devuelve el numero de lecturas enviadas
+def cliente_carga(puerto, protocolo='tcp', sensores=100, por_trama=100, tramas=2_000, ritmo=None, host='127.0.0.1'):
+    inicio = fecha_a_segundos("2024-05-01 00:00:00")
+    temps = [float(random.randint(8, 34)) for _ in range(por_trama)]
+    if protocolo == 'tcp':
+        conexion = socket.create_connection((host, puerto))
+        enviar = conexion.sendall
+    else:
+        conexion = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        enviar = lambda datos: conexion.sendto(datos, (host, puerto))
+    t0 = time.perf_counter()
+    with conexion:
+        for i in range(tramas):
+            if ritmo is not None:
+                espera = t0 + i / ritmo - time.perf_counter()
+                if espera > 0:
+                    time.sleep(espera)
+            primera = inicio + 5 * por_trama * (i // sensores)
+            enviar(codificar_trama(f"sensor{i % sensores}", range(primera, primera + 5 * por_trama, 5), temps))
+    return tramas * por_trama
+
+# Lecturas por segundo y latencia de ingesta (desde el envio hasta que el SistemaIoT ha pasado la trama por la cadena) del
+# ServidorLecturas con el cliente de carga en otro proceso, con una cadena vacia y con la completa
+# El ritmo maximo se mide por TCP enviando lo mas rapido posible; la latencia se mide a un ritmo fijo (sin colas que la
+# inflen), por TCP y por UDP. Las latencias son cotas superiores (cubetas de potencias de 2 del HistogramaLatencia)
+def bench_servidor(tramas=2_000, por_trama=100, ritmo=100):
+    contexto = multiprocessing.get_context('spawn')
+    print("protocolo\tcadena\t\tritmo (tramas/s)\tlecturas/s\tperdidas\tlatencia p50 (us)\tlatencia p99 (us)")
+    set_salida(SalidaNula())
+    try:
+        for protocolo, ritmo_cliente, n in (('tcp', None, tramas), ('tcp', ritmo, ritmo * 5), ('udp', ritmo, ritmo * 5)):
+            for nombre, cadena in (('vacia', ManejadorNulo()), ('completa', cadena_estadisticos())):
+                servidor = ServidorLecturas(SistemaIoT(cadena))
+                hilo = servidor.iniciar_en_hilo()
+                puerto = servidor.puerto_tcp if protocolo == 'tcp' else servidor.puerto_udp
+                cliente = contexto.Process(target=cliente_carga, args=(puerto, protocolo), kwargs={'por_trama': por_trama, 'tramas': n, 'ritmo': ritmo_cliente})
+                cliente.start()
+                while not servidor.lecturas and cliente.is_alive():             # Empezamos a contar con la primera trama
+                    time.sleep(0.001)
+                t0 = time.perf_counter()
+                inicial = servidor.lecturas
+                cliente.join()
+                total = n * por_trama
+                limite = time.monotonic() + 30
+                while servidor.lecturas < total and time.monotonic() < limite:
+                    anteriores = servidor.lecturas
+                    time.sleep(0.1)
+                    if protocolo == 'udp' and servidor.lecturas == anteriores:
+                        break                                                   # Por UDP las perdidas no van a llegar
+                segundos = time.perf_counter() - t0
+                servidor.detener()
+                hilo.join()
+                latencia = servidor.estadisticas()['latencia']
+                perdidas = 1 - servidor.lecturas / total
+                etiqueta = 'maximo' if ritmo_cliente is None else ritmo_cliente
+                print(f"{protocolo}\t\t{nombre:<8}\t{etiqueta}\t\t\t{(servidor.lecturas - inicial) / segundos:,.0f}\t\t{perdidas:.1%}\t\t{latencia['p50_ns'] / 1000:,.0f}\t\t\t{latencia['p99_ns'] / 1000:,.0f}")
+                registrar_resultado('servidor', f"{protocolo} {nombre} {etiqueta}", lecturas_s=(servidor.lecturas - inicial) / segundos,
+                                    p50_ns=latencia['p50_ns'], p99_ns=latencia['p99_ns'])
+    finally:
+        set_salida(SalidaConsola())
+
+# Lecturas por segundo del hilo del sensor (SistemaIoT.update con la cadena completa) mientras 0, 1 o 4 hilos leen
+# instantaneas del sensor sin parar, e instantaneas por segundo y reintentos de los lectores. Los lectores no bloquean al
+# escritor, asi que lo que pierde con lectores es solo el tiempo de CPU que le quitan (el GIL se reparte entre los hilos)
+def bench_instantaneas(lecturas=50_000, lectores=(0, 1, 4)):
+    inicio = fecha_a_segundos("2024-05-01 00:00:00")
+    random.seed(0)
+    temps = [random.randint(8, 34) for _ in range(lecturas)]
+    fechas = [segundos_a_fecha(inicio + 5 * i) for i in range(lecturas)]
+    set_salida(SalidaNula())
+    print("lectores	escrituras/s	instantaneas/s	longitud media historial")
+    try:
+        for n in lectores:
+            sistema = SistemaIoT(cadena_estadisticos())
+            sistema.update((fechas[0], temps[0], 'norte'))
+            terminado = threading.Event()
+            hechas = []
+            longitudes = []
+
+            def lector():
+                cuantas = total = 0
+                while not terminado.is_set():
+                    instantanea = sistema.instantanea('norte')
+                    total += len(instantanea.date_temp)
+                    cuantas += 1
+                hechas.append(cuantas)
+                longitudes.append(total)
+
+            hilos = [threading.Thread(target=lector) for _ in range(n)]
+            for hilo in hilos:
+                hilo.start()
+            t0 = time.perf_counter()
+            for i in range(1, lecturas):
+                sistema.update((fechas[i], temps[i], 'norte'))
+            segundos = time.perf_counter() - t0
+            terminado.set()
+            for hilo in hilos:
+                hilo.join()
+            instantaneas = sum(hechas)
+            media = sum(longitudes) / instantaneas if instantaneas else 0
+            print(f"{n}\t\t{(lecturas - 1) / segundos:,.0f}\t\t{instantaneas / segundos:,.0f}\t\t{media:,.0f}")
+            registrar_resultado('instantaneas', f"{n} lectores", lecturas_s=(lecturas - 1) / segundos, instantaneas_s=instantaneas / segundos)
+    finally:
+        set_salida(SalidaConsola())
+
+# Importacion de historicos desde CSV y desde el fichero binario de tramas (4 sensores, una lectura cada 5 segundos):
+# lecturas por minuto solo leyendo el fichero y pasandolas por un SistemaIoT con la cadena vacia, con la completa y con
+# update_batch (si hay NumPy), y el pico de memoria de la lectura, que no debe crecer con el tamaño del fichero
+# Objetivo: varios millones de lecturas por minuto en un nucleo con la cadena completa
+def bench_importacion(longitudes=(250_000, 1_000_000), sensores=4):
+    inicio = fecha_a_segundos("2024-05-01 00:00:00")
+    set_salida(SalidaNula())
+    print("lecturas\tfichero\tdestino\t\tlecturas/min\tpico memoria lectura (MB)")
+    try:
+        with tempfile.TemporaryDirectory() as directorio:
+            for n in longitudes:
+                random.seed(0)
+                csv = os.path.join(directorio, f"lecturas_{n}.csv")
+                with open(csv, 'w') as f:
+                    f.write("fecha,temperatura,sensor\n")
+                    for i in range(0, n, 1000):
+                        f.writelines(f"{segundos_a_fecha(inicio + 5 * (j // sensores))},{random.randint(80, 340) / 10},s{j % sensores}\n"
+                                     for j in range(i, min(i + 1000, n)))
+                binario = os.path.join(directorio, f"lecturas_{n}.bin")
+                guardar_binario(leer_csv(csv), binario)
+
+                for fichero, ruta, leer in (('csv', csv, leer_csv), ('binario', binario, leer_binario)):
+                    tracemalloc.start()
+                    for _ in leer(ruta):
+                        pass
+                    pico = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    destinos = [('lectura', None, False), ('cadena vacia', ManejadorNulo, False), ('cadena completa', cadena_estadisticos, False)]
+                    if np is not None:
+                        destinos.append(('update_batch', ManejadorNulo, True))
+                    for nombre, cadena, vectorizado in destinos:
+                        lotes = leer(ruta)
+                        t0 = time.perf_counter()
+                        if cadena is None:
+                            for _ in lotes:
+                                pass
+                        else:
+                            importar(SistemaIoT(cadena(), resoluciones=()), lotes, vectorizado)
+                        segundos = time.perf_counter() - t0
+                        print(f"{n:,}\t{fichero}\t{nombre:<16}\t{n / segundos * 60:,.0f}\t{pico / 1e6:.2f}")
+                        registrar_resultado('importacion', f"{fichero} {nombre}", lecturas=n, lecturas_s=n / segundos, memoria=pico)
+    finally:
+        set_salida(SalidaConsola())
+
+BENCHMARKS = {
+    'sensores': bench_sensores,
+    'planificador': bench_planificador,
+    'historial': bench_historial,
+    'lotes': bench_lotes,
+    'instrumentacion': bench_instrumentacion,
+    'reproduccion': bench_reproduccion,
+    'latencias': bench_latencias,
+    'sensores_cadena': bench_sensores_cadena,
+    'distribuido': bench_distribuido,
+    'agregados': bench_agregados,
+    'rangos': bench_rangos,
+    'cuantiles': bench_cuantiles,
+    'servidor': bench_servidor,
+    'instantaneas': bench_instantaneas,
+    'importacion': bench_importacion,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks del SistemaIoT")
+    parser.add_argument('nombres', nargs='*', help=f"benchmarks a ejecutar (todos si no se indica ninguno): {', '.join(BENCHMARKS)}")
+    parser.add_argument('--json', help="fichero donde guardar los resultados")
+    parser.add_argument('--comparar', help="fichero JSON con resultados anteriores con los que comparar")
+    args = parser.parse_args()
+    for nombre in args.nombres:
+        if nombre not in BENCHMARKS:
+            parser.error(f"benchmark desconocido: {nombre}")
+    for nombre in args.nombres or BENCHMARKS:
+        print(f"== {nombre} ==")
+        BENCHMARKS[nombre]()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'commit': commit_actual(), 'python': platform.python_version(), 'plataforma': platform.platform(),
+                       'fecha': time.strftime("%Y-%m-%d %H:%M:%S"), 'resultados': RESULTADOS}, f, indent=2)
+    if args.comparar:
+        comparar_resultados(args.comparar)
@@ -1,10 +1,27 @@
 import functools
 import random
-from datetime import datetime
 from math import sqrt
 import time
+import calendar
+from bisect import bisect_left, bisect_right, insort
+from array import array
+from collections import deque, namedtuple, OrderedDict
+from collections.abc import Sequence
 from abc import ABC, abstractmethod
+import sys
 import threading
+import os
+import mmap
+import struct
+try:
+    import numpy as np
+except ImportError:                                                     # NumPy solo hace falta para SistemaIoT.update_batch
+    np = None
+import asyncio
+import heapq
+import multiprocessing
+from multiprocessing import shared_memory
+import itertools
 # ----------------------------
 # EXPLICACIONES DEL PROGRAMA
 # ----------------------------
@@ -22,6 +39,204 @@ class ErrorInstancia(Exception):
 class ErrorNone(Exception):
     pass
 
+class ErrorRegistro(Exception):
+    pass
+
+# -----------------------
+# FUNCIONES AUXILIARES
+# -----------------------
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+SENSOR_POR_DEFECTO = ''                                                 # Sensor al que se asignan las lecturas que llegan sin nombre
+
+# Convierte una fecha con FORMATO_FECHA a segundos enteros (la fecha local se trata como UTC, solo nos interesan las diferencias de tiempo)
+def fecha_a_segundos(date):
+    return calendar.timegm((int(date[0:4]), int(date[5:7]), int(date[8:10]), int(date[11:13]), int(date[14:16]), int(date[17:19]), 0, 0, 0))
+
+# Convierte los segundos obtenidos con fecha_a_segundos de nuevo a una fecha con FORMATO_FECHA
+def segundos_a_fecha(segundos):
+    return time.strftime(FORMATO_FECHA, time.gmtime(segundos))
+
+# Fecha como texto o en segundos convertida a segundos
+def _a_segundos(fecha):
+    return fecha_a_segundos(fecha) if isinstance(fecha, str) else fecha
+
+# Temperatura entera si no tiene decimales: las ventanas y el historial guardan floats, pero se devuelven (y se muestran)
+# igual que las lecturas originales del sensor, que son enteras
+def _normalizar(temp):
+    return int(temp) if isinstance(temp, float) and temp.is_integer() else temp
+
+# Calcula Q1, Mediana y Q3 de una lista ya ordenada (si n es par se hace la media de los dos valores centrales)
+def cuantiles(temp_ordenada):
+    n = len(temp_ordenada)
+    Q1 = temp_ordenada[n//4] if n%2 != 0 else (temp_ordenada[n//4-1] + temp_ordenada[n//4])/2           # Calculo de Q1
+    mediana = temp_ordenada[n//2] if n%2 != 0 else (temp_ordenada[n//2-1] + temp_ordenada[n//2])/2      # Calculo de la Mediana
+    Q3 = temp_ordenada[3*n//4] if n%2 != 0 else (temp_ordenada[3*n//4-1] + temp_ordenada[3*n//4])/2     # Calculo de Q3
+    return (Q1, mediana, Q3)
+
+# -----------------------
+# SALIDAS
+# -----------------------
+# Salida a la que los manejadores y estrategias envian lo que hay que mostrar
+# Se les pasa la funcion que construye el texto y sus argumentos, asi el texto solo se formatea si de verdad se va a mostrar
+class Salida(ABC):
+    @abstractmethod
+    def emitir(self, formatear, *args):
+        pass
+
+    # Funcion para terminar la salida mostrando lo que quede pendiente
+    def cerrar(self):
+        pass
+
+# Muestra cada mensaje por pantalla en el momento (es la salida por defecto)
+class SalidaConsola(Salida):
+    def emitir(self, formatear, *args):
+        print(formatear(*args))
+
+# No muestra nada ni formatea ningun texto (para benchmarks o para usar solo los resultados)
+class SalidaNula(Salida):
+    def emitir(self, formatear, *args):
+        pass
+
+# Acumula los mensajes y un hilo los escribe por lotes cada 'intervalo' segundos o cuando hay 'lote' pendientes
+# Si se indica maximo_por_segundo, los mensajes que superen ese ritmo se descartan (los mas antiguos) y se avisa de cuantos
+class SalidaBuffer(Salida):
+    def __init__(self, destino=None, lote=1000, intervalo=0.5, maximo_por_segundo=None):
+        self.destino = destino                                          # Fichero donde se escribe (por defecto sys.stdout)
+        self.lote = lote
+        self.intervalo = intervalo
+        self.maximo_por_segundo = maximo_por_segundo
+        self.omitidos = 0                                               # Mensajes descartados por el limite de ritmo
+        self._pendientes = []
+        self._condicion = threading.Condition()
+        self._activa = True
+        self._fichas = maximo_por_segundo                               # Cubo de fichas para limitar el ritmo
+        self._ultimo_volcado = time.monotonic()
+        self._hilo = threading.Thread(target=self._volcar_periodicamente, daemon=True)
+        self._hilo.start()
+
+    def emitir(self, formatear, *args):
+        with self._condicion:
+            self._pendientes.append((formatear, args))
+            if len(self._pendientes) >= self.lote:
+                self._condicion.notify()
+
+    def _volcar_periodicamente(self):
+        activa = True
+        while activa:
+            with self._condicion:
+                if self._activa and len(self._pendientes) < self.lote:
+                    self._condicion.wait(self.intervalo)
+                pendientes, self._pendientes = self._pendientes, []
+                activa = self._activa
+            if pendientes:
+                self._escribir(pendientes)
+
+    def _escribir(self, pendientes):
+        omitidos = 0
+        if self.maximo_por_segundo is not None:
+            ahora = time.monotonic()
+            self._fichas = min(self.maximo_por_segundo, self._fichas + (ahora - self._ultimo_volcado) * self.maximo_por_segundo)
+            self._ultimo_volcado = ahora
+            permitidos = min(len(pendientes), int(self._fichas))
+            self._fichas -= permitidos
+            omitidos = len(pendientes) - permitidos
+            pendientes = pendientes[omitidos:]
+            self.omitidos += omitidos
+        lineas = [formatear(*args) for formatear, args in pendientes]
+        if omitidos:
+            lineas.append(f"[{omitidos} mensajes omitidos]")
+        destino = self.destino or sys.stdout
+        destino.write('\n'.join(lineas) + '\n')
+        destino.flush()
+
+    # Funcion que escribe lo pendiente y termina el hilo
+    def cerrar(self):
+        with self._condicion:
+            self._activa = False
+            self._condicion.notify()
+        self._hilo.join()
+
+_salida = SalidaConsola()                                               # Salida que usan todos los manejadores y estrategias
+
+# Funcion para cambiar la salida de todos los manejadores y estrategias
+def set_salida(salida):
+    global _salida
+    _salida = salida
+
+# Funcion para obtener la salida actual
+def get_salida():
+    return _salida
+
+# -----------------------
+# INSTRUMENTACION
+# -----------------------
+# Histograma de latencias en nanosegundos con cubetas de potencias de 2 (la cubeta es el bit_length de la latencia)
+class HistogramaLatencia:
+    def __init__(self):
+        self.cubetas = [0] * 65
+        self.n = 0                                                      # Numero de llamadas
+        self.total = 0                                                  # Suma de las latencias
+        self.maximo = 0
+
+    def registrar(self, ns):
+        self.cubetas[ns.bit_length()] += 1
+        self.n += 1
+        self.total += ns
+        if ns > self.maximo:
+            self.maximo = ns
+
+    # Funcion que devuelve una cota superior del percentil p (0-100), el limite superior de su cubeta
+    def percentil(self, p):
+        objetivo = self.n * p / 100
+        acumuladas = 0
+        for cubeta, cuantas in enumerate(self.cubetas):
+            acumuladas += cuantas
+            if cuantas and acumuladas >= objetivo:
+                return min((1 << cubeta) - 1, self.maximo)
+        return 0
+
+    def resumen(self):
+        return {'llamadas': self.n,
+                'media_ns': self.total / self.n if self.n else 0.0,
+                'p50_ns': self.percentil(50),
+                'p99_ns': self.percentil(99),
+                'max_ns': self.maximo}
+
+# Metricas de la cadena de manejadores: latencia propia de cada manejador (sin contar sus sucesores) y latencia de
+# extremo a extremo desde que el sensor genera la lectura hasta que termina la cadena
+class Metricas:
+    def __init__(self):
+        self.manejadores = {}                                           # Histograma de cada manejador por nombre
+        self._nombres = {}                                              # Nombre con el que se ha medido cada manejador
+        self.extremo_a_extremo = HistogramaLatencia()
+        self._local = threading.local()                                 # Tiempo del sucesor en la llamada en curso de cada hilo
+        self._volcado = None
+
+    # Funcion que devuelve una instantanea de todas las metricas como diccionario
+    def instantanea(self):
+        return {'manejadores': {nombre: histograma.resumen() for nombre, histograma in self.manejadores.items()},
+                'extremo_a_extremo': self.extremo_a_extremo.resumen()}
+
+    # Funcion que envia una instantanea a la salida cada 'periodo' segundos desde un hilo aparte
+    def iniciar_volcado(self, periodo=10):
+        parar = threading.Event()
+        def volcar():
+            while not parar.wait(periodo):
+                get_salida().emitir(self.formatear, self.instantanea())
+        self._volcado = parar
+        threading.Thread(target=volcar, daemon=True).start()
+
+    def detener_volcado(self):
+        if self._volcado is not None:
+            self._volcado.set()
+            self._volcado = None
+
+    def formatear(self, instantanea):
+        lineas = ['Metricas (llamadas, media, p99 en microsegundos):']
+        for nombre, resumen in list(instantanea['manejadores'].items()) + [('Extremo a extremo', instantanea['extremo_a_extremo'])]:
+            lineas.append(f"\t{nombre}:\t{resumen['llamadas']}\t{resumen['media_ns'] / 1000:.2f}\t{resumen['p99_ns'] / 1000:.2f}")
+        return '\n'.join(lineas)
+
 # -----------------------
 # CLASES
 # ----------------------- 
@@ -32,6 +247,7 @@ class ErrorNone(Exception):
 class Observable:
     def __init__(self):
         self._observers = []
+        self._despacho = None                                           # Si es None se notifica en el mismo hilo (modo sincrono)
 
     def register_observer(self, observer):
         self._observers.append(observer)
@@ -39,28 +255,206 @@ class Observable:
     def remove_observer(self, observer):
         self._observers.remove(observer)
 
+    # Funcion para notificar a traves de una DespachoCola (o volver al modo sincrono con None)
+    def set_despacho(self, despacho):
+        self._despacho = despacho
+
     def notify_observers(self, date_temp):
+        if self._despacho is not None:
+            self._despacho.encolar(self, self._observers, date_temp)
+            return
         for observer in self._observers:
             observer.update(date_temp)
 
-# El Sensor de temperatura que obtendra la tupla (timestamp, t) y notificara de cada actualizacion
+# Politicas de la DespachoCola cuando la cola esta llena
+BLOQUEAR = 'bloquear'                                                   # El sensor espera a que haya sitio
+DESCARTAR_ANTIGUA = 'descartar_antigua'                                 # Se descarta la lectura mas antigua de la cola
+FUSIONAR = 'fusionar'                                                   # Se sustituye la lectura pendiente del mismo sensor por la nueva
+
+# Despacho de las notificaciones en una cola acotada que vacia un grupo de hilos trabajadores, para que un observador lento no frene al sensor
+# Cada Observable se asigna siempre al mismo trabajador, asi sus lecturas se procesan en orden
+class DespachoCola:
+    def __init__(self, capacidad=1000, trabajadores=1, politica=BLOQUEAR):
+        if politica not in (BLOQUEAR, DESCARTAR_ANTIGUA, FUSIONAR):
+            raise ValueError(f"Politica de desbordamiento desconocida: {politica}")
+        self.capacidad = capacidad                                      # Capacidad de la cola de cada trabajador
+        self.politica = politica
+        self._activo = True
+        self._colas = [deque() for _ in range(trabajadores)]
+        self._condiciones = [threading.Condition() for _ in range(trabajadores)]
+        self._pendientes = [{} for _ in range(trabajadores)]            # Ultima entrada en cola de cada Observable (para FUSIONAR)
+        self._ocupados = [False] * trabajadores
+        self._procesadas = [0] * trabajadores                           # Contadores por trabajador, cada uno solo lo escribe su hilo o con su lock
+        self._descartadas = [0] * trabajadores
+        self._fusionadas = [0] * trabajadores
+        self._fallidas = [0] * trabajadores                             # Notificaciones en las que el observador ha lanzado una excepcion
+        self.ultimo_error = None                                        # Ultima excepcion lanzada por un observador
+        self._hilos = [threading.Thread(target=self._trabajar, args=(i,), daemon=True) for i in range(trabajadores)]
+        for hilo in self._hilos:
+            hilo.start()
+
+    # Funcion que pone una lectura en la cola del trabajador de ese Observable aplicando la politica si esta llena
+    def encolar(self, origen, observers, date_temp):
+        i = hash(origen) % len(self._colas)
+        cola, condicion, pendientes = self._colas[i], self._condiciones[i], self._pendientes[i]
+        with condicion:
+            if len(cola) >= self.capacidad:
+                if self.politica == BLOQUEAR:
+                    while len(cola) >= self.capacidad and self._activo:
+                        condicion.wait()
+                elif self.politica == FUSIONAR and origen in pendientes:
+                    pendientes[origen][2] = date_temp
+                    self._fusionadas[i] += 1
+                    return
+                else:
+                    descartada = cola.popleft()
+                    if pendientes.get(descartada[0]) is descartada:
+                        del pendientes[descartada[0]]
+                    self._descartadas[i] += 1
+            entrada = [origen, observers, date_temp]
+            cola.append(entrada)
+            if self.politica == FUSIONAR:
+                pendientes[origen] = entrada
+            condicion.notify_all()
+
+    def _trabajar(self, i):
+        cola, condicion, pendientes = self._colas[i], self._condiciones[i], self._pendientes[i]
+        while True:
+            with condicion:
+                while not cola and self._activo:
+                    condicion.wait()
+                if not cola:                                            # Se ha cerrado el despacho y no quedan lecturas
+                    return
+                entrada = cola.popleft()
+                if pendientes.get(entrada[0]) is entrada:
+                    del pendientes[entrada[0]]
+                self._ocupados[i] = True
+                condicion.notify_all()                                  # Despierta a los sensores bloqueados por la cola llena
+            # Un observador que falla no puede terminar el trabajador: se cuenta el error y se sigue con los demas
+            try:
+                for observer in entrada[1]:
+                    try:
+                        observer.update(entrada[2])
+                    except Exception as error:
+                        self._fallidas[i] += 1
+                        self.ultimo_error = error
+            finally:
+                with condicion:
+                    self._ocupados[i] = False
+                    self._procesadas[i] += 1
+                    condicion.notify_all()
+
+    # Funcion que espera a que se hayan procesado todas las lecturas encoladas
+    def vaciar(self):
+        for i, condicion in enumerate(self._condiciones):
+            with condicion:
+                while self._colas[i] or self._ocupados[i]:
+                    condicion.wait()
+
+    # Funcion que procesa las lecturas pendientes y termina los trabajadores
+    def cerrar(self):
+        self._activo = False
+        for condicion in self._condiciones:
+            with condicion:
+                condicion.notify_all()
+        for hilo in self._hilos:
+            hilo.join()
+
+    # Funcion que devuelve los contadores del despacho
+    def estadisticas(self):
+        return {'profundidad': sum(len(cola) for cola in self._colas),
+                'procesadas': sum(self._procesadas),
+                'descartadas': sum(self._descartadas),
+                'fusionadas': sum(self._fusionadas),
+                'fallidas': sum(self._fallidas)}
+
+# Reloj del que los sensores obtienen la fecha y con el que esperan entre lecturas
+# ahora() devuelve los segundos de la fecha local tratada como UTC (el mismo convenio que fecha_a_segundos)
+class Reloj(ABC):
+    @abstractmethod
+    def ahora(self):
+        pass
+
+    @abstractmethod
+    def dormir(self, segundos):
+        pass
+
+# Reloj real del sistema (el de por defecto)
+class RelojSistema(Reloj):
+    def ahora(self):
+        segundos = time.time()
+        return segundos + time.localtime(segundos).tm_gmtoff
+
+    def dormir(self, segundos):
+        time.sleep(segundos)
+
+# Reloj simulado: dormir avanza el tiempo al instante, asi se pueden simular dias de lecturas en segundos
+class RelojSimulado(Reloj):
+    def __init__(self, inicio=0):
+        self.segundos = inicio
+
+    def ahora(self):
+        return self.segundos
+
+    def dormir(self, segundos):
+        self.segundos += segundos
+
+# Fuente de las temperaturas de un sensor: siguiente(segundos) devuelve la lectura (segundos, t) para ese instante
+# o lanza StopIteration si ya no quedan lecturas
+class FuenteTemperatura(ABC):
+    @abstractmethod
+    def siguiente(self, segundos):
+        pass
+
+# Temperatura aleatoria en el intervalo (minimo, maximo), reproducible si se indica una semilla
+class FuenteAleatoria(FuenteTemperatura):
+    def __init__(self, semilla=None, minimo=8, maximo=34):
+        self._random = random.Random(semilla)
+        self.minimo = minimo
+        self.maximo = maximo
+
+    def siguiente(self, segundos):
+        return (segundos, self._random.randint(self.minimo, self.maximo))
+
+# Lecturas grabadas (por ejemplo las de get_date_temp): cada lectura conserva su propia fecha, ya sea texto o segundos
+class FuenteTraza(FuenteTemperatura):
+    def __init__(self, lecturas):
+        self._lecturas = iter(lecturas)
+
+    def siguiente(self, segundos):
+        fecha, t = next(self._lecturas)
+        return (_a_segundos(fecha), t)
+
+# El Sensor de temperatura que obtendra la tupla (timestamp, t, nombre, instante) y notificara de cada actualizacion
+# La fecha la obtiene de un Reloj y la temperatura de una FuenteTemperatura, por defecto el reloj del sistema y una temperatura random
 class Sensor(Observable):
-    def __init__(self, name):
+    def __init__(self, name, periodo=5, reloj=None, fuente=None):
         super().__init__()
         self.name = name
+        self.periodo = periodo                                          # Segundos entre cada lectura
+        self.reloj = reloj or RelojSistema()                            # Reloj del que obtiene la fecha de cada lectura
+        self.fuente = fuente or FuenteAleatoria()                       # Fuente de las temperaturas
         self.running = True                                             # Variable para poder salir del programa
         self.pause_event = threading.Event()                            # Variable para poder pausar y reaunudar el programa
     
-    # Funcion que inicia el proceso de obtencion de la tupla (timestamp, t) cada 5 segundos    
+    # Funcion que obtiene una tupla (timestamp, t, nombre) y la notifica a los observadores
+    def medir(self):
+        segundos, temperature = self.fuente.siguiente(self.reloj.ahora())   # Obtiene la fecha actual y la temperatura (random en el intervalo (8, 34) por defecto)
+        timestamp = segundos_a_fecha(segundos)
+        date_temp = (timestamp, temperature, self.name, time.perf_counter_ns())   # Formamos la tupla con el nombre del sensor para que el sistema la separe del resto
+                                                                        # y el instante en que se genera para medir la latencia de extremo a extremo
+        self.notify_observers(date_temp)                                # Notifica al observer la tupla obtenida
+
+    # Funcion que inicia el proceso de obtencion de la tupla cada 5 segundos (periodo) en el hilo actual
     def run(self):
         while self.running:
             self.pause_event.wait()                                     # Espera a a que se reanude el proceso, mientras esta paausado
-            
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")    # Obtiene la fecha actual
-            temperature = random.randint(8, 34)                         # Obtiene una temperatura random en el intervalo (8, 34)            
-            date_temp = (timestamp, temperature)                        # Formamos la tupla
-            self.notify_observers(date_temp)                            # Notifica al observer la tupla obtenida
-            time.sleep(5)                                               # Espera 5 segundos antes de generar la proxima temperatura
+            try:
+                self.medir()
+            except StopIteration:                                       # La fuente no tiene mas lecturas (por ejemplo una traza)
+                self.exit()
+                break
+            self.reloj.dormir(self.periodo)                             # Espera 5 segundos antes de generar la proxima temperatura
     
     # Funcion para pausar el programa (la funcion run)
     def pause(self):
@@ -74,27 +468,1025 @@ class Sensor(Observable):
     def exit(self):
         self.running = False
 
+# Planificador que mueve muchos sensores desde un unico bucle de asyncio en lugar de un hilo por sensor
+# Guarda en un monticulo el proximo instante de cada sensor; los instantes son absolutos (el anterior + periodo) para que
+# los retrasos no se acumulen, y si un sensor se queda atras se salta los ticks perdidos en lugar de ponerse al dia de golpe
+# Respeta pause/resume/exit: un sensor pausado no mide en sus ticks y uno que ha salido se elimina del planificador
+class PlanificadorSensores:
+    def __init__(self, lote=1000):
+        self.lote = lote                                                # Ticks seguidos antes de ceder el control al bucle de eventos
+        self.running = True
+        self._cola = []                                                 # Monticulo de (instante, orden, sensor, periodo)
+        self._orden = itertools.count()                                 # Desempata sensores con el mismo instante
+        self._nuevos = []                                               # Sensores registrados pendientes de entrar en el monticulo
+        self._cerrojo = threading.Lock()                                # Protege _nuevos, que se puede llenar desde otros hilos
+        self.ticks = 0                                                  # Numero de lecturas realizadas
+        self.retraso_total = 0.0                                        # Suma de los retrasos respecto al instante planificado
+        self.retraso_max = 0.0                                          # Mayor retraso observado (jitter)
+
+    # Funcion para registrar un sensor con su periodo (por defecto el del sensor) y un desfase inicial opcional
+    # Se puede llamar desde cualquier hilo mientras el planificador se ejecuta
+    def registrar(self, sensor, periodo=None, desfase=0.0):
+        with self._cerrojo:
+            self._nuevos.append((sensor, sensor.periodo if periodo is None else periodo, desfase))
+
+    # Funcion para detener el planificador
+    def detener(self):
+        self.running = False
+
+    # Funcion que devuelve las estadisticas de retraso de los ticks
+    def estadisticas(self):
+        return {'ticks': self.ticks,
+                'retraso_medio': self.retraso_total / self.ticks if self.ticks else 0.0,
+                'retraso_max': self.retraso_max}
+
+    def _planificar_nuevos(self, ahora):
+        with self._cerrojo:
+            nuevos, self._nuevos = self._nuevos, []
+        for sensor, periodo, desfase in nuevos:
+            heapq.heappush(self._cola, (ahora + desfase, next(self._orden), sensor, periodo))
+
+    # Corrutina principal: termina cuando todos los sensores han salido, se llama a detener() o pasan 'duracion' segundos
+    async def ejecutar(self, duracion=None):
+        loop = asyncio.get_running_loop()
+        fin = None if duracion is None else loop.time() + duracion
+        while self.running:
+            ahora = loop.time()
+            if self._nuevos:
+                self._planificar_nuevos(ahora)
+            if not self._cola or (fin is not None and ahora >= fin):
+                break
+            espera = self._cola[0][0] - ahora
+            if fin is not None:
+                espera = min(espera, fin - ahora)
+            if espera > 0:
+                await asyncio.sleep(espera)
+                continue
+
+            # Atendemos todos los sensores que ya han llegado a su instante, cediendo el control cada 'lote' ticks
+            for _ in range(self.lote):
+                if not self._cola or self._cola[0][0] > ahora:
+                    break
+                instante, orden, sensor, periodo = heapq.heappop(self._cola)
+                if not sensor.running:                                  # El sensor ha salido, no se vuelve a planificar
+                    continue
+                if sensor.pause_event.is_set():
+                    retraso = loop.time() - instante
+                    self.ticks += 1
+                    self.retraso_total += retraso
+                    if retraso > self.retraso_max:
+                        self.retraso_max = retraso
+                    try:
+                        sensor.medir()
+                    except StopIteration:                               # La fuente del sensor se ha agotado: sale del planificador
+                        sensor.exit()
+                        continue
+                siguiente = instante + periodo
+                if siguiente <= ahora:                                  # Nos hemos quedado atras: saltamos los ticks perdidos
+                    siguiente += periodo * ((ahora - siguiente) // periodo + 1)
+                heapq.heappush(self._cola, (siguiente, orden, sensor, periodo))
+            await asyncio.sleep(0)
+
+    # Funcion para ejecutar el planificador en su propio hilo (un solo hilo para todos los sensores)
+    def iniciar_en_hilo(self, duracion=None):
+        hilo = threading.Thread(target=asyncio.run, args=(self.ejecutar(duracion),))
+        hilo.start()
+        return hilo
+
+# Modo de reproduccion: mueve los sensores (que deben usar el mismo RelojSimulado) lo mas rapido posible y en orden de tiempo,
+# pasando por todos los observadores y manejadores como si fuera en tiempo real. Termina cuando pasan 'duracion' segundos
+# simulados, o cuando todos los sensores han salido o agotado su fuente. Devuelve el numero de lecturas generadas
+def reproducir(sensores, reloj, duracion=None):
+    fin = None if duracion is None else reloj.ahora() + duracion
+    cola = [(reloj.ahora(), orden, sensor) for orden, sensor in enumerate(sensores)]
+    heapq.heapify(cola)
+    lecturas = 0
+    while cola:
+        instante, orden, sensor = heapq.heappop(cola)
+        if fin is not None and instante >= fin:
+            break
+        if not sensor.running:
+            continue
+        reloj.segundos = instante
+        if sensor.pause_event.is_set():
+            try:
+                sensor.medir()
+            except StopIteration:                                       # La fuente del sensor ya no tiene mas lecturas
+                sensor.exit()
+                continue
+            lecturas += 1
+        heapq.heappush(cola, (instante + sensor.periodo, orden, sensor))
+    return lecturas
+
+# Almacen de la ventana temporal (por ejemplo, los ultimos 60 segundos) de un flujo de temperaturas
+# Es un buffer circular de capacidad fija respaldado por arrays, por lo que la memoria es constante aunque el sistema lleve dias funcionando
+# Cada lectura se escribe dos veces (en la posicion i y en i + capacidad), asi la ventana actual siempre es un tramo contiguo
+# del array y se puede entregar a los manejadores como un memoryview sin copiar nada
+class VentanaTemporal:
+    def __init__(self, duracion=60, capacidad=128):
+        self.duracion = duracion                                        # Segundos que abarca la ventana
+        self.capacidad = capacidad                                      # Numero maximo de lecturas dentro de la ventana
+        self._fechas = array('q', bytes(16 * capacidad))                # Timestamps en segundos (el doble de la capacidad)
+        self._temps = array('d', bytes(16 * capacidad))                 # Temperaturas (el doble de la capacidad)
+        self._inicio = 0                                                # Posicion de la lectura mas antigua de la ventana
+        self._n = 0                                                     # Numero de lecturas en la ventana
+        self._motores = {}                                              # Motores incrementales que siguen el contenido de la ventana
+
+    def __len__(self):
+        return self._n
+
+    # Funcion para obtener el motor incremental de una clase (y sus parametros) asociado a la ventana
+    # La primera vez se crea y se inicializa con el contenido actual, despues se actualiza en O(1) con cada lectura que entra o sale
+    def motor(self, clase, *args):
+        clave = (clase, args)
+        motor = self._motores.get(clave)
+        if motor is None:
+            motor = clase(*args)
+            for fecha, temp in zip(self.vista_fechas(), self.vista()):
+                motor.entrar(fecha, temp)
+            self._motores[clave] = motor
+        return motor
+
+    # Funcion para añadir una lectura y expulsar las que ya no pertenecen a la ventana, en O(1) amortizado
+    def append(self, fecha, temp):
+        temp = _normalizar(temp)                                        # Los motores reciben lo mismo que devuelve la vista
+        if self._n == self.capacidad:                                   # Si esta llena expulsamos la lectura mas antigua
+            self._expulsar()
+        pos = (self._inicio + self._n) % self.capacidad
+        self._fechas[pos] = self._fechas[pos + self.capacidad] = fecha
+        self._temps[pos] = self._temps[pos + self.capacidad] = temp
+        self._n += 1
+        for motor in self._motores.values():
+            motor.entrar(fecha, temp)
+
+        limite = fecha - self.duracion                                  # Expulsamos por antiguedad (las lecturas de hace mas de duracion segundos)
+        while self._fechas[self._inicio] < limite:
+            self._expulsar()
+
+    # Funcion para añadir muchas lecturas ordenadas de golpe: solo se escriben las ultimas 'capacidad' lecturas, porque las
+    # anteriores se expulsarian de todas formas. Los motores que solo dependen del contenido de la ventana se descartan (se
+    # recrean cuando se pidan); los demas (como MotorCuantilAproximado) se conservan y reciben todas las lecturas
+    def extend(self, fechas, temps):
+        conservados = {clave: motor for clave, motor in self._motores.items() if not motor.de_ventana}
+        for motor in conservados.values():
+            for fecha, temp in zip(fechas, temps):
+                motor.entrar(fecha, _normalizar(temp))
+        self._motores = {}
+        for fecha, temp in zip(fechas[-self.capacidad:], temps[-self.capacidad:]):
+            self.append(fecha, temp)
+        self._motores.update(conservados)
+
+    def _expulsar(self):
+        for motor in self._motores.values():
+            motor.salir(self._fechas[self._inicio], _normalizar(self._temps[self._inicio]))
+        self._inicio = (self._inicio + 1) % self.capacidad
+        self._n -= 1
+
+    # Funcion para vaciar la ventana (los motores se descartan y se vuelven a crear cuando se pidan)
+    def clear(self):
+        self._inicio = 0
+        self._n = 0
+        self._motores = {}
+
+    # Funcion que devuelve una vista (sin copia) de las temperaturas de la ventana actual
+    def vista(self):
+        return VistaVentana(memoryview(self._temps)[self._inicio:self._inicio + self._n], self)
+
+    # Funcion que devuelve una vista (sin copia) de los timestamps de la ventana actual
+    def vista_fechas(self):
+        return VistaVentana(memoryview(self._fechas)[self._inicio:self._inicio + self._n])
+
+# Vista de solo lectura sobre un tramo de la ventana, se comporta como una lista (indices negativos, slices, len, sorted...)
+# Al no copiar los datos, refleja el estado de la ventana en el momento en que se obtuvo mientras no se sobrescriba el buffer
+# Si la vista abarca la ventana completa guarda la ventana de la que procede para que las estrategias usen sus motores incrementales
+# Las temperaturas sin decimales se devuelven enteras (_normalizar), como las recibio la ventana
+class VistaVentana(Sequence):
+    def __init__(self, datos, ventana=None):
+        self._datos = datos
+        self.ventana = ventana
+
+    def __len__(self):
+        return len(self._datos)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return VistaVentana(self._datos[i])
+        return _normalizar(self._datos[i])
+
+    def __iter__(self):
+        return map(_normalizar, self._datos)
+
+    def __eq__(self, other):
+        if isinstance(other, VistaVentana):
+            other = other._datos
+        elif not isinstance(other, Sequence):
+            return NotImplemented
+        return self._datos.tolist() == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+# Historial de todas las lecturas de un sensor guardado por columnas: timestamps en segundos (int64) y temperaturas
+# sin redondear (float64, las mismas que ve la ventana), 16 bytes por lectura frente a los mas de 150 de una tupla (str, int)
+# Las columnas se reparten en bloques de tamaño fijo reservados de antemano (cada uno el doble que el anterior hasta
+# TAM_BLOQUE_MAX), asi los datos ya escritos nunca se mueven de sitio y se pueden consultar sin copiarlos
+class HistorialColumnar:
+    TAM_BLOQUE_MIN = 16
+    TAM_BLOQUE_MAX = 65536
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return self._n
+
+    # Funcion para vaciar el historial
+    def clear(self):
+        self._fechas = []                                               # Bloques de timestamps
+        self._temps = []                                                # Bloques de temperaturas
+        self._inicios = []                                              # Indice global de la primera lectura de cada bloque
+        self._n = 0                                                     # Numero de lecturas del historial
+        self._libres = 0                                                # Posiciones libres en el ultimo bloque
+
+    # Funcion para añadir una lectura al final del historial
+    def append(self, fecha, temp):
+        if not self._libres:
+            tam = min(self.TAM_BLOQUE_MIN << len(self._fechas), self.TAM_BLOQUE_MAX)
+            self._fechas.append(array('q', bytes(8 * tam)))
+            self._temps.append(array('d', bytes(8 * tam)))
+            self._inicios.append(self._n)
+            self._libres = tam
+        pos = self._n - self._inicios[-1]
+        self._fechas[-1][pos] = fecha
+        self._temps[-1][pos] = temp
+        self._n += 1
+        self._libres -= 1
+
+    # Funcion para añadir muchas lecturas de golpe rellenando los bloques por tramos
+    def extend(self, fechas, temps):
+        fechas = array('q', fechas)
+        temps = array('d', temps)
+        hechas = 0
+        while hechas < len(fechas):
+            if not self._libres:
+                self.append(fechas[hechas], temps[hechas])
+                hechas += 1
+                continue
+            cuantas = min(self._libres, len(fechas) - hechas)
+            pos = self._n - self._inicios[-1]
+            self._fechas[-1][pos:pos + cuantas] = fechas[hechas:hechas + cuantas]
+            self._temps[-1][pos:pos + cuantas] = temps[hechas:hechas + cuantas]
+            self._n += cuantas
+            self._libres -= cuantas
+            hechas += cuantas
+
+    # Funcion que devuelve el bloque y la posicion dentro del bloque de la lectura i
+    def _localizar(self, i):
+        bloque = bisect_right(self._inicios, i) - 1
+        return bloque, i - self._inicios[bloque]
+
+    # Funcion que devuelve el indice de la primera lectura con timestamp >= segundos (o len si no hay ninguna), en O(log n)
+    def buscar(self, segundos):
+        if not self._n:
+            return 0
+        bloque = max(bisect_left(self._fechas, segundos, key=lambda fechas: fechas[0]) - 1, 0)
+        fin = self._inicios[bloque + 1] if bloque + 1 < len(self._inicios) else self._n
+        return self._inicios[bloque] + bisect_left(self._fechas[bloque], segundos, 0, fin - self._inicios[bloque])
+
+    # Funcion para descartar las lecturas [0, i) (por ejemplo las que ya estan en los agregados): se quitan los bloques
+    # enteros y se recorta el primero que queda. Los indices de las lecturas que quedan empiezan de nuevo en 0, asi que
+    # las vistas creadas antes dejan de ser validas
+    def descartar(self, i):
+        if i >= self._n:
+            self.clear()
+            return
+        if i <= 0:
+            return
+        bloque, pos = self._localizar(i)
+        self._fechas = self._fechas[bloque:]
+        self._temps = self._temps[bloque:]
+        self._fechas[0] = self._fechas[0][pos:]
+        self._temps[0] = self._temps[0][pos:]
+        self._inicios = [inicio - i for inicio in self._inicios[bloque:]]
+        self._inicios[0] = 0
+        self._n -= i
+
+    # Funcion que devuelve el timestamp en segundos de la lectura i
+    def fecha(self, i):
+        bloque, pos = self._localizar(i)
+        return self._fechas[bloque][pos]
+
+    # Funcion que devuelve la temperatura de la lectura i (entera si no tiene decimales)
+    def temp(self, i):
+        bloque, pos = self._localizar(i)
+        return _normalizar(self._temps[bloque][pos])
+
+    # Funcion que recorre las lecturas [inicio, fin) como pares (segundos, temperatura)
+    def recorrer(self, inicio=0, fin=None):
+        fin = self._n if fin is None else fin
+        while inicio < fin:
+            bloque, pos = self._localizar(inicio)
+            cuantas = min(fin - inicio, len(self._fechas[bloque]) - pos)
+            fechas, temps = self._fechas[bloque], self._temps[bloque]
+            for j in range(pos, pos + cuantas):
+                yield fechas[j], _normalizar(temps[j])
+            inicio += cuantas
+
+    # Funcion que recorre los tramos de las lecturas [inicio, fin) que estan en un mismo bloque, como pares de memoryviews
+    # (timestamps en segundos, temperaturas) sin copiar las columnas
+    def tramos(self, inicio=0, fin=None):
+        fin = self._n if fin is None else fin
+        while inicio < fin:
+            bloque, pos = self._localizar(inicio)
+            cuantas = min(fin - inicio, len(self._fechas[bloque]) - pos)
+            yield memoryview(self._fechas[bloque])[pos:pos + cuantas], memoryview(self._temps[bloque])[pos:pos + cuantas]
+            inicio += cuantas
+
+    # Funcion que devuelve una copia del historial que comparte sus bloques (solo se copian las listas de bloques, que son
+    # pocos). Es una instantanea porque lo ya escrito en un bloque nunca cambia: append y extend solo escriben mas alla de
+    # las lecturas actuales, y clear y descartar sustituyen los bloques en lugar de modificarlos
+    def instantanea(self):
+        copia = HistorialColumnar.__new__(HistorialColumnar)
+        copia._fechas = list(self._fechas)
+        copia._temps = list(self._temps)
+        copia._inicios = list(self._inicios)
+        copia._n = self._n
+        copia._libres = 0                                               # La copia no puede escribir en los bloques compartidos
+        return copia
+
+    # Funcion que devuelve una vista perezosa de todas las lecturas actuales como tuplas (fecha, t)
+    def vista(self):
+        return VistaHistorial(self, 0, self._n)
+
+    # Funcion que devuelve los bytes ocupados por las columnas
+    def memoria(self):
+        return sum(bloque.itemsize * len(bloque) for bloque in self._fechas + self._temps)
+
+# Vista perezosa de un tramo [inicio, fin) de un HistorialColumnar: se comporta como la lista de tuplas (fecha, t)
+# pero solo crea la tupla y formatea la fecha cuando se accede a cada elemento
+# Guarda una instantanea del historial, asi no cambia aunque despues se añadan, descarten o borren lecturas
+class VistaHistorial(Sequence):
+    def __init__(self, historial, inicio, fin):
+        self._historial = historial.instantanea()
+        self._inicio = inicio
+        self._fin = max(inicio, fin)                                    # Un rango invertido es una vista vacia, como en los slices
+
+    def __len__(self):
+        return self._fin - self._inicio
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            inicio, fin, paso = i.indices(len(self))
+            if paso != 1:
+                return [self[j] for j in range(inicio, fin, paso)]
+            return VistaHistorial(self._historial, self._inicio + inicio, self._inicio + max(inicio, fin))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('indice fuera del historial')
+        return (segundos_a_fecha(self._historial.fecha(self._inicio + i)), self._historial.temp(self._inicio + i))
+
+    def __iter__(self):
+        for fecha, temp in self._historial.recorrer(self._inicio, self._fin):
+            yield (segundos_a_fecha(fecha), temp)
+
+    # Funcion que recorre las lecturas de la vista por columnas, sin copiarlas: pares de memoryviews (segundos, temperaturas)
+    # de cada bloque del historial (por ejemplo para pasarlos a NumPy con np.frombuffer)
+    def tramos(self):
+        return self._historial.tramos(self._inicio, self._fin)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return f"VistaHistorial({len(self)} lecturas)"
+
+# Resumen de las lecturas de un intervalo que empieza en 'inicio' (segundos): numero de lecturas, media, desviacion tipica, minimo y maximo
+Agregado = namedtuple('Agregado', ['inicio', 'n', 'media', 'sd', 'minimo', 'maximo'])
+
+# Acumulado (n, suma, suma de cuadrados, minimo, maximo) convertido en Agregado
+def _agregado(inicio, n, suma, suma2, minimo, maximo):
+    media = suma / n
+    return Agregado(inicio, n, media, sqrt(max(suma2 / n - media * media, 0)), minimo, maximo)
+
+# Un nivel de agregados de un sensor: una fila (n, suma, suma de cuadrados, minimo, maximo) por cada intervalo de 'resolucion'
+# segundos con lecturas, guardadas por columnas. Las lecturas llegan en orden, asi que casi siempre se actualiza la ultima fila
+class NivelAgregado:
+    def __init__(self, resolucion):
+        self.resolucion = resolucion
+        self.inicios = array('q')                                       # Inicio de cada intervalo (multiplo de la resolucion)
+        self.n = array('q')
+        self.suma = array('d')
+        self.suma2 = array('d')
+        self.minimo = array('d')
+        self.maximo = array('d')
+
+    def __len__(self):
+        return len(self.inicios)
+
+    def append(self, fecha, temp):
+        inicio = fecha - fecha % self.resolucion
+        if self.inicios and self.inicios[-1] == inicio:
+            i = len(self.inicios) - 1
+        else:
+            i = bisect_left(self.inicios, inicio)
+            if i == len(self.inicios) or self.inicios[i] != inicio:     # Intervalo nuevo (al final salvo lecturas desordenadas)
+                self.inicios.insert(i, inicio)
+                self.n.insert(i, 0)
+                self.suma.insert(i, 0.0)
+                self.suma2.insert(i, 0.0)
+                self.minimo.insert(i, temp)
+                self.maximo.insert(i, temp)
+        self.n[i] += 1
+        self.suma[i] += temp
+        self.suma2[i] += temp * temp
+        if temp < self.minimo[i]:
+            self.minimo[i] = temp
+        if temp > self.maximo[i]:
+            self.maximo[i] = temp
+
+    # Funcion que devuelve las posiciones [i, j) de los intervalos que empiezan en [inicio, fin)
+    def tramo(self, inicio, fin):
+        return bisect_left(self.inicios, inicio), bisect_left(self.inicios, fin)
+
+# Agregados de un sensor a varias resoluciones (por defecto 1 minuto, 1 hora y 1 dia), actualizados con cada lectura
+# Permiten responder consultas de rangos largos sin recorrer todas las lecturas, y descartar las lecturas antiguas
+# del historial (compactar) conservando sus agregados
+class AgregadosTemporales:
+    def __init__(self, resoluciones=(60, 3600, 86400)):
+        self.niveles = [NivelAgregado(resolucion) for resolucion in sorted(resoluciones)]   # De la resolucion mas fina a la mas gruesa
+        self.compactado = None                                          # Antes de este instante solo quedan los agregados
+
+    def append(self, fecha, temp):
+        for nivel in self.niveles:
+            nivel.append(fecha, temp)
+
+    def clear(self):
+        self.__init__([nivel.resolucion for nivel in self.niveles])
+
+    # Funcion que devuelve el resumen de las lecturas en [inicio, fin) (o None si no hay ninguna)
+    # Cada parte del rango se responde con el nivel mas grueso cuyos intervalos caben enteros y los bordes con los niveles
+    # mas finos y, al final, con las lecturas del historial. En la parte compactada los bordes se responden con el nivel
+    # mas fino, contando los intervalos que empiezan dentro del rango
+    def resumen(self, historial, inicio, fin):
+        acumulado = [0, 0.0, 0.0, float('inf'), float('-inf')]
+        self._acumular(len(self.niveles) - 1, historial, inicio, fin, acumulado)
+        return _agregado(inicio, *acumulado) if acumulado[0] else None
+
+    def _acumular(self, nivel, historial, inicio, fin, acumulado):
+        if inicio >= fin:
+            return
+        if nivel < 0:                                                   # Bordes mas finos que cualquier nivel
+            corte = inicio if self.compactado is None else max(inicio, self.compactado)
+            if corte > inicio:
+                self._acumular_nivel(self.niveles[0], inicio, min(fin, corte), acumulado)
+            if corte < fin:
+                for _, temp in historial.recorrer(historial.buscar(corte), historial.buscar(fin)):
+                    self._sumar(acumulado, 1, temp, temp * temp, temp, temp)
+            return
+        resolucion = self.niveles[nivel].resolucion
+        a = -(-inicio // resolucion) * resolucion                       # Primer intervalo entero dentro del rango
+        b = fin // resolucion * resolucion
+        if a >= b:
+            self._acumular(nivel - 1, historial, inicio, fin, acumulado)
+            return
+        self._acumular_nivel(self.niveles[nivel], a, b, acumulado)
+        self._acumular(nivel - 1, historial, inicio, a, acumulado)
+        self._acumular(nivel - 1, historial, b, fin, acumulado)
+
+    def _acumular_nivel(self, nivel, inicio, fin, acumulado):
+        i, j = nivel.tramo(inicio, fin)
+        if i < j:
+            self._sumar(acumulado, sum(nivel.n[i:j]), sum(nivel.suma[i:j]), sum(nivel.suma2[i:j]), min(nivel.minimo[i:j]), max(nivel.maximo[i:j]))
+
+    @staticmethod
+    def _sumar(acumulado, n, suma, suma2, minimo, maximo):
+        acumulado[0] += n
+        acumulado[1] += suma
+        acumulado[2] += suma2
+        if minimo < acumulado[3]:
+            acumulado[3] = minimo
+        if maximo > acumulado[4]:
+            acumulado[4] = maximo
+
+    # Funcion que devuelve la serie de Agregados de [inicio, fin) con intervalos de 'resolucion' segundos (por ejemplo el
+    # maximo de cada dia del ultimo mes), a partir del nivel mas grueso cuya resolucion divide a la pedida
+    # Los intervalos se alinean a la resolucion y cada uno reune las filas de ese nivel que empiezan dentro del rango
+    def serie(self, historial, inicio, fin, resolucion):
+        niveles = [nivel for nivel in self.niveles if resolucion % nivel.resolucion == 0]
+        if not niveles:
+            raise ValueError(f"La resolucion {resolucion} no es multiplo de ninguna de {[n.resolucion for n in self.niveles]}")
+        nivel = niveles[-1]
+        i, j = nivel.tramo(inicio - inicio % nivel.resolucion, fin)
+        resultado = []
+        actual, acumulado = None, None
+        for k in range(i, j):
+            intervalo = nivel.inicios[k] - nivel.inicios[k] % resolucion
+            if intervalo != actual:
+                if acumulado is not None:
+                    resultado.append(_agregado(actual, *acumulado))
+                actual, acumulado = intervalo, [0, 0.0, 0.0, float('inf'), float('-inf')]
+            self._sumar(acumulado, nivel.n[k], nivel.suma[k], nivel.suma2[k], nivel.minimo[k], nivel.maximo[k])
+        if acumulado is not None:
+            resultado.append(_agregado(actual, *acumulado))
+        return resultado
+
+# Registro persistente de las lecturas: un fichero binario de solo añadir con registros de tamaño fijo escrito a traves de mmap
+# La cabecera guarda cuantos registros estan confirmados y solo se actualiza al sincronizar (cada 'cada' lecturas o cada
+# 'intervalo' segundos), asi un registro a medio escribir tras una caida se ignora al volver a abrir el fichero
+# Los nombres de los sensores se guardan aparte (en ruta + '.sensores', cada uno precedido de su longitud en bytes, asi
+# un nombre puede contener saltos de linea) y cada registro guarda su indice
+class RegistroLecturas:
+    MAGIA = b'PCDLOG01'
+    CABECERA = struct.Struct('<8sQ')                                    # Magia y numero de registros confirmados
+    REGISTRO = struct.Struct('<qdi')                                    # Timestamp en segundos, temperatura e indice del sensor
+    LONGITUD = struct.Struct('<I')                                      # Longitud en bytes del nombre UTF-8 de un sensor
+
+    def __init__(self, ruta, cada=100, intervalo=1.0, bloque=65536):
+        self.ruta = ruta
+        self.cada = cada                                                # Lecturas entre cada sincronizacion con el disco
+        self.intervalo = intervalo                                      # Segundos maximos entre sincronizaciones
+        self.bloque = bloque                                            # Registros en los que crece el fichero cada vez que se llena
+        nuevo = not os.path.exists(ruta) or os.path.getsize(ruta) < self.CABECERA.size
+        self._fichero = open(ruta, 'w+b' if nuevo else 'r+b')
+        if nuevo:
+            self._fichero.write(self.CABECERA.pack(self.MAGIA, 0))
+            self._fichero.truncate(self.CABECERA.size + self.bloque * self.REGISTRO.size)
+        self._mapa = mmap.mmap(self._fichero.fileno(), 0)
+        magia, self._n = self.CABECERA.unpack_from(self._mapa, 0)
+        if magia != self.MAGIA:
+            self.cerrar()
+            raise ErrorRegistro(f"{ruta} no es un registro de lecturas")
+
+        self._nombres = self._leer_nombres(ruta + '.sensores')          # Nombre de cada indice de sensor
+        self._indices = {nombre: i for i, nombre in enumerate(self._nombres)}
+        self._pendientes = 0
+        self._ultima_sincronizacion = time.monotonic()
+
+    def __len__(self):
+        return self._n
+
+    # Funcion para añadir una lectura al registro
+    def append(self, sensor, fecha, temp):
+        indice = self._indices.get(sensor)
+        if indice is None:
+            indice = self._nuevo_sensor(sensor)
+        pos = self.CABECERA.size + self._n * self.REGISTRO.size
+        if pos + self.REGISTRO.size > len(self._mapa):
+            self._ampliar()
+        self.REGISTRO.pack_into(self._mapa, pos, fecha, temp, indice)
+        self._n += 1
+        self._pendientes += 1
+        if self._pendientes >= self.cada or time.monotonic() - self._ultima_sincronizacion >= self.intervalo:
+            self.sincronizar()
+
+    # Funcion que lee los nombres de los sensores; un nombre a medio escribir tras una caida se ignora
+    @classmethod
+    def _leer_nombres(cls, ruta):
+        if not os.path.exists(ruta):
+            return []
+        with open(ruta, 'rb') as f:
+            datos = f.read()
+        nombres, pos = [], 0
+        while pos + cls.LONGITUD.size <= len(datos):
+            longitud, = cls.LONGITUD.unpack_from(datos, pos)
+            pos += cls.LONGITUD.size
+            if pos + longitud > len(datos):
+                break
+            nombres.append(datos[pos:pos + longitud].decode('utf-8'))
+            pos += longitud
+        return nombres
+
+    def _nuevo_sensor(self, sensor):
+        nombre = str(sensor).encode('utf-8')
+        with open(self.ruta + '.sensores', 'ab') as f:
+            f.write(self.LONGITUD.pack(len(nombre)) + nombre)
+            f.flush()
+            os.fsync(f.fileno())
+        self._indices[sensor] = len(self._nombres)
+        self._nombres.append(str(sensor))
+        return self._indices[sensor]
+
+    def _ampliar(self):
+        self._mapa.flush()
+        self._mapa.close()
+        self._fichero.truncate(self.CABECERA.size + (self._n + self.bloque) * self.REGISTRO.size)
+        self._mapa = mmap.mmap(self._fichero.fileno(), 0)
+
+    # Funcion que confirma en la cabecera las lecturas escritas y las lleva a disco
+    def sincronizar(self):
+        self.CABECERA.pack_into(self._mapa, 0, self.MAGIA, self._n)
+        self._mapa.flush()
+        self._pendientes = 0
+        self._ultima_sincronizacion = time.monotonic()
+
+    # Funcion que sincroniza, recorta el espacio reservado sin usar y cierra el fichero
+    def cerrar(self):
+        if self._mapa.closed:
+            return
+        valido = self._mapa[:len(self.MAGIA)] == self.MAGIA
+        if valido:
+            self.sincronizar()
+        self._mapa.close()
+        if valido:
+            self._fichero.truncate(self.CABECERA.size + self._n * self.REGISTRO.size)
+        self._fichero.close()
+
+    # Funcion que recorre los registros [inicio, fin) como tuplas (sensor, segundos, temperatura) leyendo por bloques
+    def leer(self, inicio=0, fin=None):
+        fin = self._n if fin is None else fin
+        while inicio < fin:
+            cuantos = min(fin - inicio, self.bloque)
+            pos = self.CABECERA.size + inicio * self.REGISTRO.size
+            for fecha, temp, indice in self.REGISTRO.iter_unpack(self._mapa[pos:pos + cuantos * self.REGISTRO.size]):
+                yield self._nombres[indice], fecha, temp
+            inicio += cuantos
+
+    # Funcion que devuelve, para cada sensor, sus ultimas lecturas (como mucho 'capacidad') de los 'segundos' anteriores a su
+    # ultima lectura, en el orden del registro. Se recorre el registro hacia atras por bloques y se para cuando todos los
+    # sensores estan completos, asi un sensor que lleva tiempo sin medir tambien recupera su ventana aunque el registro no
+    # este en orden global de tiempo (las importaciones y los lotes escriben cada sensor por separado)
+    def colas(self, segundos, capacidad):
+        colas, limites, completos = {}, {}, set()
+        fin = self._n
+        while fin > 0 and len(completos) < len(self._nombres):
+            inicio = max(fin - self.bloque, 0)
+            datos = self._mapa[self.CABECERA.size + inicio * self.REGISTRO.size:self.CABECERA.size + fin * self.REGISTRO.size]
+            for fecha, temp, indice in reversed(list(self.REGISTRO.iter_unpack(datos))):
+                if indice in completos:
+                    continue
+                if indice not in limites:
+                    limites[indice], colas[indice] = fecha - segundos, []
+                if fecha < limites[indice]:                             # Las lecturas de cada sensor estan en orden de tiempo
+                    completos.add(indice)
+                    continue
+                colas[indice].append((fecha, temp))
+                if len(colas[indice]) == capacidad:
+                    completos.add(indice)
+            fin = inicio
+        return {self._nombres[indice]: lecturas[::-1] for indice, lecturas in colas.items()}
+
+# Motor incremental que sigue las lecturas que entran y salen de una VentanaTemporal
+# de_ventana indica si su estado solo depende del contenido actual de la ventana (y se puede reconstruir a partir de ella)
+class MotorIncremental(ABC):
+    de_ventana = True
+
+    @abstractmethod
+    def entrar(self, fecha, temp):
+        pass
+
+    @abstractmethod
+    def salir(self, fecha, temp):
+        pass
+
+# Media y desviacion tipica con el algoritmo de Welford, admitiendo tambien la eliminacion de la lectura mas antigua
+class MotorMediaSd(MotorIncremental):
+    def __init__(self):
+        self.n = 0
+        self.media = 0.0
+        self._m2 = 0.0                                                  # Suma de los cuadrados de las diferencias con la media
+
+    def entrar(self, fecha, temp):
+        self.n += 1
+        delta = temp - self.media
+        self.media += delta / self.n
+        self._m2 += delta * (temp - self.media)
+
+    def salir(self, fecha, temp):
+        if self.n == 1:
+            self.n = 0
+            self.media = self._m2 = 0.0
+            return
+        self.n -= 1
+        delta = temp - self.media
+        self.media -= delta / self.n
+        self._m2 = max(self._m2 - delta * (temp - self.media), 0.0)     # Evitamos valores negativos por errores de redondeo
+
+    def resultado(self):
+        return (self.media, sqrt(self._m2 / self.n))
+
+# Cuantiles sobre una lista ordenada que se mantiene con bisect: insertar y eliminar es O(log n) en la busqueda
+# y Q1, Mediana y Q3 se leen directamente por su posicion
+class MotorCuantil(MotorIncremental):
+    def __init__(self):
+        self.ordenada = []
+
+    def entrar(self, fecha, temp):
+        insort(self.ordenada, temp)
+
+    def salir(self, fecha, temp):
+        del self.ordenada[bisect_left(self.ordenada, temp)]
+
+    def resultado(self):
+        return cuantiles(self.ordenada)
+
+# Maximo y minimo con dos colas monotonas: cada lectura entra y sale como mucho una vez de cada cola (O(1) amortizado)
+class MotorMaxMin(MotorIncremental):
+    def __init__(self):
+        self._maximos = deque()                                         # Candidatos a maximo en orden no creciente
+        self._minimos = deque()                                         # Candidatos a minimo en orden no decreciente
+
+    def entrar(self, fecha, temp):
+        while self._maximos and self._maximos[-1] < temp:
+            self._maximos.pop()
+        self._maximos.append(temp)
+        while self._minimos and self._minimos[-1] > temp:
+            self._minimos.pop()
+        self._minimos.append(temp)
+
+    def salir(self, fecha, temp):
+        if self._maximos[0] == temp:
+            self._maximos.popleft()
+        if self._minimos[0] == temp:
+            self._minimos.popleft()
+
+    def resultado(self):
+        return (self._maximos[0], self._minimos[0])
+
+# Subida de temperatura en los ultimos 'segundos' segundos segun los timestamps reales: la ultima lectura menos el minimo
+# El minimo se obtiene de una cola monotona de (fecha, t), asi funciona con cualquier frecuencia de muestreo en O(1) amortizado
+# (si la ventana del sistema es mas corta que 'segundos', el motor solo ve lo que cabe en ella)
+class MotorAumento(MotorIncremental):
+    def __init__(self, segundos=30):
+        self.segundos = segundos
+        self.ultima = None                                              # Ultima temperatura recibida
+        self._minimos = deque()                                         # Candidatos a minimo (fecha, t) en orden no decreciente de t
+
+    # Las lecturas iguales se guardan todas (solo se descartan las mayores), asi cuando la ventana expulsa una lectura
+    # repetida salir quita exactamente esa y no la siguiente identica, que sigue dentro de la ventana
+    def entrar(self, fecha, temp):
+        while self._minimos and self._minimos[-1][1] > temp:
+            self._minimos.pop()
+        self._minimos.append((fecha, temp))
+        limite = fecha - self.segundos
+        while self._minimos[0][0] < limite:
+            self._minimos.popleft()
+        self.ultima = temp
+
+    def salir(self, fecha, temp):
+        if self._minimos and self._minimos[0] == (fecha, temp):
+            self._minimos.popleft()
+
+    def resultado(self):
+        return self.ultima - self._minimos[0][1]
+
+# Error en el rango de los cuantiles de un SketchKLL con parametro k (en el 99% de las consultas): ERROR_KLL / k
+ERROR_KLL = 1.33
+
+# Sketch KLL para cuantiles aproximados con memoria acotada: las lecturas entran en el nivel 0 y cuando un nivel se llena
+# se ordena y se sube al siguiente uno de cada dos elementos (empezando al azar por el primero o el segundo), que pasa a
+# pesar el doble. Los niveles altos tienen capacidad k y los bajos cada vez menos (factor c), asi el sketch ocupa O(k)
+# y el error en el rango de cada cuantil es del orden de 1/k. Dos sketches se pueden fusionar juntando sus niveles
+class SketchKLL:
+    def __init__(self, k=200, c=2 / 3, semilla=None):
+        self.k = k
+        self.c = c
+        self.n = 0                                                      # Lecturas resumidas (exacto)
+        self.niveles = [[]]                                             # El nivel h tiene peso 2**h
+        self._random = random.Random(semilla)
+        self._tam = 0
+        self._max_tam = self._capacidad(0)
+
+    def __len__(self):
+        return self._tam
+
+    def _capacidad(self, h):
+        return max(int(self.k * self.c ** (len(self.niveles) - h - 1)), 2)
+
+    def append(self, temp):
+        self.niveles[0].append(temp)
+        self.n += 1
+        self._tam += 1
+        if self._tam >= self._max_tam:
+            self._comprimir()
+
+    # Funcion que compacta los niveles llenos, de abajo a arriba, hasta que el sketch vuelve a caber en su tamaño maximo
+    def _comprimir(self):
+        h = 0
+        while h < len(self.niveles):
+            nivel = self.niveles[h]
+            if len(nivel) >= self._capacidad(h):
+                if h + 1 == len(self.niveles):
+                    self.niveles.append([])
+                nivel.sort()
+                resto = nivel.pop() if len(nivel) % 2 else None          # Con un numero impar uno se queda en el nivel
+                self.niveles[h + 1].extend(nivel[self._random.getrandbits(1)::2])
+                nivel.clear()
+                if resto is not None:
+                    nivel.append(resto)
+                self._tam = sum(map(len, self.niveles))
+                self._max_tam = sum(self._capacidad(i) for i in range(len(self.niveles)))
+                if self._tam < self._max_tam:
+                    return
+            h += 1
+
+    # Funcion para añadir a este sketch las lecturas resumidas en otro
+    def fusionar(self, otro):
+        while len(self.niveles) < len(otro.niveles):
+            self.niveles.append([])
+        for nivel, otro_nivel in zip(self.niveles, otro.niveles):
+            nivel.extend(otro_nivel)
+        self.n += otro.n
+        self._tam = sum(map(len, self.niveles))
+        self._max_tam = sum(self._capacidad(i) for i in range(len(self.niveles)))
+        while self._tam >= self._max_tam:
+            antes = self._tam
+            self._comprimir()
+            if self._tam == antes:
+                break
+
+    # Funcion que devuelve los cuantiles qs (entre 0 y 1) de las lecturas resumidas en uno o varios sketches, sin fusionarlos:
+    # se ordenan todos los elementos con su peso y se busca el primero cuyo peso acumulado llega a q por el total
+    @staticmethod
+    def cuantiles_de(sketches, qs):
+        valores, pesos = [], []
+        for sketch in sketches:
+            for h, nivel in enumerate(sketch.niveles):
+                valores += nivel
+                pesos += [1 << h] * len(nivel)
+        if not valores:
+            return None
+        orden = sorted(range(len(valores)), key=valores.__getitem__)
+        acumulados = list(itertools.accumulate(map(pesos.__getitem__, orden)))
+        return [valores[orden[min(bisect_left(acumulados, q * acumulados[-1]), len(orden) - 1)]] for q in qs]
+
+    def cuantiles(self, qs=(0.25, 0.5, 0.75)):
+        return SketchKLL.cuantiles_de((self,), qs)
+
+# Q1, mediana y Q3 aproximados de las lecturas de los ultimos 'duracion' segundos con memoria fija, para ventanas largas
+# Las lecturas se agrupan en cubetas de tiempo (por defecto 1/24 de la duracion), cada una con su SketchKLL, y caducan
+# por cubetas enteras, asi que el motor cubre entre 'duracion' y 'duracion' + 'cubeta' segundos. No depende de lo que
+# salga de la VentanaTemporal (solo de lo que entra), por lo que la duracion puede ser mayor que la de la ventana
+# Las cubetas cerradas se fusionan una sola vez, y el resultado se recalcula cuando las lecturas nuevas pueden haber
+# movido el rango de los cuantiles mas de la mitad del error (asi el error total queda por debajo de 1.5 veces el del sketch)
+class MotorCuantilAproximado(MotorIncremental):
+    de_ventana = False                                                  # Cubre mas lecturas de las que caben en la ventana
+
+    def __init__(self, duracion=86400, cubeta=None, k=200):
+        self.duracion = duracion
+        self.cubeta = cubeta or max(duracion // 24, 1)
+        self.k = k
+        self.error = ERROR_KLL / k                                      # Error aproximado en el rango (fraccion de las lecturas)
+        self._cubetas = deque()                                         # (inicio, SketchKLL) de cada cubeta con lecturas
+        self._cerradas = None                                           # Fusion de todas las cubetas menos la actual
+        self._resultado = None
+        self._nuevas = 0                                                # Lecturas desde que se calculo el resultado
+
+    def entrar(self, fecha, temp):
+        inicio = fecha - fecha % self.cubeta
+        if not self._cubetas or self._cubetas[-1][0] < inicio:          # Las lecturas desordenadas van a la cubeta actual
+            self._cubetas.append((inicio, SketchKLL(self.k)))
+            self._cerradas = None
+        limite = fecha - self.duracion
+        while self._cubetas[0][0] + self.cubeta <= limite:
+            self._cubetas.popleft()
+            self._cerradas = None
+        self._cubetas[-1][1].append(temp)
+        self._nuevas += 1
+
+    def salir(self, fecha, temp):
+        pass                                                            # Las lecturas caducan por cubetas enteras en entrar
+
+    # Funcion que devuelve un SketchKLL con todas las lecturas del motor (por ejemplo para fusionarlo con los de otros sensores)
+    def sketch(self):
+        total = SketchKLL(self.k)
+        for _, sketch in self._cubetas:
+            total.fusionar(sketch)
+        return total
+
+    def resultado(self):
+        if self._cerradas is None:
+            self._cerradas = SketchKLL(self.k)
+            for i in range(len(self._cubetas) - 1):
+                self._cerradas.fusionar(self._cubetas[i][1])
+            self._resultado = None
+        actual = self._cubetas[-1][1]
+        if self._resultado is None or self._nuevas > self.error * (self._cerradas.n + actual.n) / 2:
+            self._resultado = SketchKLL.cuantiles_de((self._cerradas, actual), (0.25, 0.5, 0.75))
+            self._nuevas = 0
+        return self._resultado
+
 # Observer con la funcion update
 class Observer(ABC):
     @abstractmethod
     def update(self, date_temp):
         pass
 
+# -----------------------
+# CALCULO POR LOTES (NumPy)
+# -----------------------
+# Tabla dispersa para consultar el maximo o el minimo (funcion = np.maximum / np.minimum) de cualquier tramo en O(1)
+def _tabla_dispersa(valores, funcion):
+    tabla = [valores]
+    paso = 1
+    while 2 * paso <= len(valores):
+        tabla.append(funcion(tabla[-1][:-paso], tabla[-1][paso:]))
+        paso *= 2
+    return tabla
+
+# Consulta vectorizada de la tabla dispersa para los tramos [inicios, fines] (ambos incluidos)
+def _consultar_tabla(tabla, inicios, fines, funcion):
+    niveles = np.floor(np.log2(fines - inicios + 1)).astype(np.int64)
+    resultado = np.empty(len(inicios), dtype=tabla[0].dtype)
+    for nivel in np.unique(niveles):
+        filas = niveles == nivel
+        resultado[filas] = funcion(tabla[nivel][inicios[filas]], tabla[nivel][fines[filas] - (1 << nivel) + 1])
+    return resultado
+
+# Cuantiles vectorizados: agrupa las ventanas por longitud para ordenarlas como una matriz (por bloques para limitar la memoria)
+def _cuantiles_lote(temps, inicios, fines, maximo_elementos=1 << 22):
+    resultado = np.empty((len(inicios), 3))
+    longitudes = fines - inicios + 1
+    for n in np.unique(longitudes):
+        filas = np.flatnonzero(longitudes == n)
+        desplazamientos = np.arange(n)
+        for i in range(0, len(filas), max(1, maximo_elementos // n)):
+            bloque = filas[i:i + max(1, maximo_elementos // n)]
+            ordenadas = np.sort(temps[inicios[bloque, None] + desplazamientos], axis=1)
+            for columna, posicion in enumerate((n//4, n//2, 3*n//4)):
+                resultado[bloque, columna] = ordenadas[:, posicion] if n%2 != 0 else (ordenadas[:, posicion-1] + ordenadas[:, posicion])/2
+    return resultado
+
+# Calcula para cada lectura a partir de 'desde' los mismos resultados que la cadena lectura a lectura:
+# estadisticos de la ventana (duracion y capacidad), si supera el umbral y si ha aumentado mas de 'incremento' en 'segundos'
+# fechas tiene que estar ordenado y las lecturas anteriores a 'desde' son el contenido previo de la ventana
+# Si no hay lecturas nuevas devuelve los mismos arrays vacios
+def estadisticos_lote(fechas, temps, desde=0, duracion=60, capacidad=128, umbral=28, segundos=30, incremento=10):
+    if len(temps) <= desde:
+        vacio, ninguno = np.empty(0, dtype=np.float64), np.empty(0, dtype=bool)
+        return {'media': vacio, 'sd': vacio, 'q1': vacio, 'mediana': vacio, 'q3': vacio,
+                'maximo': vacio, 'minimo': vacio, 'umbral': ninguno, 'aumento': ninguno}
+    indices = np.arange(desde, len(temps))
+    inicios = np.maximum(np.searchsorted(fechas, fechas[indices] - duracion, 'left'), indices - capacidad + 1)
+    n = indices - inicios + 1
+
+    # Media y desviacion tipica con sumas acumuladas (desplazadas para reducir errores de redondeo)
+    desplazadas = temps - temps[0]
+    sumas = np.concatenate(([0.0], np.cumsum(desplazadas)))
+    cuadrados = np.concatenate(([0.0], np.cumsum(desplazadas * desplazadas)))
+    media = (sumas[indices + 1] - sumas[inicios]) / n
+    varianza = np.maximum((cuadrados[indices + 1] - cuadrados[inicios]) / n - media * media, 0.0)
+
+    maximos = _tabla_dispersa(temps, np.maximum)
+    minimos = _tabla_dispersa(temps, np.minimum)
+    q = _cuantiles_lote(temps, inicios, indices)
+    inicios_aumento = np.maximum(np.searchsorted(fechas, fechas[indices] - segundos, 'left'), inicios)
+    subida = temps[indices] - _consultar_tabla(minimos, inicios_aumento, indices, np.minimum)
+    return {'media': media + temps[0], 'sd': np.sqrt(varianza),
+            'q1': q[:, 0], 'mediana': q[:, 1], 'q3': q[:, 2],
+            'maximo': _consultar_tabla(maximos, inicios, indices, np.maximum),
+            'minimo': _consultar_tabla(minimos, inicios, indices, np.minimum),
+            'umbral': temps[indices] > umbral,
+            'aumento': subida > incremento}
+
+# Clave de un estadistico en la cache de consultas: su clase y sus parametros (por ejemplo StrategyCuantil(aproximado=True)
+# creada en cada consulta comparte los resultados). Si algun parametro no se puede usar como clave se usa la instancia
+def _clave_estadistico(estadistico):
+    clave = (type(estadistico), tuple(sorted(vars(estadistico).items())))
+    try:
+        hash(clave)
+    except TypeError:
+        return estadistico
+    return clave
+
+# Estado de un sensor leido de forma consistente con SistemaIoT.instantanea: la version del sensor, su fecha, una copia de
+# la ventana de temperaturas y una vista inmutable de su historial
+Instantanea = namedtuple('Instantanea', ['sensor', 'version', 'date', 'temp', 'date_temp'])
+
+# Estado que el sistema guarda de cada sensor: su ventana temporal, el historial de todas sus lecturas, sus agregados
+# y la fecha de su ultima lectura
+class EstadoSensor:
+    def __init__(self, duracion=60, capacidad=128, resoluciones=(60, 3600, 86400)):
+        self.ventana = VentanaTemporal(duracion, capacidad)
+        self.historial = HistorialColumnar()
+        self.agregados = AgregadosTemporales(resoluciones)
+        self.date = ''
+        self.version = 0                                                # Contador de escrituras (seqlock): impar mientras se modifica el estado
+
 # R1 
 # Se trata de un Singleton para que gestione todos los componentes y recursos del entorno en unica instancia
 # En este caso tambien, es el operador del observer para que reciba las actualizaciones de datos a tiempo real
 class SistemaIoT(Observer):
     __instance = None                                                           # Inicializamos la unica instancia a None
     
-    def __init__(self, manager_chain):
+    def __init__(self, manager_chain, duracion=60, capacidad=128, tam_cache=1024, resoluciones=(60, 3600, 86400)):
         if SistemaIoT.__instance != None:                                       # Solo puede haber una instancia
             print('No puede haber mas de una instancia del sistema')
             raise ErrorInstancia
         else:
             self.manager_chain = manager_chain                                  # Variable que habra que indicar al inicializar el sistema para indicar el manejador que empiza el chain responsability
-            self.date_temp = []                                                 # Variable para almacenar cada tupla (timestamp, t) nueva
-            self.date = ''                                                      # Variable para indicar cada timestamp de date_temp
-            self.temp = []                                                      # Variable para almacenar cada t de date_temp
+            self.duracion = duracion                                            # Segundos de la ventana temporal de cada sensor
+            self.capacidad = capacidad                                          # Capacidad de la ventana temporal de cada sensor
+            self.resoluciones = resoluciones                                    # Resoluciones en segundos de los agregados de cada sensor
+            self._sensores = {}                                                 # Estado de cada sensor indexado por su nombre (busqueda en O(1) por lectura)
+            self._actual = SENSOR_POR_DEFECTO                                   # Sensor de la ultima lectura recibida
+            self.registro = None                                                # RegistroLecturas donde se guardan las lecturas (opcional)
+            self.metricas = None                                                # Metricas de latencia (opcional)
+            self.tam_cache = tam_cache                                          # Numero maximo de resultados en la cache de consultas
+            self._cache = OrderedDict()                                         # (sensor, ventana, clase y parametros del estadistico) -> (version del sensor, resultado)
+            self._vacio = EstadoSensor(duracion, capacidad, resoluciones)       # Estado que se lee de los sensores sin lecturas (nunca se escribe)
     
     # Metodo de clase para obtener la instancia en la que se debe definir un manager_chain
     @classmethod
@@ -105,29 +1497,317 @@ class SistemaIoT(Observer):
                 raise ErrorNone
             cls.__instance = cls(manager_chain)
         return cls.__instance
-    
-    # Funcion que va actualizando cada lista cuando recibe una tupla (timestamp, t)(=date_temp) nueva
+
+    # Funcion para guardar las lecturas en un RegistroLecturas y, si se indica, recuperar las ventanas de los sensores
+    # a partir de las ultimas lecturas del registro (solo se leen los ultimos 'duracion' segundos, no todo el historial)
+    def set_registro(self, registro, restaurar=True):
+        self.registro = registro
+        if restaurar:
+            for sensor, lecturas in registro.colas(self.duracion, self.capacidad).items():
+                estado = self._estado(sensor)
+                estado.version += 1
+                for segundos, t in lecturas:
+                    estado.ventana.append(segundos, t)
+                estado.date = segundos_a_fecha(segundos)
+                estado.version += 1
+
+    # Funcion para obtener el estado de un sensor (si es None el de la ultima lectura), creandolo si es la primera vez que aparece
+    # Solo se usa al escribir (lecturas nuevas, registro y setters); las consultas usan _leer_estado o _estado_existente
+    def _estado(self, sensor=None):
+        if sensor is None:
+            sensor = self._actual
+        estado = self._sensores.get(sensor)
+        if estado is None:
+            estado = self._sensores[sensor] = EstadoSensor(self.duracion, self.capacidad, self.resoluciones)
+        return estado
+
+    # Funcion para leer el estado de un sensor sin crearlo: si no tiene lecturas se lee un estado vacio, asi las consultas
+    # de sensores que no existen (o desde otros hilos) no añaden sensores al sistema
+    def _leer_estado(self, sensor=None):
+        estado = self._sensores.get(self._actual if sensor is None else sensor)
+        return self._vacio if estado is None else estado
+
+    # Funcion para obtener el estado de un sensor con lecturas, lanza ErrorNone si no existe
+    def _estado_existente(self, sensor=None):
+        if sensor is None:
+            sensor = self._actual
+        estado = self._sensores.get(sensor)
+        if estado is None:
+            raise ErrorNone(f"No hay lecturas del sensor {sensor!r}")
+        return estado
+
+    # date, date_temp y temp se refieren al sensor de la ultima lectura recibida
+    @property
+    def date(self):
+        return self._leer_estado().date
+
+    @date.setter
+    def date(self, date):
+        estado = self._estado()
+        estado.version += 1
+        estado.date = date
+        estado.version += 1
+
+    # Las tuplas se guardan en el historial por columnas y se devuelven como una vista perezosa
+    @property
+    def date_temp(self):
+        return self._leer_estado().historial.vista()
+
+    # Permite cargar directamente el historial a partir de una lista de tuplas (timestamp, t)
+    @date_temp.setter
+    def date_temp(self, date_temp):
+        estado = self._estado()
+        estado.version += 1
+        estado.historial.clear()
+        estado.agregados.clear()
+        for date, t in date_temp:
+            segundos = fecha_a_segundos(date)
+            estado.historial.append(segundos, t)
+            estado.agregados.append(segundos, t)
+        estado.version += 1
+
+    # Las t se guardan en la ventana temporal, que ya se encarga de descartar las antiguas
+    @property
+    def temp(self):
+        return self._leer_estado().ventana.vista()
+
+    # Permite cargar directamente las t de la ventana, se les asigna la fecha actual del sistema
+    @temp.setter
+    def temp(self, temps):
+        estado = self._estado()
+        segundos = fecha_a_segundos(estado.date) if estado.date else 0
+        estado.version += 1
+        estado.ventana.clear()
+        for t in temps:
+            estado.ventana.append(segundos, t)
+        estado.version += 1
+
+    # Funcion que va actualizando el estado del sensor cuando recibe una tupla (timestamp, t, sensor, instante)(=date_temp) nueva
+    # Si la tupla no trae el nombre del sensor (timestamp, t) la lectura se asigna al SENSOR_POR_DEFECTO
+    # Devuelve lo que devuelva el primer manejador de la cadena
     def update(self, date_temp):
-        self.date = date_temp[0]                                                # En el primer elemento de la tupla se encuentra la fecha
-        self.temp.append(date_temp[1])                                          # En el segundo elemento de la tupla se encuentra la temperatura
-        self.date_temp.append(date_temp)                                        # Añadimos cada tupla a la lista vacia por si queremos obtener todos los datos en algun momento
-        self.manager_chain.manejar_date_temp(self.date, self.temp)              # Empezamos a manejar estos datos (las listas date y temp por separado) para la obtencion del resultado del manejador que hemos inicializado en el SistemaIoT
+        sensor = date_temp[2] if len(date_temp) > 2 else SENSOR_POR_DEFECTO
+        date = date_temp[0]                                                     # En el primer elemento de la tupla se encuentra la fecha
+        result = self._registrar(sensor, fecha_a_segundos(date), date, date_temp[1])   # En el segundo elemento de la tupla se encuentra la temperatura
+        if self.metricas is not None and len(date_temp) > 3:
+            self.metricas.extremo_a_extremo.registrar(time.perf_counter_ns() - date_temp[3])
+        return result
+
+    # Funcion que guarda una lectura del sensor (con la fecha en segundos y como texto) y la pasa por la cadena
+    # Mientras se modifica el estado su version es impar, para que los lectores de otros hilos (instantanea) lo sepan
+    def _registrar(self, sensor, segundos, date, t):
+        self._actual = sensor
+        estado = self._estado()
+        estado.version += 1                                                     # Los resultados guardados en la cache para este sensor dejan de valer
+        estado.date = date
+        estado.ventana.append(segundos, t)
+        estado.historial.append(segundos, t)                                    # Añadimos cada lectura al historial del sensor por si queremos obtener todos los datos en algun momento
+        estado.agregados.append(segundos, t)                                    # Y a sus agregados por minuto, hora y dia
+        estado.version += 1
+        if self.registro is not None:
+            self.registro.append(sensor, segundos, t)                           # Y al registro en disco para no perderla al reiniciar
+        return self.manager_chain.manejar_date_temp(date, estado.ventana.vista())   # Empezamos a manejar estos datos (date y la ventana de temp del sensor) para la obtencion del resultado del manejador que hemos inicializado en el SistemaIoT
     
-    # Funcion para obtener todas las tuplas generadas
-    def get_date_temp(self):
-        return self.date_temp
+    # Funcion que pasa por la cadena varias lecturas ordenadas de un sensor (fechas en segundos), por ejemplo las de una trama
+    # recibida por la red; la fecha como texto solo se calcula cuando cambia. Devuelve el resultado de la ultima lectura
+    def update_lecturas(self, sensor, fechas, temps):
+        result = None
+        ultima, date = None, ''
+        for segundos, t in zip(fechas, temps):
+            if segundos != ultima:
+                ultima, date = segundos, segundos_a_fecha(segundos)
+            result = self._registrar(sensor, segundos, date, t)
+        return result
+
+    # Funcion para activar (o desactivar con None) la medida de latencias de la cadena y de extremo a extremo
+    def instrumentar(self, metricas):
+        if isinstance(self.manager_chain, Manejador):
+            self.manager_chain.desinstrumentar()
+            if metricas is not None:
+                self.manager_chain.instrumentar(metricas)
+        self.metricas = metricas
+
+    # Ingesta por lotes (necesita NumPy) de lecturas ordenadas por timestamp de un sensor: se guardan todas de golpe y se
+    # devuelve un diccionario de arrays con lo que calcularia la cadena lectura a lectura (media, sd, q1, mediana, q3,
+    # maximo, minimo y si se supera el umbral o el aumento), sin pasar cada lectura por los manejadores
+    def update_batch(self, fechas, temps, sensor=SENSOR_POR_DEFECTO):
+        if np is None:
+            raise ImportError("SistemaIoT.update_batch necesita NumPy")
+        fechas = np.asarray(fechas, dtype=np.int64)
+        temps = np.asarray(temps, dtype=np.float64)
+        if not len(fechas):                                                     # Un lote vacio no crea ni modifica el sensor
+            return estadisticos_lote(fechas, temps)
+        self._actual = sensor
+        estado = self._estado()
+        previas = len(estado.ventana)
+        resultado = estadisticos_lote(np.concatenate((np.array(estado.ventana.vista_fechas(), dtype=np.int64), fechas)),
+                                      np.concatenate((np.array(estado.ventana.vista(), dtype=np.float64), temps)),
+                                      previas, self.duracion, self.capacidad, **self._parametros_cadena())
+
+        lista_fechas, lista_temps = fechas.tolist(), temps.tolist()
+        estado.version += 1
+        estado.ventana.extend(lista_fechas, lista_temps)
+        estado.historial.extend(lista_fechas, lista_temps)
+        for segundos, t in zip(lista_fechas, lista_temps):
+            estado.agregados.append(segundos, t)
+        if self.registro is not None:
+            for segundos, t in zip(lista_fechas, lista_temps):
+                self.registro.append(sensor, segundos, t)
+        if lista_fechas:
+            estado.date = segundos_a_fecha(lista_fechas[-1])
+        estado.version += 1
+        return resultado
+
+    # Funcion que recorre la cadena para obtener los parametros de Umbral y Aumento que usara el calculo por lotes
+    def _parametros_cadena(self):
+        parametros = {}
+        manejador = self.manager_chain
+        while isinstance(manejador, Manejador):
+            if isinstance(manejador, Umbral):
+                parametros['umbral'] = manejador.umbral
+            elif isinstance(manejador, Aumento):
+                parametros['segundos'] = manejador.segundos
+                parametros['incremento'] = manejador.incremento
+            manejador = manejador.sucesor
+        return parametros
+
+    # Funcion para obtener todas las tuplas generadas (por defecto del sensor de la ultima lectura)
+    def get_date_temp(self, sensor=None):
+        return self._leer_estado(sensor).historial.vista()
     
+    # Funcion para obtener las lecturas con fecha en [start, end) (como texto o en segundos) como una vista del historial
+    # Se buscan los extremos por busqueda binaria en los timestamps, O(log n), y la vista no copia las lecturas
+    def get_range(self, start, end, sensor=None):
+        historial = self._leer_estado(sensor).historial
+        return VistaHistorial(historial, historial.buscar(_a_segundos(start)), historial.buscar(_a_segundos(end)))
+
+    # Funcion para obtener las ultimas n lecturas como una vista del historial
+    def get_latest(self, n, sensor=None):
+        if n < 0:
+            raise ValueError(f"El numero de lecturas no puede ser negativo: {n}")
+        historial = self._leer_estado(sensor).historial
+        return VistaHistorial(historial, max(len(historial) - n, 0), len(historial))
+
     # Funcion para obtener la fecha actual
-    def get_date(self):
-        return self.date
+    def get_date(self, sensor=None):
+        return self._leer_estado(sensor).date
     
-    # Funcion para obtener todas las temperaturas generadas
-    def get_temp(self):
-        return self.temp
+    # Funcion para obtener las temperaturas de la ventana actual
+    # Es una vista sin copia que sigue a la ventana (la usan las estrategias); desde otro hilo hay que usar instantanea
+    def get_temp(self, sensor=None):
+        return self._leer_estado(sensor).ventana.vista()
+
+    # Funcion para obtener los nombres de todos los sensores que han enviado lecturas
+    def get_sensores(self):
+        return list(self._sensores)
+
+    # Consulta bajo demanda de un estadistico (una Strategy, por ejemplo StrategyMeanSd()) de un sensor
+    # Sin ventana se calcula sobre la ventana temporal del sensor (con sus motores incrementales); con una ventana en segundos
+    # se calcula sobre las lecturas del historial de los ultimos 'ventana' segundos
+    # Los resultados se guardan en una cache LRU por (sensor, ventana, estadistico) junto con la version del sensor, que
+    # aumenta con cada lectura: mientras no llegue otra lectura, repetir la consulta es O(1). El estadistico se identifica
+    # por su clase y sus parametros, asi se puede crear uno nuevo en cada consulta
+    def consultar_estadistico(self, sensor, estadistico, ventana=None):
+        estado = self._estado_existente(sensor)
+        clave = (sensor, ventana, _clave_estadistico(estadistico))
+        guardado = self._cache.get(clave)
+        if guardado is not None and guardado[0] == estado.version:
+            self._cache.move_to_end(clave)
+            return guardado[1]
+
+        if ventana is None:
+            temps = estado.ventana.vista()
+        else:
+            historial = estado.historial
+            fin = len(historial)
+            inicio = historial.buscar(historial.fecha(fin - 1) - ventana) if fin else 0
+            temps = [t for _, t in historial.recorrer(inicio, fin)]
+        if not len(temps):
+            raise ErrorNone(f"No hay lecturas del sensor {sensor!r}")
+        if _solo_execute(estadistico):                                          # Sin calcular por separado tambien se muestra
+            resultado = estadistico.execute(estado.date, temps)
+        else:
+            resultado = estadistico.calcular(temps)
+        self._cache[clave] = (estado.version, resultado)
+        self._cache.move_to_end(clave)
+        if len(self._cache) > self.tam_cache:                                   # Expulsamos el resultado usado hace mas tiempo
+            self._cache.popitem(last=False)
+        return resultado
+
+    # Resumen (Agregado) de las lecturas de un sensor en [inicio, fin), con las fechas como texto o en segundos
+    # Se calcula con los agregados por minuto, hora y dia, asi no hace falta recorrer todas las lecturas del rango
+    # Lanza ErrorNone si el sensor no tiene lecturas
+    def consultar_rango(self, sensor, inicio, fin):
+        estado = self._estado_existente(sensor)
+        return estado.agregados.resumen(estado.historial, _a_segundos(inicio), _a_segundos(fin))
+
+    # Serie de Agregados de un sensor en [inicio, fin) con un intervalo de 'resolucion' segundos (por ejemplo 86400 para
+    # el maximo de cada dia), que debe ser multiplo de alguna de las resoluciones de los agregados
+    def serie(self, sensor, inicio, fin, resolucion):
+        estado = self._estado_existente(sensor)
+        return estado.agregados.serie(estado.historial, _a_segundos(inicio), _a_segundos(fin), resolucion)
+
+    # Funcion para descartar del historial las lecturas con mas de 'horizonte' segundos de antiguedad respecto a la ultima
+    # de cada sensor; siguen contando en los agregados. El corte se alinea a la resolucion mas fina de los agregados
+    # Devuelve el numero de lecturas descartadas
+    def compactar(self, horizonte, sensores=None):
+        descartadas = 0
+        for sensor in (list(self._sensores) if sensores is None else sensores):
+            estado = self._sensores.get(sensor)
+            if estado is None or not len(estado.historial) or not estado.agregados.niveles:
+                continue
+            historial = estado.historial
+            resolucion = estado.agregados.niveles[0].resolucion
+            corte = historial.fecha(len(historial) - 1) - horizonte
+            corte -= corte % resolucion
+            if estado.agregados.compactado is not None and corte <= estado.agregados.compactado:
+                continue
+            i = historial.buscar(corte)
+            estado.version += 1
+            historial.descartar(i)
+            estado.agregados.compactado = corte
+            estado.version += 1
+            descartadas += i
+        return descartadas
+
+    # Instantanea consistente del estado de un sensor (por defecto el de la ultima lectura) para leerlo desde otro hilo
+    # mientras el sensor sigue escribiendo, sin bloquearlo: es un seqlock sobre la version del sensor, que es impar mientras
+    # se modifica. Se copia la ventana (es pequeña) y del historial solo se guarda una instantanea que comparte sus bloques;
+    # si la version ha cambiado durante la copia se repite
+    def instantanea(self, sensor=None):
+        if sensor is None:
+            sensor = self._actual
+        estado = self._estado_existente(sensor)
+        while True:
+            version = estado.version
+            if version % 2:                                                     # El sensor esta a mitad de una escritura
+                time.sleep(0)
+                continue
+            date = estado.date
+            temp = VistaVentana(memoryview(estado.ventana.vista()._datos.tobytes()).cast('d'))
+            historial = estado.historial.instantanea()
+            n = len(estado.historial)
+            if estado.version == version:
+                return Instantanea(sensor, version, date, temp, VistaHistorial(historial, 0, n))
+
+    # Consulta conjunta de varios sensores (por defecto todos): devuelve {sensor: (fecha, ventana de temperaturas)}
+    # Cada sensor se lee con una instantanea, asi se puede llamar desde otro hilo mientras llegan lecturas
+    def consultar(self, sensores=None):
+        if sensores is None:
+            sensores = list(self._sensores)
+        resultado = {}
+        for sensor in sensores:
+            if sensor in self._sensores:
+                instantanea = self.instantanea(sensor)
+                resultado[sensor] = (instantanea.date, instantanea.temp)
+        return resultado
 
 # R3
 # Se trata de un Chain of Responsability que obtendra las dos listas (date y temp) desde la funcion de update que hemos visto anteriormente
 # Iniciamos con la clase Manejador para poder definir cada sucesor que va despues de cada paso y formar asi una cadena y obtener los datos del sistema
+# La instrumentacion es opcional: al activarla cada manejador de la cadena recibe un atributo manejar_date_temp propio
+# que mide su latencia y llama al metodo de su clase, y al desactivarla se borra ese atributo (la clase no se toca),
+# asi sin instrumentacion no hay ningun coste añadido
 class Manejador(ABC):
     def __init__(self, sucesor=None):
         self.sucesor : Manejador = sucesor
@@ -136,32 +1816,89 @@ class Manejador(ABC):
     def manejar_date_temp(self, date, temp):
         pass
 
+    # Funcion para medir este manejador y todos sus sucesores en unas Metricas
+    # Si un manejador ya se midio con las mismas Metricas sigue sumando en su histograma
+    def instrumentar(self, metricas):
+        self.desinstrumentar()
+        manejador = self
+        while manejador is not None:
+            nombre = metricas._nombres.get(manejador)
+            if nombre is None:
+                clase = type(manejador).__name__
+                nombre = clase
+                repetidos = 1
+                while nombre in metricas.manejadores:                   # Si se repite el tipo en la cadena lo numeramos
+                    repetidos += 1
+                    nombre = f"{clase}#{repetidos}"
+                metricas._nombres[manejador] = nombre
+                metricas.manejadores[nombre] = HistogramaLatencia()
+            manejador.manejar_date_temp = _manejar_medido(manejador.manejar_date_temp, metricas._local, metricas.manejadores[nombre])
+            manejador = manejador.sucesor
+
+    # Funcion para quitar la instrumentacion de este manejador y de todos sus sucesores
+    def desinstrumentar(self):
+        manejador = self
+        while manejador is not None:
+            try:
+                del manejador.manejar_date_temp                         # Sin tocar __dict__ directamente, que lo haria mas lento
+            except AttributeError:
+                pass
+            manejador = manejador.sucesor
+
+# Devuelve un manejar_date_temp que mide el tiempo propio del manejador (original es su metodo manejar_date_temp):
+# el total menos el de su sucesor, que el sucesor deja en local.sucesor al terminar
+def _manejar_medido(original, local, histograma):
+    reloj = time.perf_counter_ns
+    def manejar_date_temp(date, temp):
+        local.sucesor = 0
+        inicio = reloj()
+        result = original(date, temp)
+        total = reloj() - inicio
+        histograma.registrar(max(total - local.sucesor, 0))
+        local.sucesor = total
+        return result
+    return manejar_date_temp
+
 # Definimos cada paso encadenado que son herencia de la clase Manejador y en cada paso se indica que si tiene un sucesor que pase a realizar ese manejador sucesor
 # Este sera el ultimo paso, la clase Aumento, que comprueba si durante los últimos 30 segundos la temperatura ha aumentado más de 10 grados centígrados.
+# Si recibe la vista de una VentanaTemporal usa los timestamps reales con MotorAumento; con una lista sin fechas
+# se supone una lectura cada 5 segundos y se compara con la de hace 6 posiciones
 class Aumento(Manejador):
+    def __init__(self, sucesor=None, segundos=30, incremento=10):
+        super().__init__(sucesor)
+        self.segundos = segundos                                                                # Segundos hacia atras en los que buscamos la subida
+        self.incremento = incremento                                                            # Grados de subida a partir de los que se avisa
+
     def manejar_date_temp(self, date, temp):
-        n = len(temp)
         result = False                                                                          # Resultado para comprobarlo en pruebas pytest
-        if n >=6:
-            ultima_temperatura = temp[-1]
-            temperatura_30seg = temp[-6]
-            if (ultima_temperatura - temperatura_30seg) > 10:
-                print('Ultimos 30 segundos:\tLa temperatura ha aumentado mas de 10 grados')
-                result = True                                                                   # Resultado es cierto para comprobarlo en pruebas pytest
+        if isinstance(temp, VistaVentana) and temp.ventana is not None:
+            subida = temp.ventana.motor(MotorAumento, self.segundos).resultado()
+        else:
+            subida = temp[-1] - temp[-6] if len(temp) >= 6 else 0
+        if subida > self.incremento:
+            get_salida().emitir(self.formatear, subida)
+            result = True                                                                       # Resultado es cierto para comprobarlo en pruebas pytest
     
         if self.sucesor:
             self.sucesor.manejar_date_temp(date, temp)
         
         return result                                                                           # Devolvemos el resultado para el pytest
 
+    # Texto del aviso de subida (solo se construye si la salida lo va a mostrar)
+    def formatear(self, subida):
+        return f'Ultimos {self.segundos} segundos:\tLa temperatura ha aumentado mas de {self.incremento} grados'
+
 # Este sera el segundo paso, la clase Umbral, que comprueba si la temperatura actual del invernadero está por encima de un umbral que hemos definido
 class Umbral(Manejador):
-     def manejar_date_temp(self, date, temp):
-        umbral = 28                                                 # Hemos indicado como umbral los 28 grados centigrados (es modificabel)
+    def __init__(self, sucesor=None, umbral=28):
+        super().__init__(sucesor)
+        self.umbral = umbral                                        # Hemos indicado como umbral los 28 grados centigrados (es modificable)
+
+    def manejar_date_temp(self, date, temp):
         temperatura_actual = temp[-1]
         result = False                                              # Resultado para comprobarlo en pruebas pytest
-        if temperatura_actual > umbral:
-            print('Temperatura actual:\tPor encima del umbral')
+        if temperatura_actual > self.umbral:
+            get_salida().emitir(self.formatear, temperatura_actual)
             result = True                                           # Resultado es cierto para comprobarlo en pruebas pytest
             
         if self.sucesor:
@@ -169,97 +1906,628 @@ class Umbral(Manejador):
 
         return result                                               # Devolvemos el resultado para el pytest
 
+    # Texto del aviso de umbral (solo se construye si la salida lo va a mostrar)
+    def formatear(self, temperatura_actual):
+        return 'Temperatura actual:\tPor encima del umbral'
+
 # R4
 # Este sera el primer paso de la chain responsability, la clase ContextoEstadisticos, que tambien seria el contexto del patron Strategy
 # Aqui es donde se inicia la ultima regla en la que en el contexto podremos elgir la distinta estrategia que queremos para el analisis de las temperaturas del sensor
+# Tambien se pueden seguir varias estrategias a la vez: con la vista de una VentanaTemporal todas leen los motores de la misma ventana,
+# que se actualizan juntos en una sola pasada por lectura, y el resultado es un unico diccionario con todos los estadisticos
 class ContextoEstadisticos(Manejador):
     def __init__(self, sucesor=None):
         super().__init__(sucesor)
-        self.strategy = None                                # Variable que obtiene la estrategia que seguiremos
+        self.strategies = []                                # Variable que obtiene las estrategias que seguiremos (normalmente una)
     
+    # La estrategia que seguimos (la primera si hay varias)
+    @property
+    def strategy(self):
+        return self.strategies[0] if self.strategies else None
+
     # Funcion para definir la estrategia que queremos seguir
     def set_strategy(self, strategy):
-        self.strategy = strategy
+        self.strategies = [] if strategy is None else [strategy]
+
+    # Funcion para definir varias estrategias que queremos seguir a la vez (sin repetir ninguna)
+    def set_strategies(self, *strategies):
+        self.strategies = list(dict.fromkeys(strategies))
     
     # Funcion del Manejador para obtener las listas actualizadas y realizar la estrategia de este paso encadenado
+    # Devuelve un diccionario con el resultado de las estrategias (por ejemplo {'media': ..., 'sd': ...}) o None si no hay ninguna
     def manejar_date_temp(self, date, temp):
-        if self.strategy is not None:                       # Si existe una estrategia, que la ejecute
-            self.strategy.execute(date, temp)
+        result = None
+        if len(self.strategies) == 1:                       # Si existe una estrategia, que la ejecute
+            result = _como_diccionario(self.strategies[0].execute(date, temp))
+        elif self.strategies:                               # Si hay varias, se calculan todas y se muestran juntas
+            result = {}
+            resultados = []
+            for strategy in self.strategies:
+                if _solo_execute(strategy):                         # Calcula y muestra por su cuenta
+                    _añadir_resultado(result, strategy, strategy.execute(date, temp))
+                else:
+                    resultados.append((strategy, strategy.calcular(temp)))
+            if resultados:
+                get_salida().emitir(self.formatear, date, resultados)
+            for strategy, resultado in resultados:
+                _añadir_resultado(result, strategy, resultado)
         
         if self.sucesor:                                    # Si existe un sucesor en la cadena, que realize el manejador sucesor
             self.sucesor.manejar_date_temp(date, temp)
 
+        return result
+
+    # Texto con la fecha y el resultado de cada estrategia (solo se construye si la salida lo va a mostrar)
+    def formatear(self, date, resultados):
+        return '\n'.join([f"Fecha: {date}"] + [strategy.texto(resultado) for strategy, resultado in resultados])
+
+# Indica si la estrategia solo implementa execute (sin separar calcular y texto)
+def _solo_execute(strategy):
+    return getattr(type(strategy), 'calcular', None) is Strategy.calcular
+
+# Resultado de una estrategia como diccionario si es una namedtuple (por ejemplo {'media': ..., 'sd': ...}); si no, tal cual
+def _como_diccionario(result):
+    return result._asdict() if isinstance(result, tuple) and hasattr(result, '_fields') else result
+
+# Funcion que añade el resultado de una estrategia al diccionario con los de varias: los campos de una namedtuple por
+# separado, y cualquier otro resultado con el nombre de la clase de la estrategia
+def _añadir_resultado(result, strategy, resultado):
+    resultado = _como_diccionario(resultado)
+    if isinstance(resultado, dict):
+        result.update(resultado)
+    else:
+        result[type(strategy).__name__] = resultado
+
+# Resultado de cada estrategia: se puede desempaquetar como una tupla y cada valor tiene el nombre de su estadistico
+ResultadoMediaSd = namedtuple('ResultadoMediaSd', ['media', 'sd'])
+ResultadoCuantil = namedtuple('ResultadoCuantil', ['q1', 'mediana', 'q3'])
+ResultadoMaxMin = namedtuple('ResultadoMaxMin', ['maximo', 'minimo'])
+
 # Iniciamos la clase Strategy para realizar la funcion execute y realice una de las estrategia que deseemos
+# Una estrategia puede implementar solo execute (calcula, muestra y devuelve el resultado), o separar el calculo (calcular)
+# del texto que se muestra (texto) y usar el execute de Strategy: asi el contexto puede combinarla con otras y la salida
+# solo construye el texto si lo va a mostrar
 class Strategy(ABC): 
-    @abstractmethod    
+    # Por defecto no hay calculo por separado: la estrategia tiene que implementar calcular o execute
+    def calcular(self, temp):
+        raise NotImplementedError(f"{type(self).__name__} debe implementar calcular o execute")
+
+    # Por defecto se muestra el resultado tal cual
+    def texto(self, result):
+        return str(result)
+
     def execute(self, date, temp):
-        pass
+        result = self.calcular(temp)                        # Resultado para comprobarlo en pruebas pytest
+        get_salida().emitir(self.formatear, date, result)   # Mostramos por la salida
+        return result                                       # Devolvemos el resultado para el pytest
+
+    def formatear(self, date, result):
+        return f"Fecha: {date}\n{self.texto(result)}"
 
 # Definimos cada estrategia que seran herencias de la clase Strategy
 # La siguiente estrategia calcula la media y la desviacion tipica de la lista de temperaturas de los ultimos 60 segundos
+# Si recibe la vista de una VentanaTemporal usa su MotorMediaSd, que se actualiza en O(1) con cada lectura
 class StrategyMeanSd(Strategy):
-    def execute(self, date, temp):
-        n = len(temp)
-        mean = functools.reduce(lambda x, y: x+y, temp)/ n              # Calculo de la media
-        sd = sqrt(sum(map(lambda x: (x - mean) ** 2, temp)) / n)        # Calculo de la desviacion tipica
-        
-        # Una vez pasados los 60 segundos eliminamos la ultima temperatura ya que no la necesitamos para nuestro analisis
-        if n > 12:
-            temp.pop(0)
-        
-        # Resultado para comprobarlo en pruebas pytest
-        result = (mean, sd)
-        
-        # Mostramos por pantalla
-        print(f"Fecha: {date}")
-        print(f"Ultimos 60 segundos:\tMedia: {round(mean, 2)}\tDesviacion Tipica: {round(sd, 2)}")
-        
-        # Devolvemos el resultado para el pytest
-        return result
+    def calcular(self, temp):
+        if isinstance(temp, VistaVentana) and temp.ventana is not None:
+            mean, sd = temp.ventana.motor(MotorMediaSd).resultado()
+        else:
+            n = len(temp)
+            mean = functools.reduce(lambda x, y: x+y, temp)/ n          # Calculo de la media
+            sd = sqrt(sum(map(lambda x: (x - mean) ** 2, temp)) / n)    # Calculo de la desviacion tipica
+        return ResultadoMediaSd(mean, sd)
+
+    def texto(self, result):
+        return f"Ultimos 60 segundos:\tMedia: {round(result.media, 2)}\tDesviacion Tipica: {round(result.sd, 2)}"
 
 # La siguiente estrategia calcula Q1, Mediana y Q2 de la lista de temperaturas de los ultimos 60 segundos
+# Si recibe la vista de una VentanaTemporal usa su MotorCuantil, que mantiene la ventana ordenada entre lecturas
+# Con aproximado=True usa en su lugar un MotorCuantilAproximado (sketches KLL por cubetas de tiempo) con memoria fija
+# por sensor y un error en el rango de como mucho 'error', sobre los ultimos 'duracion' segundos (por defecto los de la
+# ventana, pero puede ser mucho mayor, por ejemplo un dia o una semana). El motor sigue las lecturas desde que la estrategia
+# se usa por primera vez con la ventana de un sensor (de antes solo ve las que quedan en la ventana)
 class StrategyCuantil(Strategy):
-    def execute(self,  date, temp):
-        n = len(temp)
-        temp_ordenada = sorted(temp)
-        Q1 = temp_ordenada[n//4] if n%2 != 0 else (temp_ordenada[n//4-1] + temp_ordenada[n//4])/2           # Calculo de Q1
-        mediana = temp_ordenada[n//2] if n%2 != 0 else (temp_ordenada[n//2-1] + temp_ordenada[n//2])/2      # Calculo de la Mediana
-        Q3 = temp_ordenada[3*n//4] if n%2 != 0 else (temp_ordenada[3*n//4-1] + temp_ordenada[3*n//4])/2     # Calculo de Q3
-        
-        # Una vez pasados los 60 segundos eliminamos la ultima temperatura ya que no la necesitamos para nuestro analisis
-        if n > 12:
-            temp.pop(0)
-        
-        # Resultado para comprobarlo en pruebas pytest
-        result = (Q1, mediana, Q3)
-        
-        # Mostramos por pantalla
-        print(f"Fecha: {date}")
-        print(f"Ultimos 60 segundos:\tQ1: {Q1}\tMediana: {mediana}\tQ3: {Q3}")
-        
-        # Devolvemos el resultado para el pytest
-        return result
+    def __init__(self, aproximado=False, duracion=None, error=0.01, cubeta=None):
+        self.aproximado = aproximado
+        self.duracion = duracion
+        self.k = max(int(-(-1.5 * ERROR_KLL // error)), 8)                 # El motor añade hasta la mitad del error al no recalcular siempre
+        self.cubeta = cubeta
+
+    # Funcion que devuelve el motor aproximado de la ventana de la vista
+    def _motor_aproximado(self, temp):
+        duracion = self.duracion or temp.ventana.duracion
+        return temp.ventana.motor(MotorCuantilAproximado, duracion, self.cubeta, self.k)
+
+    def calcular(self, temp):
+        if isinstance(temp, VistaVentana) and temp.ventana is not None:
+            if self.aproximado:
+                return ResultadoCuantil(*self._motor_aproximado(temp).resultado())
+            return ResultadoCuantil(*temp.ventana.motor(MotorCuantil).resultado())
+        return ResultadoCuantil(*cuantiles(sorted(temp)))
+
+    # Funcion para calcular los cuantiles de una zona a partir de las vistas de las ventanas de varios sensores
+    # En el modo aproximado se fusionan los sketches de cada sensor; si no, se ordenan todas las temperaturas juntas
+    def calcular_zona(self, temps):
+        if self.aproximado and all(isinstance(temp, VistaVentana) and temp.ventana is not None for temp in temps):
+            sketches = [self._motor_aproximado(temp).sketch() for temp in temps if len(temp)]
+            return ResultadoCuantil(*SketchKLL.cuantiles_de(sketches, (0.25, 0.5, 0.75)))
+        return ResultadoCuantil(*cuantiles(sorted(itertools.chain.from_iterable(temps))))
+
+    def texto(self, result):
+        if self.aproximado:
+            return f"Aproximado:\tQ1: {result.q1}\tMediana: {result.mediana}\tQ3: {result.q3}"
+        return f"Ultimos 60 segundos:\tQ1: {result.q1}\tMediana: {result.mediana}\tQ3: {result.q3}"
 
 # La siguiente estrategia calcula el maximo y el minimo de la lista de temperaturas de los ultimos 60 segundos
+# Si recibe la vista de una VentanaTemporal usa su MotorMaxMin en lugar de recorrer toda la ventana
 class StrategyMaxMin(Strategy):
-    def execute(self,  date, temp):
-        n = len(temp)
-        maximo = functools.reduce(lambda x, y: x if x > y else y, temp)     # Calculo del maximo
-        minimo = functools.reduce(lambda x, y: x if x < y else y, temp)     # Calculo del minimo
-        
-        # Una vez pasados los 60 segundos eliminamos la ultima temperatura ya que no la necesitamos para nuestro analisis
-        if n > 12:
-            temp.pop(0)
-        
-        # Resultado para comprobarlo en pruebas pytest
-        result = (maximo, minimo)
-        
-        # Mostramos por pantalla
-        print(f"Fecha: {date}")
-        print(f"Ultimos 60 segundos:\tMaximo: {maximo}\tMinimo: {minimo}") 
-        
-        # Devolvemos el resultado para el pytest
-        return result
+    def calcular(self, temp):
+        if isinstance(temp, VistaVentana) and temp.ventana is not None:
+            return ResultadoMaxMin(*temp.ventana.motor(MotorMaxMin).resultado())
+        maximo = functools.reduce(lambda x, y: x if x > y else y, temp)         # Calculo del maximo
+        minimo = functools.reduce(lambda x, y: x if x < y else y, temp)         # Calculo del minimo
+        return ResultadoMaxMin(maximo, minimo)
+
+    def texto(self, result):
+        return f"Ultimos 60 segundos:\tMaximo: {result.maximo}\tMinimo: {result.minimo}"
+
+# -----------------------
+# PROCESAMIENTO EN VARIOS PROCESOS
+# -----------------------
+# Cadena por defecto de cada proceso de un SistemaDistribuido: todos los estadisticos, Umbral y Aumento
+# (tiene que ser una funcion del modulo para poder enviarla a los procesos)
+def cadena_estadisticos():
+    contexto = ContextoEstadisticos(Umbral(Aumento()))
+    contexto.set_strategies(StrategyMeanSd(), StrategyCuantil(), StrategyMaxMin())
+    return contexto
+
+# Vistas de un lote de lecturas en memoria compartida: fechas (segundos), temperaturas y el identificador del sensor
+def _vistas_lote(buffer, lote):
+    return (buffer[:8 * lote].cast('q'), buffer[8 * lote:16 * lote].cast('d'), buffer[16 * lote:20 * lote].cast('i'))
+
+# Bucle de cada proceso del SistemaDistribuido: tiene su propio SistemaIoT con los sensores de su particion y recibe
+# por la conexion los nombres de los sensores nuevos, los lotes que ya estan en la memoria compartida y las consultas
+def _proceso_distribuido(conexion, nombres_memoria, lote, fabrica_cadena, fabrica_salida, duracion, capacidad):
+    set_salida(fabrica_salida())
+    sistema = SistemaIoT(fabrica_cadena(), duracion, capacidad)
+    memorias = [shared_memory.SharedMemory(name=nombre) for nombre in nombres_memoria]
+    vistas = [_vistas_lote(memoria.buf, lote) for memoria in memorias]
+    sensores = {}                                                       # Nombre de cada identificador de sensor
+    resultados = {}                                                     # Ultimo resultado de la cadena de cada sensor
+    try:
+        while True:
+            mensaje = conexion.recv()
+            if mensaje[0] == 'sensor':
+                sensores[mensaje[1]] = mensaje[2]
+            elif mensaje[0] == 'lote':
+                _, k, n = mensaje
+                fechas, temps, ids = vistas[k]
+                ultima, date = None, ''
+                for i in range(n):
+                    segundos = fechas[i]
+                    if segundos != ultima:                              # Las lecturas de un lote suelen compartir la fecha
+                        ultima, date = segundos, segundos_a_fecha(segundos)
+                    sensor = sensores[ids[i]]
+                    resultados[sensor] = sistema._registrar(sensor, segundos, date, temps[i])
+                conexion.send(('hecho', k))                             # El buffer k ya se puede volver a llenar
+            elif mensaje[0] == 'consultar':
+                estados = sistema.consultar(mensaje[1])
+                conexion.send(('consulta', {sensor: (date, list(vista), resultados.get(sensor))
+                                            for sensor, (date, vista) in estados.items()}))
+            elif mensaje[0] == 'cerrar':
+                break
+    finally:
+        for vista in vistas:
+            for v in vista:
+                v.release()
+        for memoria in memorias:
+            memoria.close()
+        conexion.close()
+
+# Buffers en memoria compartida y conexion de uno de los procesos del SistemaDistribuido
+# Tiene dos buffers: mientras el proceso trabaja con uno, el sistema va llenando el otro
+class _Particion:
+    def __init__(self, contexto, lote, fabrica_cadena, fabrica_salida, duracion, capacidad):
+        self.memorias = [shared_memory.SharedMemory(create=True, size=20 * lote) for _ in range(2)]
+        self.vistas = [_vistas_lote(memoria.buf, lote) for memoria in self.memorias]
+        self.conexion, conexion_proceso = contexto.Pipe()
+        self.proceso = contexto.Process(target=_proceso_distribuido, daemon=True,
+                                        args=(conexion_proceso, [memoria.name for memoria in self.memorias], lote,
+                                              fabrica_cadena, fabrica_salida, duracion, capacidad))
+        self.proceso.start()
+        conexion_proceso.close()
+        self.actual = 0                                                 # Buffer que se esta llenando
+        self.n = 0                                                      # Lecturas en el buffer actual
+        self.pendientes = set()                                         # Buffers enviados que el proceso aun no ha terminado
+
+    # Funcion para recibir mensajes del proceso hasta obtener uno del tipo indicado (los 'hecho' liberan su buffer)
+    def recibir(self, tipo):
+        while True:
+            mensaje = self.conexion.recv()
+            if mensaje[0] == 'hecho':
+                self.pendientes.discard(mensaje[1])
+            if mensaje[0] == tipo:
+                return mensaje
+
+    # Funcion para enviar al proceso el buffer actual y pasar a llenar el otro (esperando a que el proceso lo termine)
+    def enviar(self):
+        if self.n == 0:
+            return
+        self.conexion.send(('lote', self.actual, self.n))
+        self.pendientes.add(self.actual)
+        self.actual, self.n = 1 - self.actual, 0
+        while self.actual in self.pendientes:
+            self.recibir('hecho')
+
+    # Funcion para esperar a que el proceso termine todos los lotes enviados
+    def esperar(self):
+        while self.pendientes:
+            self.recibir('hecho')
+
+    def cerrar(self):
+        try:
+            self.conexion.send(('cerrar',))
+        except (BrokenPipeError, OSError):
+            pass
+        self.proceso.join()
+        self.conexion.close()
+        for vista in self.vistas:
+            for v in vista:
+                v.release()
+        for memoria in self.memorias:
+            memoria.close()
+            memoria.unlink()
+
+# Alternativa al SistemaIoT que reparte los sensores entre varios procesos para usar varios nucleos (el GIL no deja calcular
+# los estadisticos de varios sensores a la vez en un solo proceso). Cada proceso tiene su propio SistemaIoT con las ventanas y
+# la cadena de su particion de sensores, creada con fabrica_cadena; las lecturas le llegan por lotes en memoria compartida y
+# las consultas reúnen los resultados de todos los procesos. Los sensores se asignan a los procesos por orden de aparicion.
+# Por defecto los procesos no muestran nada (SalidaNula), porque sus mensajes se mezclarian
+class SistemaDistribuido(Observer):
+    def __init__(self, fabrica_cadena=cadena_estadisticos, procesos=None, lote=4096, duracion=60, capacidad=128, fabrica_salida=SalidaNula):
+        contexto = multiprocessing.get_context('spawn')
+        self.procesos = procesos or os.cpu_count() or 1
+        self.lote = lote                                                # Lecturas de cada lote que se envia a un proceso
+        self._particiones = [_Particion(contexto, lote, fabrica_cadena, fabrica_salida, duracion, capacidad) for _ in range(self.procesos)]
+        self._sensores = {}                                             # (particion, identificador) de cada sensor
+        self.lecturas = 0
+
+    # Recibe la tupla (timestamp, t, sensor) del Sensor igual que el SistemaIoT
+    def update(self, date_temp):
+        sensor = date_temp[2] if len(date_temp) > 2 else SENSOR_POR_DEFECTO
+        self.update_lectura(sensor, fecha_a_segundos(date_temp[0]), date_temp[1])
+
+    # Funcion para obtener la particion y el identificador de un sensor, asignandolo a un proceso si es la primera vez que aparece
+    def _asignar(self, sensor):
+        asignacion = self._sensores.get(sensor)
+        if asignacion is None:
+            identificador = len(self._sensores)
+            asignacion = self._sensores[sensor] = (self._particiones[identificador % self.procesos], identificador)
+            asignacion[0].conexion.send(('sensor', identificador, sensor))
+        return asignacion
+
+    # Añade una lectura (con la fecha en segundos) al lote del proceso del sensor y envia el lote cuando se llena
+    def update_lectura(self, sensor, segundos, t):
+        particion, identificador = self._asignar(sensor)
+        fechas, temps, ids = particion.vistas[particion.actual]
+        n = particion.n
+        fechas[n] = segundos
+        temps[n] = t
+        ids[n] = identificador
+        particion.n = n + 1
+        self.lecturas += 1
+        if particion.n == self.lote:
+            particion.enviar()
+
+    # Añade de golpe varias lecturas ordenadas de un sensor (fechas en segundos), copiandolas por tramos en los lotes
+    def update_lecturas(self, sensor, fechas, temps):
+        particion, identificador = self._asignar(sensor)
+        fechas, temps = array('q', fechas), array('d', temps)
+        i = 0
+        while i < len(fechas):
+            vista_fechas, vista_temps, vista_ids = particion.vistas[particion.actual]
+            n = particion.n
+            k = min(self.lote - n, len(fechas) - i)
+            vista_fechas[n:n + k] = fechas[i:i + k]
+            vista_temps[n:n + k] = temps[i:i + k]
+            vista_ids[n:n + k] = array('i', [identificador]) * k
+            particion.n = n + k
+            i += k
+            if particion.n == self.lote:
+                particion.enviar()
+        self.lecturas += len(fechas)
+
+    # Funcion para enviar los lotes a medio llenar y esperar a que todos los procesos los terminen
+    def vaciar(self):
+        for particion in self._particiones:
+            particion.enviar()
+        for particion in self._particiones:
+            particion.esperar()
+
+    # Consulta conjunta de varios sensores (por defecto todos), despues de vaciar los lotes pendientes:
+    # devuelve {sensor: (fecha, temperaturas de la ventana, ultimo resultado de la cadena)}
+    def consultar(self, sensores=None):
+        self.vaciar()
+        por_particion = {}
+        for sensor in (list(self._sensores) if sensores is None else sensores):
+            if sensor in self._sensores:
+                por_particion.setdefault(id(self._sensores[sensor][0]), (self._sensores[sensor][0], []))[1].append(sensor)
+        for particion, lista in por_particion.values():                # Primero enviamos todas las consultas para que se hagan a la vez
+            particion.conexion.send(('consultar', lista))
+        resultado = {}
+        for particion, lista in por_particion.values():
+            resultado.update(particion.recibir('consulta')[1])
+        return resultado
+
+    # Funcion para obtener los nombres de todos los sensores que han enviado lecturas
+    def get_sensores(self):
+        return list(self._sensores)
+
+    # Funcion para terminar los procesos (despues de procesar las lecturas pendientes) y liberar la memoria compartida
+    def cerrar(self):
+        try:
+            self.vaciar()
+        finally:
+            for particion in self._particiones:
+                particion.cerrar()
+            self._particiones = []
+
+# -----------------------
+# SERVIDOR DE LECTURAS
+# -----------------------
+# Formato de las tramas que envian los sensores por la red (todo en little-endian): una cabecera con la marca, el numero
+# de lecturas, la longitud del nombre del sensor y el instante de envio (time.time_ns, para medir la latencia), el nombre
+# en UTF-8 rellenado hasta un multiplo de 8 bytes y despues dos columnas: los timestamps (int64) y las temperaturas (float64)
+# Asi cada columna se decodifica de golpe con memoryview.cast, sin crear un objeto por lectura
+MAGIA_TRAMA = b'PCDT'
+CABECERA_TRAMA = struct.Struct('<4sHHq')
+MAX_LECTURAS_TRAMA = 0xFFFF                                             # El numero de lecturas y la longitud del nombre son uint16
+
+# Funcion que construye la trama con las lecturas de un sensor; si son mas de MAX_LECTURAS_TRAMA se reparten en varias
+# tramas seguidas. Lanza ErrorRegistro si el nombre del sensor ocupa mas de 65535 bytes
+def codificar_trama(sensor, fechas, temps, enviado_ns=None):
+    nombre = sensor.encode()
+    if len(nombre) > 0xFFFF:
+        raise ErrorRegistro("Nombre de sensor demasiado largo para una trama")
+    fechas, temps = array('q', fechas), array('d', temps)
+    if sys.byteorder != 'little':
+        fechas.byteswap()
+        temps.byteswap()
+    enviado_ns = time.time_ns() if enviado_ns is None else enviado_ns
+    relleno = bytes(-len(nombre) % 8)
+    partes = []
+    for i in range(0, max(len(fechas), 1), MAX_LECTURAS_TRAMA):
+        n = min(len(fechas) - i, MAX_LECTURAS_TRAMA)
+        partes += (CABECERA_TRAMA.pack(MAGIA_TRAMA, n, len(nombre), enviado_ns), nombre, relleno,
+                   fechas[i:i + n].tobytes(), temps[i:i + n].tobytes())
+    return b''.join(partes)
+
+# Funcion que decodifica las tramas completas de 'datos' (bytes) y devuelve la lista de (sensor, fechas, temps, enviado_ns)
+# y los bytes consumidos; lo que sobra al final es una trama incompleta (en TCP llegara el resto despues)
+# Las columnas son memoryviews sobre 'datos', sin copiar. Lanza ErrorRegistro si una trama no empieza por la marca o si
+# el nombre del sensor no es UTF-8 valido
+def decodificar_tramas(datos):
+    tramas = []
+    vista = memoryview(datos)
+    pos = 0
+    while len(datos) - pos >= CABECERA_TRAMA.size:
+        magia, n, longitud, enviado_ns = CABECERA_TRAMA.unpack_from(datos, pos)
+        if magia != MAGIA_TRAMA:
+            raise ErrorRegistro("Trama no valida")
+        inicio_fechas = pos + CABECERA_TRAMA.size + longitud + (-longitud % 8)
+        fin = inicio_fechas + 16 * n
+        if fin > len(datos):
+            break
+        try:
+            sensor = bytes(vista[pos + CABECERA_TRAMA.size:pos + CABECERA_TRAMA.size + longitud]).decode()
+        except UnicodeDecodeError:
+            raise ErrorRegistro("Nombre de sensor no valido") from None
+        fechas = vista[inicio_fechas:inicio_fechas + 8 * n].cast('q')
+        temps = vista[inicio_fechas + 8 * n:fin].cast('d')
+        if sys.byteorder != 'little':
+            fechas, temps = array('q', fechas), array('d', temps)
+            fechas.byteswap()
+            temps.byteswap()
+        tramas.append((sensor, fechas, temps, enviado_ns))
+        pos = fin
+    return tramas, pos
+
+# Servidor asyncio que recibe tramas por UDP (una o varias tramas por datagrama) y por TCP (un flujo de tramas) y pasa las
+# lecturas de cada trama de golpe a su destino con update_lecturas (un SistemaIoT o un SistemaDistribuido)
+# Mide la latencia de ingesta de cada trama (desde que se envia hasta que el destino la ha procesado) en un HistogramaLatencia
+class ServidorLecturas:
+    def __init__(self, destino, host='127.0.0.1', puerto_udp=0, puerto_tcp=0):
+        self.destino = destino
+        self.host = host
+        self.puerto_udp = puerto_udp                                    # Con 0 se elige un puerto libre al iniciar
+        self.puerto_tcp = puerto_tcp
+        self.tramas = 0
+        self.lecturas = 0
+        self.erroneas = 0                                               # Datagramas o conexiones con tramas no validas
+        self.latencia = HistogramaLatencia()
+        self._transporte_udp = None
+        self._servidor_tcp = None
+        self._loop = None
+
+    # Funcion que pasa al destino las tramas decodificadas
+    def _procesar(self, tramas):
+        for sensor, fechas, temps, enviado_ns in tramas:
+            self.destino.update_lecturas(sensor, fechas, temps)
+            self.tramas += 1
+            self.lecturas += len(fechas)
+            self.latencia.registrar(max(time.time_ns() - enviado_ns, 0))
+
+    async def iniciar(self, udp=True, tcp=True):
+        self._loop = asyncio.get_running_loop()
+        servidor = self
+        if udp:
+            class ProtocoloUDP(asyncio.DatagramProtocol):
+                def datagram_received(self, datos, direccion):
+                    try:
+                        tramas, consumidos = decodificar_tramas(datos)
+                    except ErrorRegistro:
+                        servidor.erroneas += 1
+                        return
+                    if consumidos != len(datos):                        # Un datagrama solo puede llevar tramas completas
+                        servidor.erroneas += 1
+                    servidor._procesar(tramas)
+            self._transporte_udp, _ = await self._loop.create_datagram_endpoint(ProtocoloUDP, local_addr=(self.host, self.puerto_udp))
+            self.puerto_udp = self._transporte_udp.get_extra_info('sockname')[1]
+        if tcp:
+            class ProtocoloTCP(asyncio.Protocol):
+                def connection_made(self, transporte):
+                    self.transporte = transporte
+                    self.buffer = bytearray()
+
+                def data_received(self, datos):
+                    self.buffer += datos
+                    try:
+                        tramas, consumidos = decodificar_tramas(bytes(self.buffer))
+                    except ErrorRegistro:                               # El flujo se ha desincronizado: cerramos la conexion
+                        servidor.erroneas += 1
+                        self.transporte.close()
+                        return
+                    del self.buffer[:consumidos]
+                    servidor._procesar(tramas)
+            self._servidor_tcp = await self._loop.create_server(ProtocoloTCP, self.host, self.puerto_tcp)
+            self.puerto_tcp = self._servidor_tcp.sockets[0].getsockname()[1]
+
+    async def cerrar(self):
+        if self._transporte_udp is not None:
+            self._transporte_udp.close()
+            self._transporte_udp = None
+        if self._servidor_tcp is not None:
+            self._servidor_tcp.close()
+            await self._servidor_tcp.wait_closed()
+            self._servidor_tcp = None
+
+    # Funcion para ejecutar el servidor en su propio hilo con su bucle de asyncio: vuelve cuando los puertos estan abiertos
+    # y devuelve el hilo, que termina al llamar a detener()
+    def iniciar_en_hilo(self, udp=True, tcp=True):
+        listo = threading.Event()
+        async def ejecutar():
+            await self.iniciar(udp, tcp)
+            self._detenido = asyncio.Event()
+            listo.set()
+            await self._detenido.wait()
+            await self.cerrar()
+        hilo = threading.Thread(target=asyncio.run, args=(ejecutar(),), daemon=True)
+        hilo.start()
+        listo.wait()
+        return hilo
+
+    # Funcion para detener el servidor iniciado con iniciar_en_hilo
+    def detener(self):
+        self._loop.call_soon_threadsafe(self._detenido.set)
+
+    # Tramas, lecturas y tramas erroneas recibidas y el resumen de la latencia de ingesta (cotas superiores en ns)
+    def estadisticas(self):
+        return {'tramas': self.tramas, 'lecturas': self.lecturas, 'erroneas': self.erroneas, 'latencia': self.latencia.resumen()}
+
+# -----------------------
+# IMPORTACION DE HISTORICOS
+# -----------------------
+# Conversor de fechas con FORMATO_FECHA a segundos para importar muchas lecturas: guarda los segundos del comienzo del
+# ultimo dia convertido, asi en las lecturas del mismo dia solo se suman la hora, los minutos y los segundos (sin
+# strptime ni timegm por lectura)
+class ConversorFechas:
+    def __init__(self):
+        self._dia = None                                                # Texto 'YYYY-MM-DD' del ultimo dia convertido
+        self._base = 0                                                  # Segundos de las 00:00:00 de ese dia
+
+    def segundos(self, date):
+        if date[:10] != self._dia:
+            self._base = calendar.timegm((int(date[0:4]), int(date[5:7]), int(date[8:10]), 0, 0, 0, 0, 0, 0))
+            self._dia = date[:10]
+        return self._base + int(date[11:13]) * 3600 + int(date[14:16]) * 60 + int(date[17:19])
+
+# Generador que lee un CSV de lecturas (una por linea: fecha,temperatura[,sensor], con o sin cabecera) por bloques de
+# 'tam_bloque' caracteres y devuelve lotes (sensor, fechas en segundos, temperaturas) de hasta 'lote' lecturas de un sensor.
+# Cada sensor mantiene el orden de sus lecturas, pero los lotes de sensores distintos pueden salir en otro orden
+# La memoria no depende del tamaño del fichero. Acepta una ruta o un fichero abierto en modo texto
+# Lanza ErrorRegistro si una linea (que no sea la cabecera) no es valida
+def leer_csv(fichero, tam_bloque=1 << 20, lote=4096):
+    if isinstance(fichero, (str, os.PathLike)):
+        with open(fichero, newline='') as f:
+            yield from leer_csv(f, tam_bloque, lote)
+        return
+    segundos = ConversorFechas().segundos
+    pendientes = {}                                                     # Lecturas de cada sensor que aun no se han devuelto
+    resto = ''                                                          # Linea incompleta al final del bloque anterior
+    numero = 0
+    while True:
+        bloque = fichero.read(tam_bloque)
+        lineas = (resto + bloque).split('\n')
+        resto = lineas.pop() if bloque else ''
+        for linea in lineas:
+            numero += 1
+            campos = linea.rstrip('\r').split(',')
+            try:
+                fecha, t = segundos(campos[0]), float(campos[1])
+            except (ValueError, IndexError):
+                if numero == 1 or not linea.strip():                    # Cabecera o linea vacia
+                    continue
+                raise ErrorRegistro(f"Linea {numero} no valida: {linea!r}")
+            sensor = campos[2] if len(campos) > 2 else SENSOR_POR_DEFECTO
+            columnas = pendientes.get(sensor)
+            if columnas is None:
+                columnas = pendientes[sensor] = (array('q'), array('d'))
+            columnas[0].append(fecha)
+            columnas[1].append(t)
+            if len(columnas[0]) == lote:
+                yield sensor, columnas[0], columnas[1]
+                del pendientes[sensor]
+        if not bloque:
+            break
+    for sensor, (fechas, temps) in pendientes.items():
+        yield sensor, fechas, temps
+
+# Generador que lee un fichero binario de tramas (las mismas que recibe el ServidorLecturas, una detras de otra) por bloques
+# de 'tam_bloque' bytes y devuelve un lote (sensor, fechas, temps) por trama, con las columnas sin copiar
+# Acepta una ruta o un fichero abierto en modo binario. Lanza ErrorRegistro si el fichero no es valido o esta incompleto
+def leer_binario(fichero, tam_bloque=1 << 20):
+    if isinstance(fichero, (str, os.PathLike)):
+        with open(fichero, 'rb') as f:
+            yield from leer_binario(f, tam_bloque)
+        return
+    resto = b''
+    while True:
+        bloque = fichero.read(tam_bloque)
+        datos = resto + bloque
+        tramas, usados = decodificar_tramas(datos)
+        for sensor, fechas, temps, _ in tramas:
+            yield sensor, fechas, temps
+        resto = datos[usados:]
+        if not bloque:
+            break
+    if resto:
+        raise ErrorRegistro("Fichero binario incompleto")
+
+# Funcion que guarda los lotes (sensor, fechas, temps) de un generador, por ejemplo leer_csv, en un fichero binario de tramas
+# (ruta o fichero abierto en modo binario) que despues se puede leer con leer_binario. Devuelve el numero de lecturas
+def guardar_binario(lotes, fichero):
+    if isinstance(fichero, (str, os.PathLike)):
+        with open(fichero, 'wb') as f:
+            return guardar_binario(lotes, f)
+    n = 0
+    for sensor, fechas, temps in lotes:
+        fichero.write(codificar_trama(sensor, fechas, temps, enviado_ns=0))
+        n += len(fechas)
+    return n
+
+# Funcion que importa lecturas historicas: pasa los lotes de un generador (leer_csv o leer_binario) por el destino (un
+# SistemaIoT o un SistemaDistribuido) y su cadena de manejadores con update_lecturas, y devuelve el numero de lecturas
+# Con vectorizado=True (SistemaIoT con NumPy) usa update_batch: es mucho mas rapido, pero la cadena no se ejecuta lectura
+# a lectura. El objetivo es importar varios millones de lecturas por minuto en un solo nucleo
+def importar(destino, lotes, vectorizado=False):
+    n = 0
+    for sensor, fechas, temps in lotes:
+        if vectorizado:
+            destino.update_batch(fechas, temps, sensor)
+        else:
+            destino.update_lecturas(sensor, fechas, temps)
+        n += len(fechas)
+    return n
 
 # -----------------------
 # SISTEMA DE GESTION
@@ -286,6 +2554,7 @@ if __name__ == '__main__':
     print("1: Obtener la media y desviacion tipica")
     print("2: Obtener los cuantiles")
     print("3: Obtener el maximo y el minimo")
+    print("4: Obtener todos los estadisticos a la vez")
     while True:
         estrategia = int(input("Introduce el numero de la estrategia que deseas emplear: "))
         if estrategia == 1:
@@ -297,6 +2566,9 @@ if __name__ == '__main__':
         elif estrategia == 3:
             contexto.set_strategy(maxmin)
             break
+        elif estrategia == 4:
+            contexto.set_strategies(meansd, cuantil, maxmin)
+            break
         else:
             print("No existe esta estrategia por el momento, intentalo de nuevo.")
     print("Cargando...")
@@ -304,9 +2576,12 @@ if __name__ == '__main__':
     # Definimos el sensor y el operador que sera el Sistema con su manejador de iniciacion 
     sensor_temperatura = Sensor(name)                           # Definimos el sensor
     sistema = SistemaIoT.obtener_instancia(contexto)            # Obtenemos la instancia del Sistema
+    registro = RegistroLecturas('lecturas_sistemaiot.bin')      # Registro en disco de las lecturas
+    sistema.set_registro(registro)                              # Recuperamos las ventanas de la ejecucion anterior y guardamos las nuevas lecturas
     sensor_temperatura.register_observer(sistema)               # Registramos el sistema para que reciba los datos del sensor
-    thread = threading.Thread(target=sensor_temperatura.run)    # Iniciamos el sensor desde un hilo
-    thread.start()                                              # Empezamos a ejecutar el hilo
+    planificador = PlanificadorSensores()                       # Planificador que mueve los sensores desde un unico hilo
+    planificador.registrar(sensor_temperatura)                  # Registramos el sensor con su periodo de 5 segundos
+    thread = planificador.iniciar_en_hilo()                     # Empezamos a ejecutar el hilo del planificador
     sensor_temperatura.resume()                                 # Reunudamos el sensor para que ya empieze a funcionar la funcion run del sensor
     
     # En 60 segundos (modificable) se pausa el sensor y se abre el siguiente menu con distintas opciones
@@ -326,6 +2601,7 @@ if __name__ == '__main__':
                 print("1: Obtener la media y desviacion tipica")
                 print("2: Obtener los cuantiles")
                 print("3: Obtener el maximo y el minimo")
+                print("4: Obtener todos los estadisticos a la vez")
                 estrategia = int(input("Introduce el numero de la estrategia que deseas emplear: "))
                 if estrategia == 1:
                     contexto.set_strategy(meansd)
@@ -336,6 +2612,9 @@ if __name__ == '__main__':
                 elif estrategia == 3:
                     contexto.set_strategy(maxmin)
                     break
+                elif estrategia == 4:
+                    contexto.set_strategies(meansd, cuantil, maxmin)
+                    break
                 else:
                     print("No existe esta estrategia por el momento, intentalo de nuevo.")
             sensor_temperatura.resume()                         # Reanuda el programa
@@ -344,6 +2623,7 @@ if __name__ == '__main__':
             sensor_temperatura.resume()                         # Antes de salir hay que reanudar el programa
             sensor_temperatura.exit()                           # Salir del programa
             thread.join()                                       # Al salir del programa se debe devolver los ultimos datos obtenidos en el hilo
+            registro.cerrar()                                   # Guardamos en disco las ultimas lecturas
             break
         else:
             print("No existe esta opcion por el momento, intentalo de nuevo.")
\ No newline at end of file
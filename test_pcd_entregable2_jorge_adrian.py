@@ -4,7 +4,11 @@ from datetime import datetime
 import threading
 import time
 import random
+import io
+import bisect
+import socket
 
+import pcd_entregable2_jorge_adrian
 from pcd_entregable2_jorge_adrian import *
 
 # ----------------------------
@@ -123,6 +127,57 @@ def test_contexto_estadisticos_manejar_date_temp_sin_strategy():
     strategy_mock.execute.assert_not_called()
     contexto.sucesor.manejar_date_temp.assert_called_once_with('2024-05-01 13:00:00', [25, 28, 30, 20, 27, 18, 15, 19, 10, 22, 31, 33])
 
+def test_contexto_estadisticos_varias_estrategias():
+    # Contexto con las tres estrategias a la vez
+    sucesor_mock = Mock()
+    contexto = ContextoEstadisticos(sucesor_mock)
+    contexto.set_strategies(StrategyMeanSd(), StrategyCuantil(), StrategyMaxMin())
+    temp = [25, 28, 30, 20, 27, 18, 15, 19, 10, 22, 31, 33]
+
+    # Llamada al método manejar_date_temp
+    result = contexto.manejar_date_temp('2024-05-01 13:00:00', temp)
+
+    # Verificar que se devuelve un unico registro con todos los estadisticos y que se llama al sucesor
+    assert set(result) == {'media', 'sd', 'q1', 'mediana', 'q3', 'maximo', 'minimo'}
+    assert round(result['media'], 2) == 23.17
+    assert (result['q1'], result['mediana'], result['q3']) == (18.5, 23.5, 29)
+    assert (result['maximo'], result['minimo']) == (33, 10)
+    contexto.sucesor.manejar_date_temp.assert_called_once_with('2024-05-01 13:00:00', temp)
+
+def test_contexto_estadisticos_varias_estrategias_comparten_ventana():
+    # Contexto con dos estrategias sobre la vista de una ventana
+    contexto = ContextoEstadisticos()
+    meansd = StrategyMeanSd()
+    contexto.set_strategies(meansd, StrategyMaxMin(), meansd)
+    ventana = VentanaTemporal(60, 32)
+    for i in range(30):
+        ventana.append(i * 5, i)
+        result = contexto.manejar_date_temp('2024-05-01 13:00:00', ventana.vista())
+
+    # Verificar que cada estrategia usa un motor de la propia ventana y que no se repiten estrategias
+    assert len(contexto.strategies) == 2
+    assert set(ventana._motores) == {(MotorMediaSd, ()), (MotorMaxMin, ())}
+    assert result == {'media': 23, 'sd': pytest.approx(sqrt(14)), 'maximo': 29, 'minimo': 17}
+
+def test_contexto_estrategia_solo_execute(capsys):
+    # Estrategia como las originales: solo implementa execute, muestra el resultado y lo devuelve como una tupla
+    class StrategyRango(Strategy):
+        def execute(self, date, temp):
+            result = (max(temp) - min(temp), len(temp))
+            print(f"Fecha: {date}\nRango: {result[0]}")
+            return result
+    contexto = ContextoEstadisticos()
+    contexto.set_strategy(StrategyRango())
+    temp = [25, 28, 30, 20]
+
+    # Verificar que se puede usar sola y junto a las demas estrategias
+    assert contexto.manejar_date_temp('2024-05-01 13:00:00', temp) == (10, 4)
+    contexto.set_strategies(StrategyRango(), StrategyMaxMin())
+    assert contexto.manejar_date_temp('2024-05-01 13:00:00', temp) == {'StrategyRango': (10, 4), 'maximo': 30, 'minimo': 20}
+    assert capsys.readouterr().out.count('Rango: 10') == 2
+    with pytest.raises(NotImplementedError):
+        Strategy().execute('2024-05-01 13:00:00', temp)
+
 # ------------------------------
 # TEST UMBRAL
 # ------------------------------
@@ -250,3 +305,1081 @@ def test_notify_observers():
 
     # Verificar si se ha llamado al método update del observador con date_temp
     observer_mock.update.assert_called_once_with(date_temp)
+
+# ------------------------------
+# TEST VENTANA TEMPORAL
+# ------------------------------
+def test_ventana_expulsa_por_antiguedad():
+    # Ventana de 60 segundos con una lectura cada 5 segundos
+    ventana = VentanaTemporal(60, 32)
+    for i in range(20):
+        ventana.append(i * 5, i)
+
+    # Verificar que solo quedan las lecturas de los ultimos 60 segundos (de 35 a 95 segundos)
+    assert len(ventana) == 13
+    assert ventana.vista() == list(range(7, 20))
+    assert ventana.vista_fechas()[0] == 35
+
+def test_ventana_expulsa_por_capacidad():
+    # Ventana con mas duracion que capacidad
+    ventana = VentanaTemporal(3600, 4)
+    for i in range(10):
+        ventana.append(i, i)
+
+    # Verificar que se mantienen las ultimas lecturas en orden aunque el buffer haya dado varias vueltas
+    assert ventana.vista() == [6, 7, 8, 9]
+    assert ventana.vista()[-1] == 9
+    assert ventana.vista()[1:3] == [7, 8]
+
+def test_ventana_vista_sin_copia():
+    # Ventana con algunas lecturas
+    ventana = VentanaTemporal(60, 8)
+    ventana.append(0, 20)
+    ventana.append(5, 21)
+
+    # Verificar que la vista comparte memoria con el buffer de la ventana
+    vista = ventana.vista()
+    assert vista._datos.obj is ventana._temps
+
+def test_ventana_devuelve_temperaturas_enteras():
+    # Ventana con lecturas enteras y una con decimales, y un motor creado despues de algunas lecturas
+    ventana = VentanaTemporal(60, 8)
+    ventana.append(0, 25)
+    motor = ventana.motor(MotorMaxMin)
+    ventana.append(5, 28)
+    ventana.append(10, 20.5)
+
+    # Verificar que la vista y el motor devuelven los mismos tipos que las lecturas originales
+    assert [type(t) for t in ventana.vista()] == [int, int, float]
+    assert repr(ventana.vista()) == '[25, 28, 20.5]'
+    assert [type(t) for t in motor.resultado()] == [int, float]
+    assert StrategyMaxMin().texto(StrategyMaxMin().calcular(ventana.vista())) == "Ultimos 60 segundos:\tMaximo: 28\tMinimo: 20.5"
+
+# ------------------------------
+# TEST MOTORES INCREMENTALES
+# ------------------------------
+def test_motor_media_sd_igual_que_calculo_completo():
+    # Ventana pequeña para que se expulsen muchas lecturas
+    ventana = VentanaTemporal(60, 32)
+    strategy = StrategyMeanSd()
+    random.seed(1)
+
+    # En cada lectura comparamos el motor incremental con el calculo sobre la lista completa
+    for i in range(200):
+        ventana.append(i * 5, random.randint(8, 34))
+        mean, sd = strategy.execute('2024-05-01 13:00:00', ventana.vista())
+        mean_lista, sd_lista = strategy.execute('2024-05-01 13:00:00', list(ventana.vista()))
+        assert mean == pytest.approx(mean_lista)
+        assert sd == pytest.approx(sd_lista)
+
+def test_motor_se_inicializa_con_la_ventana_actual():
+    # Ventana con lecturas anteriores a crear el motor
+    ventana = VentanaTemporal(60, 32)
+    for i, t in enumerate([25, 28, 30, 20, 27, 18, 15, 19, 10, 22, 31, 33]):
+        ventana.append(i * 5, t)
+
+    # Verificar que el motor parte del contenido de la ventana
+    mean, sd = ventana.motor(MotorMediaSd).resultado()
+    assert round(mean, 2) == 23.17
+    assert round(sd, 2) == 6.72
+
+def test_motor_cuantil_igual_que_ordenar():
+    # Ventana pequeña para que se expulsen muchas lecturas (con valores repetidos)
+    ventana = VentanaTemporal(60, 32)
+    strategy = StrategyCuantil()
+    random.seed(2)
+
+    # En cada lectura comparamos el motor con ordenar la lista completa, ventanas de longitud par e impar
+    for i in range(200):
+        ventana.append(i * 5 + random.randint(0, 4), random.randint(8, 34))
+        assert strategy.execute('2024-05-01 13:00:00', ventana.vista()) == strategy.execute('2024-05-01 13:00:00', list(ventana.vista()))
+
+def test_motor_maxmin_igual_que_recorrer():
+    # Ventana que expulsa tanto por antiguedad como por capacidad
+    ventana = VentanaTemporal(60, 10)
+    strategy = StrategyMaxMin()
+    random.seed(3)
+    fecha = 0
+
+    # En cada lectura comparamos el motor con recorrer la lista completa
+    for i in range(300):
+        fecha += random.randint(1, 9)
+        ventana.append(fecha, random.randint(8, 34))
+        assert strategy.execute('2024-05-01 13:00:00', ventana.vista()) == strategy.execute('2024-05-01 13:00:00', list(ventana.vista()))
+
+# Posicion (entre 0 y 1) de un valor dentro de una lista ordenada, contando la mitad de los iguales
+def rango_normalizado(ordenada, valor):
+    return (bisect.bisect_left(ordenada, valor) + bisect.bisect_right(ordenada, valor)) / 2 / len(ordenada)
+
+def test_sketch_kll_error_y_fusion():
+    # Dos sketches con datos de distinta distribucion
+    primero, segundo = SketchKLL(k=200, semilla=1), SketchKLL(k=200, semilla=2)
+    datos_primero = [random.gauss(20, 3) for _ in range(30000)]
+    datos_segundo = [random.uniform(0, 40) for _ in range(10000)]
+    for t in datos_primero:
+        primero.append(t)
+    for t in datos_segundo:
+        segundo.append(t)
+
+    # Verificar la memoria acotada y el error en el rango de cada uno y de su fusion
+    assert len(primero) < 3 * 200
+    primero.fusionar(segundo)
+    ordenada = sorted(datos_primero + datos_segundo)
+    assert primero.n == len(ordenada)
+    for q, valor in zip((0.25, 0.5, 0.75), primero.cuantiles()):
+        assert abs(rango_normalizado(ordenada, valor) - q) < 2 * ERROR_KLL / 200
+
+def test_strategy_cuantil_aproximada_ventana_larga(sistema_nuevo, monkeypatch):
+    # Un dia de lecturas cada 5 segundos de dos sensores, con la ventana del sistema de solo 60 segundos
+    monkeypatch.setattr(pcd_entregable2_jorge_adrian, '_salida', SalidaNula())
+    estrategia = StrategyCuantil(aproximado=True, duracion=86400, error=0.02)
+    sistema_nuevo.manager_chain = ContextoEstadisticos()
+    sistema_nuevo.manager_chain.set_strategy(estrategia)
+    inicio = fecha_a_segundos('2024-05-01 00:00:00')
+    datos = {'norte': [], 'sur': []}
+    for i in range(17280):
+        for sensor, t in (('norte', random.randint(0, 99)), ('sur', random.randint(50, 149))):
+            sistema_nuevo.update((segundos_a_fecha(inicio + 5 * i), t, sensor))
+            datos[sensor].append(t)
+    vistas = [sistema_nuevo.get_temp(sensor) for sensor in datos]
+    assert len(vistas[0]) == 13
+
+    # Verificar los cuantiles de cada sensor y los de la zona (fusionando los sketches) con el error pedido
+    ordenada = sorted(datos['norte'])
+    for q, valor in zip((0.25, 0.5, 0.75), estrategia.calcular(vistas[0])):
+        assert abs(rango_normalizado(ordenada, valor) - q) <= 0.02
+    ordenada = sorted(datos['norte'] + datos['sur'])
+    for q, valor in zip((0.25, 0.5, 0.75), estrategia.calcular_zona(vistas)):
+        assert abs(rango_normalizado(ordenada, valor) - q) <= 0.02
+    assert len(estrategia._motor_aproximado(vistas[0]).sketch()) < 3 * estrategia.k
+
+    # Al pasar otro dia con temperaturas altas las antiguas caducan por cubetas
+    for i in range(17280, 2 * 17280):
+        sistema_nuevo.update((segundos_a_fecha(inicio + 5 * i), 200 + i % 10, 'norte'))
+    assert estrategia.calcular(sistema_nuevo.get_temp('norte')).q1 >= 200
+
+# ------------------------------
+# TEST SISTEMA MULTISENSOR
+# ------------------------------
+@pytest.fixture
+def sistema_nuevo(monkeypatch):
+    # Permite crear un SistemaIoT nuevo en cada prueba sin afectar a la instancia unica del resto de pruebas
+    monkeypatch.setattr(SistemaIoT, '_SistemaIoT__instance', None)
+    return SistemaIoT(Mock())
+
+def test_sistema_separa_sensores(sistema_nuevo):
+    # Lecturas intercaladas de dos sensores
+    sistema_nuevo.update(('2024-05-01 12:00:00', 20, 'norte'))
+    sistema_nuevo.update(('2024-05-01 12:00:00', 30, 'sur'))
+    sistema_nuevo.update(('2024-05-01 12:00:05', 21, 'norte'))
+
+    # Verificar que cada sensor tiene su propia ventana e historial y que la cadena recibe solo la ventana del sensor
+    assert sistema_nuevo.get_temp('norte') == [20, 21]
+    assert sistema_nuevo.get_temp('sur') == [30]
+    assert sistema_nuevo.get_date_temp('sur') == [('2024-05-01 12:00:00', 30)]
+    sistema_nuevo.manager_chain.manejar_date_temp.assert_called_with('2024-05-01 12:00:05', [20, 21])
+
+def test_sistema_consultar_varios_sensores(sistema_nuevo):
+    # Lecturas de tres sensores
+    for sensor, t in (('a', 10), ('b', 20), ('c', 30)):
+        sistema_nuevo.update(('2024-05-01 12:00:00', t, sensor))
+
+    # Verificar la consulta conjunta de todos los sensores y de una seleccion (ignorando los que no existen)
+    assert sorted(sistema_nuevo.get_sensores()) == ['a', 'b', 'c']
+    assert sistema_nuevo.consultar(['a', 'c', 'x']) == {'a': ('2024-05-01 12:00:00', [10]), 'c': ('2024-05-01 12:00:00', [30])}
+    assert len(sistema_nuevo.consultar()) == 3
+
+def test_sistema_consultas_no_crean_sensores(sistema_nuevo):
+    # Un sensor con lecturas y consultas de sensores que no existen
+    sistema_nuevo.update(('2024-05-01 12:00:00', 20, 'norte'))
+    assert sistema_nuevo.get_temp('typo') == []
+    assert sistema_nuevo.get_date_temp('otro') == []
+    assert sistema_nuevo.get_date('otro') == sistema_nuevo._vacio.date
+    assert len(sistema_nuevo.get_range('2024-05-01 00:00:00', '2024-05-02 00:00:00', 'x')) == 0
+    assert len(sistema_nuevo.get_latest(5, 'x')) == 0
+    for consulta in (lambda: sistema_nuevo.consultar_rango('x', 0, 10), lambda: sistema_nuevo.serie('x', 0, 60, 60)):
+        with pytest.raises(ErrorNone):
+            consulta()
+
+    # Verificar que solo existe el sensor que ha enviado lecturas
+    assert sistema_nuevo.get_sensores() == ['norte']
+    assert list(sistema_nuevo.consultar()) == ['norte']
+
+def test_sistema_consultar_estadistico_cache(sistema_nuevo):
+    # Estrategia que cuenta cuantas veces se calcula
+    estrategia = StrategyMaxMin()
+    calcular = Mock(side_effect=estrategia.calcular)
+    estrategia.calcular = calcular
+    inicio = fecha_a_segundos('2024-05-01 12:00:00')
+    for i in range(100):
+        sistema_nuevo.update((segundos_a_fecha(inicio + 5 * i), i, 'norte'))
+
+    # Consultas repetidas sin lecturas nuevas no vuelven a calcular
+    assert sistema_nuevo.consultar_estadistico('norte', estrategia) == (99, 87)
+    assert sistema_nuevo.consultar_estadistico('norte', estrategia) == (99, 87)
+    assert sistema_nuevo.consultar_estadistico('norte', estrategia, ventana=3600) == (99, 0)
+    assert sistema_nuevo.consultar_estadistico('norte', estrategia, ventana=3600) == (99, 0)
+    assert calcular.call_count == 2
+
+    # Una lectura nueva invalida los resultados de ese sensor
+    sistema_nuevo.update((segundos_a_fecha(inicio + 500), 40, 'norte'))
+    assert sistema_nuevo.consultar_estadistico('norte', estrategia) == (99, 40)
+    assert calcular.call_count == 3
+
+    # La cache no pasa de tam_cache resultados y expulsa el usado hace mas tiempo
+    sistema_nuevo.tam_cache = 2
+    sistema_nuevo.consultar_estadistico('norte', estrategia, ventana=10)
+    sistema_nuevo.consultar_estadistico('norte', estrategia, ventana=20)
+    assert len(sistema_nuevo._cache) == 2
+    assert ('norte', None, pcd_entregable2_jorge_adrian._clave_estadistico(estrategia)) not in sistema_nuevo._cache
+
+    # Estadisticos creados en cada consulta con la misma clase y parametros comparten el resultado guardado
+    sistema_nuevo.tam_cache = 1024
+    primero = sistema_nuevo.consultar_estadistico('norte', StrategyCuantil(aproximado=False))
+    antes = len(sistema_nuevo._cache)
+    assert sistema_nuevo.consultar_estadistico('norte', StrategyCuantil(aproximado=False)) is primero
+    assert len(sistema_nuevo._cache) == antes
+    sistema_nuevo.consultar_estadistico('norte', StrategyCuantil(error=0.05))
+    assert len(sistema_nuevo._cache) == antes + 1
+    with pytest.raises(ErrorNone):
+        sistema_nuevo.consultar_estadistico('sur', estrategia)
+
+def test_sistema_instantaneas_consistentes(sistema_nuevo):
+    # Un hilo escribe la lectura i (temperatura i) mientras otros leen instantaneas del sensor
+    inicio = fecha_a_segundos('2024-05-01 12:00:00')
+    n = 3000
+    errores = []
+    lecturas = []
+    terminado = threading.Event()
+
+    def escritor():
+        for i in range(n):
+            sistema_nuevo.update((segundos_a_fecha(inicio + 5 * i), i, 'norte'))
+        terminado.set()
+
+    def lector():
+        hechas = 0
+        while not terminado.is_set():
+            try:
+                instantanea = sistema_nuevo.instantanea('norte')
+            except ErrorNone:
+                continue
+            # La fecha, la ventana y el historial deben corresponder a la misma lectura
+            j = int(instantanea.temp[-1])
+            temp = list(instantanea.temp)
+            if (instantanea.version % 2 or instantanea.date != segundos_a_fecha(inicio + 5 * j)
+                    or temp != list(range(j - len(temp) + 1, j + 1)) or len(instantanea.date_temp) != j + 1
+                    or instantanea.date_temp[-1] != (instantanea.date, j)):
+                errores.append(instantanea)
+            hechas += 1
+        lecturas.append(hechas)
+
+    hilos = [threading.Thread(target=escritor)] + [threading.Thread(target=lector) for _ in range(2)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    # Ninguna instantanea mezcla estados y la ultima refleja todas las lecturas
+    assert errores == []
+    assert sum(lecturas) > 0
+    assert len(sistema_nuevo.instantanea('norte').date_temp) == n
+    assert sistema_nuevo.instantanea().version == 2 * n
+    with pytest.raises(ErrorNone):
+        sistema_nuevo.instantanea('sur')
+
+# ------------------------------
+# TEST PLANIFICADOR
+# ------------------------------
+def test_planificador_periodos_por_sensor():
+    # Dos sensores con distinto periodo y un observador Mock en cada uno
+    rapido, lento = Sensor('rapido', periodo=0.01), Sensor('lento', periodo=0.05)
+    for sensor in (rapido, lento):
+        sensor.register_observer(Mock())
+        sensor.resume()
+    planificador = PlanificadorSensores()
+    planificador.registrar(rapido)
+    planificador.registrar(lento)
+
+    # Ejecutamos el planificador durante 0.3 segundos en el hilo actual
+    asyncio.run(planificador.ejecutar(duracion=0.3))
+
+    # Verificar que cada sensor ha medido aproximadamente segun su periodo y con la tupla que incluye su nombre
+    lecturas_rapido = rapido._observers[0].update.call_count
+    lecturas_lento = lento._observers[0].update.call_count
+    assert 15 <= lecturas_rapido <= 31
+    assert 3 <= lecturas_lento <= 7
+    assert lento._observers[0].update.call_args[0][0][2] == 'lento'
+    assert planificador.estadisticas()['ticks'] == lecturas_rapido + lecturas_lento
+
+def test_planificador_pausa_y_salida():
+    # Un sensor pausado y otro que ya ha salido
+    pausado, terminado = Sensor('pausado', periodo=0.01), Sensor('terminado', periodo=0.01)
+    for sensor in (pausado, terminado):
+        sensor.register_observer(Mock())
+    terminado.resume()
+    terminado.exit()
+    planificador = PlanificadorSensores()
+    planificador.registrar(pausado)
+    planificador.registrar(terminado)
+
+    # Al salir el ultimo sensor que quede, el planificador termina solo
+    hilo = planificador.iniciar_en_hilo()
+    time.sleep(0.1)
+    pausado.exit()
+    hilo.join(timeout=1)
+
+    # Verificar que ninguno ha medido y que el hilo ha terminado
+    assert not hilo.is_alive()
+    pausado._observers[0].update.assert_not_called()
+    terminado._observers[0].update.assert_not_called()
+
+def test_planificador_registro_concurrente():
+    # Varios hilos registran sensores mientras el planificador recoge los nuevos
+    planificador = PlanificadorSensores()
+    hilos = [threading.Thread(target=lambda h=h: [planificador.registrar(Sensor(f's{h}_{i}')) for i in range(500)])
+             for h in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    while any(hilo.is_alive() for hilo in hilos):
+        planificador._planificar_nuevos(0.0)
+    for hilo in hilos:
+        hilo.join()
+    planificador._planificar_nuevos(0.0)
+
+    # Verificar que no se ha perdido ningun sensor
+    assert len(planificador._cola) == 2000
+    assert not planificador._nuevos
+
+# ------------------------------
+# TEST REPRODUCCION
+# ------------------------------
+def test_reproducir_semilla_determinista():
+    # Dos reproducciones con la misma semilla deben dar exactamente las mismas lecturas
+    historiales = []
+    for _ in range(2):
+        reloj = RelojSimulado(fecha_a_segundos("2024-05-01 00:00:00"))
+        sensor = Sensor('a', periodo=5, reloj=reloj, fuente=FuenteAleatoria(semilla=42))
+        observador = Mock()
+        sensor.register_observer(observador)
+        sensor.resume()
+        assert reproducir([sensor], reloj, duracion=60) == 12
+        historiales.append([llamada[0][0][:3] for llamada in observador.update.call_args_list])
+
+    # Verificar que las fechas avanzan segun el periodo y que ambas reproducciones coinciden
+    assert historiales[0] == historiales[1]
+    assert historiales[0][0][0] == "2024-05-01 00:00:00"
+    assert historiales[0][-1][0] == "2024-05-01 00:00:55"
+    assert all(8 <= t <= 34 for _, t, _ in historiales[0])
+
+def test_reproducir_traza(sistema_nuevo):
+    # Reproducimos una traza grabada a traves del SistemaIoT
+    traza = [("2024-05-01 12:00:00", 20), ("2024-05-01 12:00:05", 22), ("2024-05-01 12:00:10", 25)]
+    reloj = RelojSimulado()
+    sensor = Sensor('a', periodo=5, reloj=reloj, fuente=FuenteTraza(traza))
+    sensor.register_observer(sistema_nuevo)
+    sensor.resume()
+
+    # Verificar que la traza termina sola y que el historial del sistema es la traza
+    assert reproducir([sensor], reloj) == 3
+    assert not sensor.running
+    assert sistema_nuevo.get_date_temp('a') == traza
+
+def test_reproducir_semana_rapido(sistema_nuevo):
+    # Una semana de lecturas de dos sensores (una cada 5 segundos) por toda la cadena de responsabilidad
+    reloj = RelojSimulado(fecha_a_segundos("2024-05-01 00:00:00"))
+    sensores = [Sensor(nombre, periodo=5, reloj=reloj, fuente=FuenteAleatoria(semilla=i)) for i, nombre in enumerate('ab')]
+    for sensor in sensores:
+        sensor.register_observer(sistema_nuevo)
+        sensor.resume()
+    sensores[1].pause()
+
+    inicio = time.perf_counter()
+    lecturas = reproducir(sensores, reloj, duracion=7 * 24 * 3600)
+
+    # Verificar que solo ha medido el sensor activo, que acaba en la ultima lectura de la semana y que tarda poco
+    assert lecturas == 7 * 24 * 3600 // 5
+    assert sistema_nuevo.get_sensores() == ['a']
+    assert sistema_nuevo.get_date('a') == "2024-05-07 23:59:55"
+    assert time.perf_counter() - inicio < 30
+
+# ------------------------------
+# TEST DESPACHO EN COLA
+# ------------------------------
+# Observador que se queda bloqueado en la primera lectura hasta que se le deja continuar
+class ObservadorLento(Observer):
+    def __init__(self):
+        self.recibidas = []
+        self.empezado = threading.Event()
+        self.continuar = threading.Event()
+
+    def update(self, date_temp):
+        self.empezado.set()
+        self.continuar.wait()
+        self.recibidas.append(date_temp)
+
+def notificar_con_observador_lento(politica):
+    # Observable con un observador lento y una cola de capacidad 2
+    observable = Observable()
+    observador = ObservadorLento()
+    observable.register_observer(observador)
+    despacho = DespachoCola(capacidad=2, politica=politica)
+    observable.set_despacho(despacho)
+
+    # La primera lectura bloquea al trabajador y las siguientes llenan la cola sin bloquear al observable
+    observable.notify_observers(1)
+    observador.empezado.wait(1)
+    for t in range(2, 6):
+        observable.notify_observers(t)
+    estadisticas = despacho.estadisticas()
+    observador.continuar.set()
+    despacho.cerrar()
+    return observador.recibidas, estadisticas
+
+def test_despacho_descartar_antigua():
+    recibidas, estadisticas = notificar_con_observador_lento(DESCARTAR_ANTIGUA)
+
+    # Verificar que se descartan las lecturas mas antiguas de la cola
+    assert recibidas == [1, 4, 5]
+    assert estadisticas['profundidad'] == 2
+    assert estadisticas['descartadas'] == 2
+
+def test_despacho_fusionar():
+    recibidas, estadisticas = notificar_con_observador_lento(FUSIONAR)
+
+    # Verificar que la lectura pendiente del sensor se sustituye por la mas reciente
+    assert recibidas == [1, 2, 5]
+    assert estadisticas['fusionadas'] == 2
+    assert estadisticas['descartadas'] == 0
+
+def test_despacho_bloquear_mantiene_orden_por_sensor():
+    # Dos sensores que notifican a un mismo Mock a traves de un despacho con varios trabajadores y cola muy pequeña
+    despacho = DespachoCola(capacidad=1, trabajadores=3)
+    observador = Mock()
+    sensores = [Observable(), Observable()]
+    for sensor in sensores:
+        sensor.register_observer(observador)
+        sensor.set_despacho(despacho)
+    for t in range(50):
+        for i, sensor in enumerate(sensores):
+            sensor.notify_observers((i, t))
+    despacho.vaciar()
+
+    # Verificar que no se pierde ninguna lectura y que las de cada sensor llegan en orden
+    lecturas = [llamada[0][0] for llamada in observador.update.call_args_list]
+    assert despacho.estadisticas()['procesadas'] == 100
+    assert [t for i, t in lecturas if i == 0] == list(range(50))
+    assert [t for i, t in lecturas if i == 1] == list(range(50))
+    despacho.cerrar()
+
+def test_despacho_observador_que_falla():
+    # Un observador que siempre lanza una excepcion y otro normal, con una cola de capacidad 2 que bloquea al llenarse
+    despacho = DespachoCola(capacidad=2)
+    fallido, observador = Mock(), Mock()
+    fallido.update.side_effect = RuntimeError('fallo')
+    sensor = Observable()
+    sensor.register_observer(fallido)
+    sensor.register_observer(observador)
+    sensor.set_despacho(despacho)
+
+    # Notificamos y vaciamos desde otro hilo para que el test no se quede colgado si el trabajador muere
+    hilo = threading.Thread(target=lambda: ([sensor.notify_observers(t) for t in range(10)], despacho.vaciar()), daemon=True)
+    hilo.start()
+    hilo.join(timeout=2)
+
+    # Verificar que el trabajador sigue vivo, que el otro observador recibe todo y que se cuentan los fallos
+    assert not hilo.is_alive()
+    assert [llamada[0][0] for llamada in observador.update.call_args_list] == list(range(10))
+    estadisticas = despacho.estadisticas()
+    assert estadisticas['procesadas'] == 10 and estadisticas['fallidas'] == 10
+    assert isinstance(despacho.ultimo_error, RuntimeError)
+    despacho.cerrar()
+
+def test_aumento_con_timestamps_y_jitter():
+    # Lecturas con un intervalo irregular entre 1 y 9 segundos
+    ventana = VentanaTemporal(60, 64)
+    aumento = Aumento()
+    random.seed(4)
+    lecturas = []
+    fecha = 0
+
+    # En cada lectura comparamos con la mayor subida calculada a mano con las lecturas de los ultimos 30 segundos
+    for i in range(300):
+        fecha += random.randint(1, 9)
+        lecturas.append((fecha, random.randint(8, 34)))
+        ventana.append(*lecturas[-1])
+        minimo = min(t for f, t in lecturas if f >= fecha - 30)
+        assert aumento.manejar_date_temp('2024-05-01 13:00:00', ventana.vista()) == (lecturas[-1][1] - minimo > 10)
+
+def test_aumento_alta_frecuencia():
+    # Una lectura por segundo subiendo medio grado cada vez (12 grados en 24 segundos)
+    ventana = VentanaTemporal(60, 128)
+    for i in range(25):
+        ventana.append(i, 10 + i / 2)
+
+    # Verificar que se detecta la subida aunque entre temp[-1] y temp[-6] solo haya 2.5 grados
+    assert Aumento().manejar_date_temp('2024-05-01 13:00:24', ventana.vista()) == True
+    assert Aumento(segundos=10).manejar_date_temp('2024-05-01 13:00:24', ventana.vista()) == False
+
+def test_aumento_lecturas_repetidas_y_expulsion_por_capacidad():
+    # Diez lecturas por segundo: diez de 10 grados en el primer segundo, luego de 20 y al final una de 29
+    # Con 131 lecturas y capacidad 128 la ventana expulsa tres de las de 10 grados, pero quedan siete dentro
+    fechas = [0] * 10 + [1 + i // 10 for i in range(120)] + [13]
+    temps = [10] * 10 + [20] * 120 + [29]
+    ventana = VentanaTemporal(60, 128)
+    aumento = Aumento()
+    resultados = []
+    for fecha, t in zip(fechas, temps):
+        ventana.append(fecha, t)
+        resultados.append(aumento.manejar_date_temp('2024-05-01 13:00:00', ventana.vista()))
+
+    # Verificar que el minimo de la ventana sigue siendo 10 y que el calculo por lotes da lo mismo
+    assert ventana.motor(MotorAumento, 30).resultado() == 19
+    assert resultados[-1] == True
+    np = pytest.importorskip('numpy')
+    lote = estadisticos_lote(np.array(fechas, dtype=np.int64), np.array(temps, dtype=np.float64))
+    assert lote['aumento'].tolist() == resultados
+
+# ------------------------------
+# TEST HISTORIAL COLUMNAR
+# ------------------------------
+def test_historial_columnar_varios_bloques():
+    # Historial con suficientes lecturas para ocupar varios bloques y temperaturas con decimales
+    historial = HistorialColumnar()
+    inicio = fecha_a_segundos('2024-05-01 12:00:00')
+    lecturas = [(segundos_a_fecha(inicio + 5 * i), 20 + (i % 7) / 4) for i in range(1000)]
+    for date, t in lecturas:
+        historial.append(fecha_a_segundos(date), t)
+
+    # Verificar que la vista devuelve las mismas tuplas, por indice, slice e iteracion
+    vista = historial.vista()
+    assert len(historial._fechas) > 1
+    assert vista == lecturas
+    assert vista[0] == ('2024-05-01 12:00:00', 20)
+    assert vista[-1] == lecturas[-1]
+    assert vista[100:300] == lecturas[100:300]
+    assert vista[::250] == lecturas[::250]
+
+def test_historial_vista_fija_su_longitud(sistema_nuevo):
+    # Obtenemos la vista del historial y despues llega otra lectura
+    sistema_nuevo.update(('2024-05-01 12:00:00', 20, 'norte'))
+    vista = sistema_nuevo.get_date_temp('norte')
+    sistema_nuevo.update(('2024-05-01 12:00:05', 21, 'norte'))
+
+    # Verificar que la vista mantiene las lecturas que habia al obtenerla
+    assert vista == [('2024-05-01 12:00:00', 20)]
+    assert len(sistema_nuevo.get_date_temp('norte')) == 2
+
+def test_historial_guarda_temperaturas_exactas(sistema_nuevo):
+    # Lecturas con mas de dos decimales
+    temps = [20.123, 21.4567, 19.999, 22]
+    for i, t in enumerate(temps):
+        sistema_nuevo.update((segundos_a_fecha(fecha_a_segundos('2024-05-01 12:00:00') + 5 * i), t, 'norte'))
+
+    # Verificar que el historial no redondea y que el estadistico es el mismo desde la ventana y desde el historial
+    assert [t for _, t in sistema_nuevo.get_date_temp('norte')] == temps
+    estrategia = StrategyMeanSd()
+    assert sistema_nuevo.consultar_estadistico('norte', estrategia, ventana=60) == pytest.approx(sistema_nuevo.consultar_estadistico('norte', estrategia))
+
+def test_historial_rangos_y_ultimas(sistema_nuevo):
+    # 1000 lecturas cada 5 segundos (ocupan varios bloques del historial)
+    inicio = fecha_a_segundos('2024-05-01 12:00:00')
+    lecturas = [(segundos_a_fecha(inicio + 5 * i), random.randint(8, 34)) for i in range(1000)]
+    for date, t in lecturas:
+        sistema_nuevo.update((date, t, 'norte'))
+
+    # Verificar los rangos [start, end) con fechas como texto o en segundos, incluidos los que no tienen lecturas
+    assert sistema_nuevo.get_range('2024-05-01 12:10:00', '2024-05-01 12:20:00', 'norte') == lecturas[120:240]
+    assert sistema_nuevo.get_range(inicio + 1, inicio + 4998, 'norte') == lecturas[1:1000]
+    assert len(sistema_nuevo.get_range(inicio - 100, inicio, 'norte')) == 0
+    assert len(sistema_nuevo.get_range(inicio + 5000, inicio + 6000, 'norte')) == 0
+
+    # Verificar las ultimas n lecturas y el recorrido por columnas sin copiar
+    assert sistema_nuevo.get_latest(3, 'norte') == lecturas[-3:]
+    assert sistema_nuevo.get_latest(5000, 'norte') == lecturas
+    tramos = list(sistema_nuevo.get_range(inicio + 500, inicio + 4000, 'norte').tramos())
+    assert len(tramos) > 1
+    assert [f for fechas, _ in tramos for f in fechas] == [inicio + 5 * i for i in range(100, 800)]
+    assert [t for _, temps in tramos for t in temps] == [t for _, t in lecturas[100:800]]
+
+def test_historial_rangos_invertidos_y_ultimas_negativas(sistema_nuevo):
+    inicio = fecha_a_segundos('2024-05-01 12:00:00')
+    for i in range(100):
+        sistema_nuevo.update((segundos_a_fecha(inicio + 5 * i), 20, 'norte'))
+
+    # Un rango con el final antes del inicio es una vista vacia
+    invertido = sistema_nuevo.get_range(inicio + 400, inicio + 100, 'norte')
+    assert len(invertido) == 0 and list(invertido) == [] and list(invertido.tramos()) == []
+    assert sistema_nuevo.get_latest(0, 'norte') == []
+
+    # Pedir un numero negativo de ultimas lecturas es un error
+    with pytest.raises(ValueError):
+        sistema_nuevo.get_latest(-1, 'norte')
+
+# ------------------------------
+# TEST AGREGADOS
+# ------------------------------
+def test_agregados_igual_que_lecturas(sistema_nuevo):
+    # Tres dias de lecturas cada 5 segundos (con la primera a mitad de un minuto)
+    inicio = fecha_a_segundos('2024-05-01 00:00:35')
+    lecturas = [(inicio + 5 * i, random.randint(8, 34)) for i in range(3 * 24 * 720)]
+    for segundos, t in lecturas:
+        sistema_nuevo.update((segundos_a_fecha(segundos), t, 'norte'))
+
+    # Verificar rangos arbitrarios (sin alinear a minutos, horas ni dias) contra el calculo directo
+    for desde, hasta in ((inicio, inicio + 3 * 86400), (inicio + 1234, inicio + 200_000), (inicio + 10, inicio + 20)):
+        temps = [t for segundos, t in lecturas if desde <= segundos < hasta]
+        agregado = sistema_nuevo.consultar_rango('norte', desde, hasta)
+        assert agregado.n == len(temps)
+        assert agregado.maximo == max(temps) and agregado.minimo == min(temps)
+        assert agregado.media == pytest.approx(sum(temps) / len(temps))
+        assert agregado.sd == pytest.approx(StrategyMeanSd().calcular(temps).sd)
+    assert sistema_nuevo.consultar_rango('norte', inicio - 100, inicio) is None
+
+    # Verificar la serie diaria (el dia 1 empieza con la primera lectura) y por dos horas
+    diaria = sistema_nuevo.serie('norte', '2024-05-01 00:00:00', '2024-05-04 00:00:00', 86400)
+    assert [segundos_a_fecha(a.inicio) for a in diaria] == ['2024-05-01 00:00:00', '2024-05-02 00:00:00', '2024-05-03 00:00:00', '2024-05-04 00:00:00'][:len(diaria)]
+    assert sum(a.n for a in diaria) == len([1 for segundos, _ in lecturas if segundos < fecha_a_segundos('2024-05-04 00:00:00')])
+    assert diaria[1].maximo == max(t for segundos, t in lecturas if diaria[1].inicio <= segundos < diaria[1].inicio + 86400)
+    assert len(sistema_nuevo.serie('norte', '2024-05-01 00:00:00', '2024-05-02 00:00:00', 7200)) == 12
+    with pytest.raises(ValueError):
+        sistema_nuevo.serie('norte', inicio, inicio + 86400, 90)
+
+def test_agregados_compactar(sistema_nuevo):
+    # Dos dias de lecturas cada 5 segundos
+    inicio = fecha_a_segundos('2024-05-01 00:00:00')
+    lecturas = [(inicio + 5 * i, random.randint(8, 34)) for i in range(2 * 17280)]
+    for segundos, t in lecturas:
+        sistema_nuevo.update((segundos_a_fecha(segundos), t, 'norte'))
+    antes = sistema_nuevo.consultar_rango('norte', inicio + 7, inicio + 2 * 86400)
+
+    # Compactamos todo lo anterior a las ultimas 6 horas y medio minuto (el corte se alinea al minuto)
+    descartadas = sistema_nuevo.compactar(6 * 3600 + 30)
+    historial = sistema_nuevo.get_date_temp('norte')
+    assert descartadas + len(historial) == len(lecturas)
+    assert historial[0] == ('2024-05-02 17:59:00', lecturas[descartadas][1])
+    assert sistema_nuevo.compactar(6 * 3600 + 30) == 0
+
+    # En la parte compactada se usan los agregados por minuto: se pierden las lecturas del primer minuto, que empieza antes del rango
+    despues = sistema_nuevo.consultar_rango('norte', inicio + 7, inicio + 2 * 86400)
+    assert despues.n == antes.n - 10 and despues.maximo == antes.maximo
+    reciente = sistema_nuevo.consultar_rango('norte', '2024-05-02 20:00:03', '2024-05-02 21:00:00')
+    assert reciente.n == 719
+
+# ------------------------------
+# TEST REGISTRO EN DISCO
+# ------------------------------
+def test_registro_restaura_ventanas(sistema_nuevo, tmp_path, monkeypatch):
+    # Una hora de lecturas de dos sensores guardadas en el registro
+    ruta = str(tmp_path / 'lecturas.bin')
+    registro = RegistroLecturas(ruta, bloque=100)
+    sistema_nuevo.set_registro(registro)
+    inicio = fecha_a_segundos('2024-05-01 12:00:00')
+    for i in range(720):
+        for sensor in ('norte', 'sur'):
+            sistema_nuevo.update((segundos_a_fecha(inicio + 5 * i), 10 + i % 20, sensor))
+    registro.cerrar()
+
+    # Reiniciamos con un sistema nuevo que recupera las ventanas desde el registro
+    monkeypatch.setattr(SistemaIoT, '_SistemaIoT__instance', None)
+    reiniciado = SistemaIoT(Mock())
+    registro = RegistroLecturas(ruta)
+    reiniciado.set_registro(registro)
+
+    # Verificar que las ventanas y fechas son las mismas y que solo se han leido los ultimos 60 segundos
+    assert len(registro) == 1440
+    for sensor in ('norte', 'sur'):
+        assert reiniciado.get_temp(sensor) == sistema_nuevo.get_temp(sensor)
+        assert reiniciado.get_date(sensor) == sistema_nuevo.get_date(sensor)
+    assert {sensor: len(lecturas) for sensor, lecturas in registro.colas(60, 128).items()} == {'norte': 13, 'sur': 13}
+    registro.cerrar()
+
+def test_registro_restaura_sensor_sin_lecturas_recientes(sistema_nuevo, tmp_path, monkeypatch):
+    # El sensor 'a' mide durante un minuto y deja de medir; 'b' sigue midiendo diez minutos mas
+    # Despues se importa un lote antiguo de 'c', que queda al final del registro fuera de orden de tiempo
+    ruta = str(tmp_path / 'lecturas.bin')
+    registro = RegistroLecturas(ruta, bloque=16)
+    sistema_nuevo.set_registro(registro)
+    inicio = fecha_a_segundos('2024-05-01 12:00:00')
+    for i in range(13):
+        sistema_nuevo.update((segundos_a_fecha(inicio + 5 * i), 20 + i, 'a'))
+    for i in range(13, 133):
+        sistema_nuevo.update((segundos_a_fecha(inicio + 5 * i), 15, 'b'))
+    for i in range(10):
+        sistema_nuevo.update((segundos_a_fecha(inicio - 3600 + 5 * i), 30 + i, 'c'))
+    registro.cerrar()
+
+    # Reiniciamos con un sistema nuevo que recupera las ventanas desde el registro
+    monkeypatch.setattr(SistemaIoT, '_SistemaIoT__instance', None)
+    reiniciado = SistemaIoT(Mock())
+    registro = RegistroLecturas(ruta)
+    reiniciado.set_registro(registro)
+
+    # Verificar que cada sensor recupera su propia ventana
+    for sensor in ('a', 'b', 'c'):
+        assert list(reiniciado.get_temp(sensor)) == list(sistema_nuevo.get_temp(sensor))
+        assert reiniciado.get_date(sensor) == sistema_nuevo.get_date(sensor)
+    assert len(reiniciado.get_temp('a')) == 13
+    registro.cerrar()
+
+def test_registro_nombres_con_saltos_de_linea(tmp_path):
+    # Nombres de sensores con saltos de linea y caracteres no ASCII
+    ruta = str(tmp_path / 'lecturas.bin')
+    registro = RegistroLecturas(ruta)
+    for i, sensor in enumerate(('a\nb', 'c', 'invernadero\r\nño', '')):
+        registro.append(sensor, i, 20.5)
+    registro.cerrar()
+
+    # Verificar que al abrir de nuevo cada lectura sigue asignada a su sensor
+    copia = RegistroLecturas(ruta)
+    assert [sensor for sensor, fecha, t in copia.leer()] == ['a\nb', 'c', 'invernadero\r\nño', '']
+    copia.cerrar()
+
+def test_registro_ignora_lecturas_sin_sincronizar(tmp_path):
+    # Registro que sincroniza cada 10 lecturas, con 15 lecturas escritas
+    ruta = str(tmp_path / 'lecturas.bin')
+    registro = RegistroLecturas(ruta, cada=10, intervalo=3600)
+    for i in range(15):
+        registro.append('norte', i, 20.5)
+
+    # Si el proceso se cae antes de sincronizar, al abrir de nuevo solo aparecen las confirmadas
+    copia = RegistroLecturas(ruta)
+    assert len(copia) == 10
+    assert list(copia.leer(8)) == [('norte', 8, 20.5), ('norte', 9, 20.5)]
+    registro.cerrar()
+
+def test_registro_fichero_no_valido(tmp_path):
+    # Fichero que no es un registro de lecturas
+    ruta = tmp_path / 'otro.bin'
+    ruta.write_bytes(b'x' * 64)
+
+    # Verificar que salta el error y que no se modifica el fichero
+    with pytest.raises(ErrorRegistro):
+        RegistroLecturas(str(ruta))
+    assert ruta.read_bytes() == b'x' * 64
+
+# ------------------------------
+# TEST INGESTA POR LOTES
+# ------------------------------
+def resultados_lectura_a_lectura(fechas, temps, umbral, aumento, capacidad=128):
+    # Calcula los resultados de cada lectura con las estrategias y manejadores sobre la ventana, como en SistemaIoT.update
+    ventana = VentanaTemporal(60, capacidad)
+    resultados = []
+    for fecha, t in zip(fechas, temps):
+        ventana.append(fecha, t)
+        vista = ventana.vista()
+        resultados.append(StrategyMeanSd().execute('', vista) + StrategyCuantil().execute('', vista) + StrategyMaxMin().execute('', vista)
+                          + (umbral.manejar_date_temp('', vista), aumento.manejar_date_temp('', vista)))
+    return resultados
+
+def test_update_batch_igual_que_lectura_a_lectura(sistema_nuevo):
+    np = pytest.importorskip('numpy')
+    # Lecturas con intervalos irregulares (incluidas varias en el mismo segundo) y ventana de capacidad pequeña
+    random.seed(5)
+    fechas, temps, fecha = [], [], fecha_a_segundos('2024-05-01 12:00:00')
+    for i in range(400):
+        fecha += random.randint(0, 8)
+        fechas.append(fecha)
+        temps.append(random.randint(8, 34) + random.choice((0, 0.25)))
+    sistema_nuevo.capacidad = 16
+    sistema_nuevo.manager_chain = ContextoEstadisticos(Umbral(Aumento(segundos=20, incremento=8), umbral=25))
+    esperados = resultados_lectura_a_lectura(fechas, temps, Umbral(umbral=25), Aumento(segundos=20, incremento=8), capacidad=16)
+
+    # Ingesta en dos lotes para comprobar que el segundo continua la ventana del primero
+    lote1 = sistema_nuevo.update_batch(fechas[:150], temps[:150], 'norte')
+    lote2 = sistema_nuevo.update_batch(fechas[150:], temps[150:], 'norte')
+    campos = ('media', 'sd', 'q1', 'mediana', 'q3', 'maximo', 'minimo', 'umbral', 'aumento')
+    obtenidos = [tuple(lote[campo][i] for campo in campos) for lote in (lote1, lote2) for i in range(len(lote['media']))]
+
+    # Verificar los resultados de cada lectura y el estado final del sistema
+    assert len(obtenidos) == len(esperados)
+    for obtenido, esperado in zip(obtenidos, esperados):
+        assert obtenido == pytest.approx(esperado)
+    assert sistema_nuevo.get_temp('norte') == temps[-len(sistema_nuevo.get_temp('norte')):]
+    assert len(sistema_nuevo.get_date_temp('norte')) == 400
+    assert sistema_nuevo.get_date('norte') == segundos_a_fecha(fechas[-1])
+
+def test_update_batch_vacio(sistema_nuevo):
+    np = pytest.importorskip('numpy')
+    # Lote vacio de un sensor nuevo y de uno con lecturas
+    vacio = sistema_nuevo.update_batch([], [], 'z')
+    sistema_nuevo.update(('2024-05-01 12:00:00', 20, 'norte'))
+    assert estadisticos_lote(np.array([0]), np.array([20.0]), desde=1)['media'].size == 0
+    resultado = sistema_nuevo.update_batch([], [], 'norte')
+
+    # Verificar que se devuelven arrays vacios y que no cambia el estado
+    for lote in (vacio, resultado):
+        assert set(lote) == {'media', 'sd', 'q1', 'mediana', 'q3', 'maximo', 'minimo', 'umbral', 'aumento'}
+        assert all(len(valores) == 0 for valores in lote.values())
+    assert sistema_nuevo.get_sensores() == ['norte']
+    assert sistema_nuevo.get_temp('norte') == [20]
+
+def test_update_batch_conserva_motor_aproximado(sistema_nuevo, monkeypatch):
+    pytest.importorskip('numpy')
+    # Cuantiles aproximados de un dia: 2000 lecturas a 0 y 3000 a 100 lectura a lectura, y despues un lote de 10 a 100
+    monkeypatch.setattr(pcd_entregable2_jorge_adrian, '_salida', SalidaNula())
+    estrategia = StrategyCuantil(aproximado=True, duracion=86400)
+    sistema_nuevo.manager_chain = ContextoEstadisticos()
+    sistema_nuevo.manager_chain.set_strategy(estrategia)
+    inicio = fecha_a_segundos('2024-05-01 00:00:00')
+    for i in range(5000):
+        sistema_nuevo.update((segundos_a_fecha(inicio + 5 * i), 0 if i < 2000 else 100, 'norte'))
+    assert sistema_nuevo.manager_chain.manejar_date_temp('', sistema_nuevo.get_temp('norte')) == {'q1': 0, 'mediana': 100, 'q3': 100}
+    sistema_nuevo.update_batch([inicio + 5 * i for i in range(5000, 5010)], [100] * 10, 'norte')
+
+    # Verificar que el motor aproximado sigue cubriendo todo el dia (el resto se recrean con la ventana)
+    motor = estrategia._motor_aproximado(sistema_nuevo.get_temp('norte'))
+    assert motor.sketch().n == 5010
+    assert estrategia.calcular(sistema_nuevo.get_temp('norte')) == (0, 100, 100)
+
+# ------------------------------
+# TEST SISTEMA DISTRIBUIDO
+# ------------------------------
+def test_sistema_distribuido_igual_que_un_proceso(monkeypatch):
+    # Las mismas lecturas de 5 sensores en un SistemaIoT y repartidas entre 2 procesos con lotes pequeños
+    monkeypatch.setattr(pcd_entregable2_jorge_adrian, '_salida', SalidaNula())
+    monkeypatch.setattr(SistemaIoT, '_SistemaIoT__instance', None)
+    local = SistemaIoT(cadena_estadisticos())
+    distribuido = SistemaDistribuido(procesos=2, lote=16)
+    try:
+        inicio = fecha_a_segundos('2024-05-01 12:00:00')
+        resultados = {}
+        for i in range(200):
+            for sensor in ('a', 'b', 'c', 'd', 'e'):
+                date_temp = (segundos_a_fecha(inicio + 5 * i), random.randint(8, 34), sensor)
+                resultados[sensor] = local.update(date_temp)
+                distribuido.update(date_temp)
+
+        # Verificar que cada sensor tiene la misma fecha, ventana y ultimo resultado de la cadena
+        consulta = distribuido.consultar()
+        assert sorted(consulta) == sorted(distribuido.get_sensores()) == ['a', 'b', 'c', 'd', 'e']
+        for sensor, (date, temps, resultado) in consulta.items():
+            assert date == local.get_date(sensor)
+            assert temps == list(local.get_temp(sensor))
+            assert resultado == resultados[sensor]
+        assert list(distribuido.consultar(['b', 'x'])) == ['b']
+
+        # Un bloque de lecturas de un sensor nuevo, mas largo que varios lotes
+        temps = [random.randint(8, 34) for _ in range(50)]
+        distribuido.update_lecturas('f', [inicio + 5 * i for i in range(50)], temps)
+        date, ventana, resultado = distribuido.consultar(['f'])['f']
+        assert date == segundos_a_fecha(inicio + 5 * 49)
+        assert ventana == temps[-13:]
+        assert resultado['maximo'] == max(temps[-13:])
+        assert distribuido.lecturas == 1050
+    finally:
+        distribuido.cerrar()
+
+# ------------------------------
+# TEST SERVIDOR DE LECTURAS
+# ------------------------------
+def test_tramas_codificar_y_decodificar():
+    # Dos tramas seguidas y el principio de una tercera
+    inicio = fecha_a_segundos('2024-05-01 12:00:00')
+    datos = codificar_trama('norte', [inicio, inicio + 5], [20.5, 21]) + codificar_trama('sur-ñ', [inicio], [30], enviado_ns=7)
+    tercera = codificar_trama('este', [inicio], [10])
+
+    # Verificar que se decodifican las completas y se indica donde empieza la incompleta
+    tramas, consumidos = decodificar_tramas(datos + tercera[:20])
+    assert consumidos == len(datos)
+    assert [(sensor, list(fechas), list(temps)) for sensor, fechas, temps, _ in tramas] == [('norte', [inicio, inicio + 5], [20.5, 21.0]), ('sur-ñ', [inicio], [30.0])]
+    assert tramas[1][3] == 7
+    with pytest.raises(ErrorRegistro):
+        decodificar_tramas(b'XXXX' + datos[4:])
+
+def test_tramas_grandes_y_nombres_no_validos():
+    # Mas lecturas de las que caben en una trama
+    n = MAX_LECTURAS_TRAMA + 10
+    datos = codificar_trama('norte', range(n), [20.5] * n, enviado_ns=7)
+    tramas, consumidos = decodificar_tramas(datos)
+    assert consumidos == len(datos)
+    assert [len(fechas) for _, fechas, _, _ in tramas] == [MAX_LECTURAS_TRAMA, 10]
+    assert list(tramas[1][1]) == list(range(MAX_LECTURAS_TRAMA, n))
+
+    # Nombres que no son UTF-8 o demasiado largos
+    trama = codificar_trama('ab', [0], [20])
+    with pytest.raises(ErrorRegistro):
+        decodificar_tramas(trama.replace(b'ab', b'\xff\xfe', 1))
+    with pytest.raises(ErrorRegistro):
+        codificar_trama('x' * 70000, [0], [20])
+
+def test_servidor_lecturas_udp_y_tcp(sistema_nuevo):
+    servidor = ServidorLecturas(sistema_nuevo)
+    hilo = servidor.iniciar_en_hilo()
+    inicio = fecha_a_segundos('2024-05-01 12:00:00')
+    try:
+        # Una trama por UDP y dos por TCP, la segunda partida en dos envios, y dos datagramas no validos
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp:
+            udp.sendto(codificar_trama('norte', [inicio, inicio + 5], [20, 21]), ('127.0.0.1', servidor.puerto_udp))
+            udp.sendto(b'basura', ('127.0.0.1', servidor.puerto_udp))
+            udp.sendto(codificar_trama('ab', [inicio], [20]).replace(b'ab', b'\xff\xfe', 1), ('127.0.0.1', servidor.puerto_udp))
+        with socket.create_connection(('127.0.0.1', servidor.puerto_tcp)) as tcp:
+            trama = codificar_trama('sur', [inicio + 5 * i for i in range(100)], list(range(100)))
+            tcp.sendall(codificar_trama('sur', [inicio - 5], [9]) + trama[:50])
+            time.sleep(0.05)
+            tcp.sendall(trama[50:])
+            limite = time.monotonic() + 2
+            while servidor.lecturas < 103 and time.monotonic() < limite:
+                time.sleep(0.01)
+    finally:
+        servidor.detener()
+        hilo.join(timeout=2)
+
+    # Verificar que el sistema ha recibido todas las lecturas en orden y que la cadena ha pasado por ellas
+    assert not hilo.is_alive()
+    assert sistema_nuevo.get_date_temp('norte') == [('2024-05-01 12:00:00', 20), ('2024-05-01 12:00:05', 21)]
+    assert len(sistema_nuevo.get_date_temp('sur')) == 101
+    assert sistema_nuevo.get_date('sur') == segundos_a_fecha(inicio + 495)
+    assert sistema_nuevo.manager_chain.manejar_date_temp.call_count == 103
+    estadisticas = servidor.estadisticas()
+    assert (estadisticas['tramas'], estadisticas['lecturas'], estadisticas['erroneas']) == (3, 103, 2)
+    assert estadisticas['latencia']['llamadas'] == 3
+
+# ------------------------------
+# TEST IMPORTACION DE HISTORICOS
+# ------------------------------
+def test_conversor_fechas():
+    # Fechas de varios dias (con cambio de mes y de año) convertidas con el dia guardado
+    conversor = ConversorFechas()
+    for fecha in ('2024-05-01 00:00:00', '2024-05-01 23:59:59', '2024-05-31 12:30:05', '2024-06-01 00:00:01', '2024-12-31 23:59:59', '2025-01-01 00:00:00'):
+        assert conversor.segundos(fecha) == fecha_a_segundos(fecha)
+    with pytest.raises(ValueError):
+        conversor.segundos('fecha')
+
+def test_importar_csv_y_binario(sistema_nuevo, tmp_path):
+    # CSV con cabecera, dos sensores intercalados, una linea vacia y lineas sin sensor, leido en bloques pequeños
+    inicio = fecha_a_segundos('2024-05-01 23:59:00')
+    lineas = ['fecha,temperatura,sensor']
+    for i in range(200):
+        lineas.append(f"{segundos_a_fecha(inicio + 5 * i)},{i % 30 + 0.5},{'norte' if i % 2 else 'sur'}")
+    lineas += ['', f"{segundos_a_fecha(inicio)},18"]
+    ruta = tmp_path / 'lecturas.csv'
+    ruta.write_text('\r\n'.join(lineas) + '\r\n')
+    lotes = list(leer_csv(ruta, tam_bloque=64, lote=32))
+    assert max(len(fechas) for _, fechas, _ in lotes) == 32
+
+    # Verificar que importar el CSV deja el mismo estado (y llama a la cadena igual) que pasar las lecturas una a una
+    esperado = sistema_nuevo
+    for linea in lineas[1:]:
+        if linea:
+            campos = linea.split(',')
+            esperado.update((campos[0], float(campos[1])) + tuple(campos[2:]))
+    importado = SistemaIoT(Mock())
+    assert importar(importado, leer_csv(str(ruta), tam_bloque=64, lote=32)) == 201
+    for sensor in ('norte', 'sur', SENSOR_POR_DEFECTO):
+        assert importado.get_date_temp(sensor) == esperado.get_date_temp(sensor)
+        assert importado.get_temp(sensor) == esperado.get_temp(sensor)
+    assert importado.manager_chain.manejar_date_temp.call_count == 201
+
+    # Verificar que el fichero binario de tramas guarda las mismas lecturas
+    binario = tmp_path / 'lecturas.bin'
+    assert guardar_binario(leer_csv(ruta, lote=50), binario) == 201
+    desde_binario = SistemaIoT(Mock())
+    assert importar(desde_binario, leer_binario(binario, tam_bloque=100)) == 201
+    for sensor in ('norte', 'sur', SENSOR_POR_DEFECTO):
+        assert desde_binario.get_date_temp(sensor) == esperado.get_date_temp(sensor)
+
+    # Lineas y ficheros no validos
+    with pytest.raises(ErrorRegistro):
+        list(leer_csv(io.StringIO("2024-05-01 12:00:00,20\n2024-05-01 12:00,21\n")))
+    with pytest.raises(ErrorRegistro):
+        list(leer_binario(io.BytesIO(binario.read_bytes()[:-3])))
+
+# ------------------------------
+# TEST SALIDAS
+# ------------------------------
+def test_salida_nula_no_formatea(monkeypatch):
+    # Usamos la salida nula con una estrategia cuyo texto es un Mock
+    monkeypatch.setattr(pcd_entregable2_jorge_adrian, '_salida', SalidaNula())
+    strategy = StrategyMaxMin()
+    strategy.texto = Mock()
+
+    # Verificar que se devuelve el resultado pero no se construye ningun texto
+    assert strategy.execute('2024-05-01 13:00:00', [10, 20]) == (20, 10)
+    strategy.texto.assert_not_called()
+
+def test_salida_consola_por_defecto(capsys):
+    # Umbral superado con la salida por defecto
+    Umbral().manejar_date_temp('2024-05-01 12:00:00', [30])
+
+    # Verificar que se muestra el aviso por pantalla como antes
+    assert capsys.readouterr().out == 'Temperatura actual:\tPor encima del umbral\n'
+
+def test_salida_buffer_escribe_por_lotes(monkeypatch):
+    # Salida con buffer que escribe en memoria con un intervalo largo
+    destino = io.StringIO()
+    salida = SalidaBuffer(destino, intervalo=60)
+    monkeypatch.setattr(pcd_entregable2_jorge_adrian, '_salida', salida)
+    contexto = ContextoEstadisticos(Umbral())
+    contexto.set_strategy(StrategyMaxMin())
+    contexto.manejar_date_temp('2024-05-01 13:00:00', [10, 30])
+
+    # Verificar que no se escribe nada hasta que se vuelca y que despues aparece todo en orden
+    assert destino.getvalue() == ''
+    salida.cerrar()
+    assert destino.getvalue() == 'Fecha: 2024-05-01 13:00:00\nUltimos 60 segundos:\tMaximo: 30\tMinimo: 10\nTemperatura actual:\tPor encima del umbral\n'
+
+def test_salida_buffer_limita_ritmo():
+    # Salida limitada a 5 mensajes por segundo que recibe 20 de golpe
+    destino = io.StringIO()
+    salida = SalidaBuffer(destino, intervalo=60, maximo_por_segundo=5)
+    for i in range(20):
+        salida.emitir(str, i)
+    salida.cerrar()
+
+    # Verificar que solo se escriben los 5 mas recientes y el aviso de los omitidos
+    assert destino.getvalue() == '15\n16\n17\n18\n19\n[15 mensajes omitidos]\n'
+    assert salida.omitidos == 15
+
+# ------------------------------
+# TEST INSTRUMENTACION
+# ------------------------------
+def test_histograma_latencia():
+    # Histograma con 99 latencias de 100 ns y una de 10000 ns
+    histograma = HistogramaLatencia()
+    for _ in range(99):
+        histograma.registrar(100)
+    histograma.registrar(10000)
+
+    # Verificar el resumen (los percentiles son el limite superior de su cubeta)
+    resumen = histograma.resumen()
+    assert resumen['llamadas'] == 100
+    assert resumen['media_ns'] == 199
+    assert resumen['p50_ns'] == 127
+    assert resumen['p99_ns'] == 127
+    assert resumen['max_ns'] == 10000
+
+def test_instrumentacion_cadena(sistema_nuevo, monkeypatch):
+    # Cadena completa sin mostrar nada y con metricas activadas
+    monkeypatch.setattr(pcd_entregable2_jorge_adrian, '_salida', SalidaNula())
+    contexto = ContextoEstadisticos(Umbral(Aumento()))
+    contexto.set_strategy(StrategyMeanSd())
+    sistema_nuevo.manager_chain = contexto
+    metricas = Metricas()
+    sistema_nuevo.instrumentar(metricas)
+
+    # Lecturas generadas por un sensor (con el instante en que se generan)
+    sensor = Sensor('norte')
+    sensor.register_observer(sistema_nuevo)
+    for _ in range(20):
+        sensor.medir()
+
+    # Verificar que cada manejador tiene sus llamadas y que se mide de extremo a extremo
+    instantanea = metricas.instantanea()
+    assert set(instantanea['manejadores']) == {'ContextoEstadisticos', 'Umbral', 'Aumento'}
+    assert all(resumen['llamadas'] == 20 for resumen in instantanea['manejadores'].values())
+    assert instantanea['extremo_a_extremo']['llamadas'] == 20
+    assert instantanea['extremo_a_extremo']['media_ns'] > sum(resumen['media_ns'] for resumen in instantanea['manejadores'].values())
+
+    # Al volver a activarla con las mismas metricas se sigue sumando en los mismos histogramas
+    sistema_nuevo.instrumentar(metricas)
+    sensor.medir()
+    assert set(metricas.manejadores) == {'ContextoEstadisticos', 'Umbral', 'Aumento'}
+    assert metricas.instantanea()['manejadores']['Umbral']['llamadas'] == 21
+
+    # Al desactivar la instrumentacion se vuelve al metodo de la clase
+    sistema_nuevo.instrumentar(None)
+    assert type(contexto) is ContextoEstadisticos
+    assert 'manejar_date_temp' not in vars(contexto) and 'manejar_date_temp' not in vars(contexto.sucesor)
+    sensor.medir()
+    assert metricas.instantanea()['manejadores']['Umbral']['llamadas'] == 21